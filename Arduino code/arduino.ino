@@ -11,6 +11,38 @@ String inData = "";
 #define LOADCELL_SCK_PIN 6
 HX711 scale;
 
+// Binary frame sent to the desktop app, see "Desktop app/protocol.py"
+#define FRAME_MAGIC 0xA5
+#define FRAME_VERSION 1
+#define FRAME_SIP 1
+#define FRAME_RAW 2
+#define FRAME_BACKLOG 3
+#define FRAME_HEADER_SIZE 10
+uint16_t frameSeq = 0;
+
+// Recent sips, resent on "SYNC <last seq the app has>" so sips taken while the
+// app was closed or out of range are not lost
+#define BACKLOG_SIZE 48
+struct Sip {
+  uint16_t seq;
+  uint32_t time;
+  int16_t ml;
+} backlog[BACKLOG_SIZE];
+uint8_t backlogStart = 0;
+uint8_t backlogCount = 0;
+
+// In raw mode the desktop app detects sips from the weight samples themselves.
+// It switches modes by sending "MODE RAW" or "MODE SIP" lines, and repeats
+// "MODE RAW" while it listens. If it stops for HOST_TIMEOUT the app is gone, so
+// the mat goes back to sip mode and buffers sips for the next SYNC.
+// Tie the HX711 RATE pin high for 80 samples per second.
+#define RAW_BATCH 8
+#define HOST_TIMEOUT 30000UL
+bool streamRaw = false;
+int16_t rawBatch[RAW_BATCH];
+uint8_t rawCount = 0;
+unsigned long lastCommand = 0;
+
 
 struct {
     double high;
@@ -31,6 +63,14 @@ double getWeight();
 bool cupLifted();
 bool noWeight();
 void stableWeight();
+void sendSip(int16_t ml);
+void sendFrame(uint8_t type, const int16_t *readings, uint8_t count);
+void writeFrame(uint8_t type, uint16_t seq, uint32_t time, const int16_t *readings, uint8_t count);
+void replayBacklog(bool all, uint16_t after);
+uint8_t crc8(const uint8_t *data, uint8_t len);
+void readCommands();
+void streamSamples();
+void startSipMode();
 
 void setup()
 {   
@@ -45,6 +85,17 @@ void setup()
 void loop()
 {
     HM10.listen();
+    readCommands();
+
+    if (streamRaw && millis() - lastCommand > HOST_TIMEOUT)
+    {
+        startSipMode();
+    }
+    if (streamRaw)
+    {
+        streamSamples();
+        return;
+    }
 
     if (noWeight() && !lifted)
     {
@@ -61,7 +112,7 @@ void loop()
     }
 
     if (weight.current < weight.high){
-      HM10.print(String(weight.diff()));
+      sendSip(weight.diff());
       Serial.println("Drank:"+String(weight.diff()));
     }
     weight.high = weight.current;
@@ -95,4 +146,125 @@ bool noWeight(){
     }
     while(!stWeight.stable);
     return (stWeight.weight <= 0.01);
-}
\ No newline at end of file
+}
+
+uint8_t crc8(const uint8_t *data, uint8_t len){
+  uint8_t crc = 0;
+  for(uint8_t i = 0; i < len; i++){
+    crc ^= data[i];
+    for(uint8_t bit = 0; bit < 8; bit++){
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendSip(int16_t ml){
+  Sip &sip = backlog[(backlogStart + backlogCount) % BACKLOG_SIZE];
+  if(backlogCount == BACKLOG_SIZE){
+    backlogStart = (backlogStart + 1) % BACKLOG_SIZE; // Overwrite the oldest
+  }
+  else{
+    backlogCount++;
+  }
+  sip.seq = frameSeq;
+  sip.time = millis();
+  sip.ml = ml;
+  writeFrame(FRAME_SIP, sip.seq, sip.time, &sip.ml, 1);
+  frameSeq++;
+}
+
+void sendFrame(uint8_t type, const int16_t *readings, uint8_t count){
+  writeFrame(type, frameSeq, millis(), readings, count);
+  frameSeq++;
+}
+
+void writeFrame(uint8_t type, uint16_t seq, uint32_t time, const int16_t *readings, uint8_t count){
+  uint8_t frame[FRAME_HEADER_SIZE + 2 * RAW_BATCH + 1];
+  uint8_t length = FRAME_HEADER_SIZE + 2 * count;
+  frame[0] = FRAME_MAGIC;
+  frame[1] = FRAME_VERSION;
+  frame[2] = type;
+  frame[3] = count;
+  frame[4] = seq & 0xFF;
+  frame[5] = seq >> 8;
+  frame[6] = time & 0xFF;
+  frame[7] = (time >> 8) & 0xFF;
+  frame[8] = (time >> 16) & 0xFF;
+  frame[9] = (time >> 24) & 0xFF;
+  for(uint8_t i = 0; i < count; i++){
+    frame[FRAME_HEADER_SIZE + 2 * i] = readings[i] & 0xFF;
+    frame[FRAME_HEADER_SIZE + 2 * i + 1] = (readings[i] >> 8) & 0xFF;
+  }
+  frame[length] = crc8(frame, length);
+  HM10.write(frame, length + 1);
+}
+
+void replayBacklog(bool all, uint16_t after){
+  if(backlogCount > 0){
+    // An ack newer than anything buffered is from before a reboot: send everything
+    uint16_t newest = backlog[(backlogStart + backlogCount - 1) % BACKLOG_SIZE].seq;
+    if((uint16_t)(newest - after) >= 32768){
+      all = true;
+    }
+  }
+  for(uint8_t i = 0; i < backlogCount; i++){
+    Sip &sip = backlog[(backlogStart + i) % BACKLOG_SIZE];
+    uint16_t ahead = sip.seq - after;
+    if(all || (ahead > 0 && ahead < 32768)){
+      writeFrame(FRAME_BACKLOG, sip.seq, sip.time, &sip.ml, 1);
+    }
+  }
+  // An empty frame ends the backlog and tells the app the current mat clock
+  writeFrame(FRAME_BACKLOG, frameSeq, millis(), NULL, 0);
+}
+
+void readCommands(){
+  while(HM10.available()){
+    char c = HM10.read();
+    if(c == '\n'){
+      inData.trim();
+      lastCommand = millis();
+      if(inData == "MODE RAW"){
+        // A repeat is only a keepalive and keeps the batch being filled
+        if(!streamRaw){
+          streamRaw = true;
+          rawCount = 0;
+        }
+      }
+      else if(inData == "MODE SIP"){
+        startSipMode();
+      }
+      else if(inData == "SYNC"){
+        replayBacklog(true, 0);
+      }
+      else if(inData.startsWith("SYNC ")){
+        replayBacklog(false, (uint16_t)inData.substring(5).toInt());
+      }
+      inData = "";
+    }
+    else if(inData.length() < 32){
+      inData += c;
+    }
+  }
+}
+
+void startSipMode(){
+  // Start sip detection from scratch, as after power-up
+  streamRaw = false;
+  lifted = false;
+  weight.high = 0;
+  weight.current = 0;
+}
+
+void streamSamples(){
+  // Never waits: a sample is read only once the HX711 has one ready
+  if(!scale.is_ready()){
+    return;
+  }
+  rawBatch[rawCount++] = int16_t(round(scale.get_units(1) * 1000));
+  if(rawCount == RAW_BATCH){
+    sendFrame(FRAME_RAW, rawBatch, RAW_BATCH);
+    rawCount = 0;
+  }
+}
@@ -0,0 +1,192 @@
+import datetime
+import time
+import numpy as np
+
+HOUR = 3600
+DAY_HOURS = 24
+INITIAL_DAYS = 64
+ALL = None  # Series key for the aggregate over every mat; sips without a mat count only here
+
+
+def local_hours(timestamps):
+    # Local-time hour index for each timestamp. UTC offsets are looked up once per
+    # distinct UTC hour, so DST changes are honoured without a per-event Python call.
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if timestamps.size == 0:
+        return np.empty(0, dtype=np.int64)
+    utc_hours = np.floor(timestamps / HOUR).astype(np.int64)
+    unique_hours, inverse = np.unique(utc_hours, return_inverse=True)
+    offsets = np.fromiter(
+        (time.localtime(int(hour) * HOUR).tm_gmtoff for hour in unique_hours),
+        dtype=np.int64, count=unique_hours.size,
+    )
+    return np.floor((timestamps + offsets[inverse]) / HOUR).astype(np.int64)
+
+
+def day_index(day):
+    return (day - datetime.date(1970, 1, 1)).days
+
+
+class IntakeSeries:
+    # Hourly and daily rollups plus sip timestamps for one mat (or all mats).
+    # Arrays start at the first day seen and grow by doubling, like a list.
+
+    def __init__(self, first_day):
+        self.first_day = first_day
+        self.hourly = np.zeros(INITIAL_DAYS * DAY_HOURS, dtype=np.int64)
+        self.daily = np.zeros(INITIAL_DAYS, dtype=np.int64)
+        self.stamps = np.empty(256, dtype=np.float64)
+        self.count = 0
+        self.sorted = True
+
+    def ensure_days(self, first_day, last_day):
+        if first_day < self.first_day:
+            shift = self.first_day - first_day
+            self.hourly = np.concatenate([np.zeros(shift * DAY_HOURS, dtype=np.int64), self.hourly])
+            self.daily = np.concatenate([np.zeros(shift, dtype=np.int64), self.daily])
+            self.first_day = first_day
+        needed = last_day - self.first_day + 1
+        if needed > self.daily.size:
+            size = max(needed, self.daily.size * 2)
+            self.daily = np.concatenate([self.daily, np.zeros(size - self.daily.size, dtype=np.int64)])
+            self.hourly = np.concatenate([self.hourly, np.zeros(size * DAY_HOURS - self.hourly.size, dtype=np.int64)])
+
+    def add(self, timestamps, hours, amounts):
+        days = hours // DAY_HOURS
+        self.ensure_days(int(days.min()), int(days.max()))
+        np.add.at(self.hourly, hours - self.first_day * DAY_HOURS, amounts)
+        np.add.at(self.daily, days - self.first_day, amounts)
+        end = self.count + timestamps.size
+        if end > self.stamps.size:
+            grown = np.empty(max(end, self.stamps.size * 2), dtype=np.float64)
+            grown[:self.count] = self.stamps[:self.count]
+            self.stamps = grown
+        if self.count and timestamps[0] < self.stamps[self.count - 1]:
+            self.sorted = False
+        self.stamps[self.count:end] = timestamps
+        self.count = end
+        if self.sorted and timestamps.size > 1 and np.any(np.diff(timestamps) < 0):
+            self.sorted = False
+
+    def day_range(self, start_day, end_day):
+        # Totals for day indexes start_day..end_day inclusive, zero outside the data
+        result = np.zeros(end_day - start_day + 1, dtype=np.int64)
+        lo = max(start_day, self.first_day)
+        hi = min(end_day, self.first_day + self.daily.size - 1)
+        if lo <= hi:
+            result[lo - start_day:hi - start_day + 1] = self.daily[lo - self.first_day:hi - self.first_day + 1]
+        return result
+
+    def timestamps(self):
+        if not self.sorted:
+            self.stamps[:self.count].sort()
+            self.sorted = True
+        return self.stamps[:self.count]
+
+
+class IntakeAnalytics:
+    # Rollups over the intake journal. History is loaded once; afterwards every new
+    # event updates the hourly and daily arrays in place, so queries never rescan it.
+
+    def __init__(self):
+        self.series = {}  # address -> IntakeSeries, plus the ALL aggregate
+
+    @classmethod
+    def from_journal(cls, journal):
+        analytics = cls()
+        analytics.add_many(journal.events())
+        return analytics
+
+    def add_many(self, events):
+        events = list(events)
+        if not events:
+            return
+        timestamps = np.fromiter((event[0] for event in events), dtype=np.float64, count=len(events))
+        addresses = np.array([event[1] for event in events], dtype=object)
+        amounts = np.fromiter((event[2] for event in events), dtype=np.int64, count=len(events))
+        hours = local_hours(timestamps)
+        self.add_to(ALL, timestamps, hours, amounts)
+        for address in set(addresses.tolist()) - {ALL}:
+            mask = addresses == address
+            self.add_to(address, timestamps[mask], hours[mask], amounts[mask])
+
+    def add(self, ts, address, amount):
+        self.add_many([(ts, address, amount)])
+
+    def add_to(self, key, timestamps, hours, amounts):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = IntakeSeries(int(hours.min()) // DAY_HOURS)
+        series.add(timestamps, hours, amounts)
+
+    def get(self, address=ALL):
+        return self.series.get(address)
+
+    def addresses(self):
+        return sorted(key for key in self.series if key is not ALL)
+
+    def hourly_totals(self, day=None, address=ALL):
+        day = day_index(day or datetime.date.today())
+        series = self.get(address)
+        result = np.zeros(DAY_HOURS, dtype=np.int64)
+        if series is not None and 0 <= day - series.first_day < series.daily.size:
+            start = (day - series.first_day) * DAY_HOURS
+            result[:] = series.hourly[start:start + DAY_HOURS]
+        return result
+
+    def daily_totals(self, start, end=None, address=ALL):
+        end = end or datetime.date.today()
+        series = self.get(address)
+        if series is None:
+            return np.zeros((end - start).days + 1, dtype=np.int64)
+        return series.day_range(day_index(start), day_index(end))
+
+    def weekly_totals(self, start, end=None, address=ALL):
+        # Calendar weeks starting on Monday; the first and last week may be partial
+        end = end or datetime.date.today()
+        monday = start - datetime.timedelta(days=start.weekday())
+        sunday = end + datetime.timedelta(days=6 - end.weekday())
+        daily = self.daily_totals(monday, sunday, address)
+        return daily.reshape(-1, 7).sum(axis=1)
+
+    def streaks(self, goal, address=ALL, today=None):
+        # (current, longest) runs of consecutive days that reached the goal. An
+        # unfinished today does not break the current streak.
+        today = today or datetime.date.today()
+        series = self.get(address)
+        if series is None:
+            return 0, 0
+        met = series.day_range(series.first_day, day_index(today)) >= goal
+        if met.size == 0:
+            return 0, 0
+        padded = np.concatenate([[False], met, [False]])
+        edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+        runs = edges[1::2] - edges[::2]
+        longest = int(runs.max()) if runs.size else 0
+        tail = met if met[-1] else met[:-1]
+        current = 0
+        if tail.size and tail[-1]:
+            misses = np.flatnonzero(~tail)
+            current = int(tail.size - (misses[-1] + 1 if misses.size else 0))
+        return current, longest
+
+    def sip_intervals(self, since=None, address=ALL):
+        series = self.get(address)
+        if series is None:
+            return np.empty(0, dtype=np.float64)
+        stamps = series.timestamps()
+        if since is not None:
+            stamps = stamps[np.searchsorted(stamps, since):]
+        return np.diff(stamps)
+
+    def summary(self, goal, address=ALL, days=7):
+        today = datetime.date.today()
+        intervals = self.sip_intervals(time.time() - days * 86400, address)
+        current, longest = self.streaks(goal, address, today)
+        return {
+            "hourly": self.hourly_totals(today, address).tolist(),
+            "daily": self.daily_totals(today - datetime.timedelta(days=days - 1), today, address).tolist(),
+            "current_streak": current,
+            "longest_streak": longest,
+            "median_interval": float(np.median(intervals)) if intervals.size else None,
+        }
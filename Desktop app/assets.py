@@ -0,0 +1,38 @@
+import os
+from PySide6.QtCore import QUrl
+from PySide6.QtGui import QIcon, QPixmap
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class AssetRegistry:
+    # Resolves and decodes each icon and sound once, then hands out the shared instance.
+
+    def __init__(self, base_dir=ASSET_DIR):
+        self.base_dir = base_dir
+        self.icons = {}
+        self.sounds = {}
+
+    def icon(self, name):
+        icon = self.icons.get(name)
+        if icon is None:
+            # Building from a QPixmap decodes the file now instead of at first paint
+            pixmap = QPixmap(os.path.join(self.base_dir, "icons", name))
+            icon = self.icons[name] = QIcon(pixmap) if not pixmap.isNull() else QIcon()
+        return icon
+
+    def sound(self, name, parent, volume=0.5):
+        if name in self.sounds:
+            return self.sounds[name]
+        path = os.path.join(self.base_dir, name)
+        if not os.path.exists(path):
+            # Not cached, so a file restored later is picked up on the next call
+            return None
+        from PySide6.QtMultimedia import QSoundEffect
+
+        sound = QSoundEffect(parent)
+        sound.setSource(QUrl.fromLocalFile(path))
+        sound.setLoopCount(1)  # Play the sound only once
+        sound.setVolume(volume)  # Set volume (0.0 to 1.0)
+        self.sounds[name] = sound
+        return sound
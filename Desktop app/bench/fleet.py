@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from fleet import FleetClient, FleetServer, FleetStore
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+
+    def at(fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+    return {"count": len(values), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": values[-1] * 1000}
+
+
+class TimedClient(FleetClient):
+    # Records how long each POST took from the client's side
+
+    def __init__(self, *args, latencies, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = latencies
+
+    async def post_events(self, batch_id, events):
+        started = time.perf_counter()
+        added = await super().post_events(batch_id, events)
+        self.latencies.append(time.perf_counter() - started)
+        return added
+
+
+async def drive(client, rate, duration, index):
+    # One workstation: a sip every 1/rate seconds on each of two mats
+    rng = random.Random(index)
+    addresses = [f"5A:11:00:00:{index // 256:02X}:{index % 256:02X}", f"5A:11:00:01:{index // 256:02X}:{index % 256:02X}"]
+    seq = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        await asyncio.sleep(rng.expovariate(rate) if rate else 0)
+        seq += 1
+        client.push([(time.time(), rng.choice(addresses), rng.randint(10, 300), seq & 0xFFFF, seq * 100)])
+    return seq
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = FleetStore(os.path.join(data_dir, "fleet.db"))
+        server = FleetServer(store, "127.0.0.1", 0)
+        await server.start()
+        latencies = []
+        url = f"http://127.0.0.1:{server.port}"
+        clients = [
+            TimedClient(url, f"workstation-{index}", push_interval=args.push_interval, latencies=latencies)
+            for index in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        started = time.perf_counter()
+        pushed = sum(await asyncio.gather(*(drive(client, args.rate, args.duration, index) for index, client in enumerate(clients))))
+        # Whatever is still buffered goes out with the next push interval
+        while any(client.stats()["buffered"] or client.in_flight for client in clients) and time.perf_counter() - started < args.duration + 30:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        totals = await clients[0].totals()
+        for client in clients:
+            client.close()
+        await server.close()
+        store = FleetStore(os.path.join(data_dir, "fleet.db"))
+        stored = store.count()
+        store.close()
+    return {
+        "clients": args.clients,
+        "pushed": pushed,
+        "stored": stored,
+        "reported": sum(mat["sips"] for mats in totals["clients"].values() for mat in mats.values()),
+        "events_per_second": stored / elapsed,
+        "post_ms": percentiles(latencies),
+        "server": server.stats(),
+        "connections_opened": sum(client.connections_opened for client in clients),
+        "failures": sum(client.failures for client in clients),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Push intake from many simulated instances to a local fleet server.")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=20.0, help="Sips per second per client; 0 pushes as fast as possible")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--push-interval", type=float, default=0.5)
+    parser.add_argument("--min-throughput", type=float, help="Exit non-zero if fewer events per second are stored")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=4))
+    else:
+        print(f"{result['clients']} clients: {result['stored']} of {result['pushed']} events stored, {result['events_per_second']:.0f} events/s")
+        post = result["post_ms"]
+        if post:
+            print(f"  POST: p50 {post['p50']:.2f}  p90 {post['p90']:.2f}  p99 {post['p99']:.2f}  max {post['max']:.2f}  ({post['count']} batches)")
+        server = result["server"]
+        print(f"  server: {server['requests']} requests in {server['commits']} commits over {result['connections_opened']} connections, {result['failures']} failures")
+    failed = not result["stored"] == result["reported"] == result["pushed"]
+    if failed:
+        print("Events were lost or duplicated.")
+    if args.min_throughput is not None and result["events_per_second"] < args.min_throughput:
+        print(f"Throughput regression: limit is {args.min_throughput} events/s.")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import simulator
+
+simulator.install()
+
+from PySide6.QtWidgets import QApplication, QProgressBar
+from qasync import QEventLoop
+from mat_service import MatService
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+
+    def at(fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+    return {"count": len(values), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": values[-1] * 1000}
+
+
+class RepaintProbe(QProgressBar):
+    # Stands in for the intake widgets: it repaints on every published intake event
+    # and stamps each sip shown with the time it actually reached the screen.
+
+    def __init__(self, recorder):
+        super().__init__()
+        self.recorder = recorder
+        self.setRange(0, 1 << 30)
+        self.resize(300, 30)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        self.recorder.painted(time.perf_counter())
+
+
+class Recorder:
+    # Matches each persisted sip to the moment its simulated mat sent it. Sips from
+    # one mat are persisted in the order they were sent, so a FIFO per mat is enough.
+
+    def __init__(self, service):
+        self.service = service
+        self.persist_latencies = []
+        self.paint_latencies = []
+        self.unpublished = []
+        self.unpainted = []
+        self.persisted = 0
+        self.persist = service.ingest.persist
+        service.ingest.persist = self.persisted_batch
+        self.probe = RepaintProbe(self)
+        self.probe.show()
+        service.subscribe(self.handle_event)
+
+    def persisted_batch(self, events):
+        self.persist(events)
+        now = time.perf_counter()
+        for event in events:
+            mat = simulator.find_mat(event[1])
+            if mat is None or not mat.sent:
+                continue
+            sent = mat.sent.popleft()
+            self.persist_latencies.append(now - sent)
+            self.unpublished.append(sent)
+        self.persisted += len(events)
+
+    def handle_event(self, event):
+        if event["type"] == "intake":
+            self.unpainted.extend(self.unpublished)
+            self.unpublished.clear()
+            self.probe.setValue(event["total"] % self.probe.maximum())
+
+    def painted(self, now):
+        self.paint_latencies.extend(now - sent for sent in self.unpainted)
+        self.unpainted.clear()
+
+    def reset(self):
+        self.persist_latencies.clear()
+        self.paint_latencies.clear()
+        self.persisted = 0
+
+
+async def scenario(data_dir, name, mats, profile, duration, warmup=0.5):
+    data_dir = os.path.join(data_dir, name)
+    os.mkdir(data_dir)
+    simulator.MATS.clear()
+    addresses = [simulator.add_mat(simulator.mat_address(index), profile=profile(index)).address for index in range(mats)]
+    service = MatService(data_dir)
+    # Raw mats need the host's keepalive, or they fall back to sip mode
+    service.settings.update(address=addresses[0], devices=addresses, stream_raw=simulator.MATS[addresses[0]].raw)
+    recorder = Recorder(service)
+    try:
+        await service.connect_saved()
+        await asyncio.sleep(warmup)
+        recorder.reset()
+        started = time.perf_counter()
+        await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - started
+        result = {
+            "mats": mats,
+            "sips_per_second": recorder.persisted / elapsed,
+            "samples": sum(mat.samples for mat in simulator.MATS.values()),
+            "persist_ms": percentiles(recorder.persist_latencies),
+            "repaint_ms": percentiles(recorder.paint_latencies),
+            "link": {address: session.parser.stats() for address, session in service.manager.sessions.items()},
+            "simulated": {mat.address: mat.stats() for mat in simulator.MATS.values()},
+            "reconnect": service.reconnector.metrics(),
+        }
+    finally:
+        await service.shutdown()
+        recorder.probe.close()
+    return result
+
+
+async def run(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        results["latency"] = await scenario(
+            data_dir, "latency", args.mats,
+            lambda index: simulator.MatProfile(
+                rate=args.rate, burst=args.burst, malformed=args.malformed, split=args.split,
+                disconnect_after=args.disconnect_after, raw=args.raw, seed=index,
+            ),
+            args.duration,
+        )
+        # Every mat sends as fast as the loop lets it, so persisted sips per second is
+        # the most the pipeline sustains
+        results["throughput"] = await scenario(
+            data_dir, "throughput", args.mats,
+            lambda index: simulator.MatProfile(rate=0, burst=args.burst, seed=index),
+            args.duration,
+        )
+    return results
+
+
+def report(results):
+    for name, result in results.items():
+        print(f"{name} ({result['mats']} mats): {result['sips_per_second']:.0f} sips/s")
+        if result["samples"]:
+            print(f"  {result['samples']} raw samples run through sip detection")
+        for key in ("persist_ms", "repaint_ms"):
+            stats = result[key]
+            if stats:
+                print(
+                    f"  {key:>10}: p50 {stats['p50']:.2f}  p90 {stats['p90']:.2f}  "
+                    f"p99 {stats['p99']:.2f}  max {stats['max']:.2f}  ({stats['count']} sips)"
+                )
+        errors = sum(link["errors"] for link in result["link"].values())
+        gaps = sum(link["gaps"] for link in result["link"].values())
+        print(f"  link: {errors} errors, {gaps} gaps, {result['reconnect']['reconnects']} reconnects")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the ingest path with simulated mats and measure latency and throughput.")
+    parser.add_argument("--mats", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=20.0, help="Sip frames per second per mat in the latency run")
+    parser.add_argument("--burst", type=int, default=1, help="Frames packed into one notification")
+    parser.add_argument("--malformed", type=float, default=0.01, help="Share of frames corrupted in the latency run")
+    parser.add_argument("--split", type=float, default=0.1, help="Share of notifications split in two")
+    parser.add_argument("--raw", action="store_true", help="Stream raw load-cell samples in the latency run; --rate is then sips per second")
+    parser.add_argument("--disconnect-after", type=float, help="Drop each link this many seconds after it starts")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds measured per run")
+    parser.add_argument("--max-persist-p99-ms", type=float, help="Exit non-zero if the p99 persist latency is slower")
+    parser.add_argument("--min-throughput", type=float, help="Exit non-zero if fewer sips per second are sustained")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    app = QApplication([])
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    with loop:
+        results = loop.run_until_complete(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        report(results)
+
+    failed = False
+    persist = results["latency"]["persist_ms"]
+    if args.max_persist_p99_ms is not None and (persist is None or persist["p99"] > args.max_persist_p99_ms):
+        print(f"Persist latency regression: limit is {args.max_persist_p99_ms} ms.")
+        failed = True
+    if args.min_throughput is not None and results["throughput"]["sips_per_second"] < args.min_throughput:
+        print(f"Throughput regression: limit is {args.min_throughput} sips/s.")
+        failed = True
+    sys.exit(1 if failed else 0)
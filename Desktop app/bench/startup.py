@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child():
+    # Runs in a fresh interpreter so every sample pays the full cold import cost
+    started = time.perf_counter()
+    sys.path.insert(0, APP_DIR)
+    import main
+    imported = time.perf_counter()
+
+    from PySide6.QtWidgets import QApplication
+    from PySide6.QtCore import QTimer
+
+    app = QApplication([])
+    main.apply_style(app)
+    window = main.MainWindow()
+    result = {}
+
+    def painted():
+        if not result:
+            result["first_paint_ms"] = (time.perf_counter() - started) * 1000
+            app.quit()
+
+    window.first_frame.connect(painted)
+    window.showNormal()
+    QTimer.singleShot(10000, app.quit)
+    app.exec()
+    result["import_ms"] = (imported - started) * 1000
+    result["bleak_imported"] = "bleak" in sys.modules
+    result["multimedia_imported"] = "PySide6.QtMultimedia" in sys.modules
+    print(json.dumps(result))
+
+
+def run(runs):
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    samples = []
+    for _ in range(runs):
+        spawned = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample["process_ms"] = (time.perf_counter() - spawned) * 1000
+        samples.append(sample)
+    return samples
+
+
+def summarize(samples, key):
+    values = sorted(sample[key] for sample in samples if key in sample)
+    if not values:
+        return None
+    return {
+        "median": statistics.median(values),
+        "min": values[0],
+        "p90": values[min(len(values) - 1, int(len(values) * 0.9))],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold import time and time to first paint of the desktop app.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-first-paint-ms", type=float, help="Exit non-zero if the median first paint is slower")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        sys.exit(0)
+
+    samples = run(args.runs)
+    summary = {key: summarize(samples, key) for key in ("import_ms", "first_paint_ms", "process_ms")}
+    summary["eager_imports"] = sorted(
+        name for name in ("bleak", "multimedia") if any(sample[f"{name}_imported"] for sample in samples)
+    )
+    if args.json:
+        print(json.dumps(summary, indent=4))
+    else:
+        for key in ("import_ms", "first_paint_ms", "process_ms"):
+            stats = summary[key]
+            if stats:
+                print(f"{key:>15}: median {stats['median']:.1f}  min {stats['min']:.1f}  p90 {stats['p90']:.1f}")
+        print(f"  eager imports: {', '.join(summary['eager_imports']) or 'none'}")
+
+    limit = args.max_first_paint_ms
+    if limit is not None and (summary["first_paint_ms"] is None or summary["first_paint_ms"]["median"] > limit):
+        print(f"First paint regression: limit is {limit} ms.")
+        sys.exit(1)
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import itertools
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+# Opt-in capture of every notification that reaches the ingest pipeline, for
+# reproducing a wrong total later. Records are fixed size and written straight
+# into a memory-mapped ring file, so the file never grows past its capacity and
+# recording costs one struct.pack_into per notification.
+
+ENV_VAR = "SMART_MAT_CAPTURE"  # Capture file; nothing is recorded when unset
+MAGIC = b"SMCAP\x00\x00\x01"
+FILE_HEADER = struct.Struct("<8sII")  # magic, record size, capacity
+DEVICE_SLOTS = 64
+DEVICE_SIZE = 48  # Bytes per address in the device table; macOS addresses are UUIDs
+RECORD_HEADER = struct.Struct("<IdBxH")  # sequence (0 = never written), wall clock, device slot, payload length
+PAYLOAD_MAX = 244  # Largest notification at the maximum ATT MTU of 247
+RECORD_SIZE = RECORD_HEADER.size + PAYLOAD_MAX
+DATA_OFFSET = 4096  # File header and device table
+CAPACITY = 65536  # Records; about 17 MB
+
+
+class CaptureRecorder:
+    # Appends (timestamp, device, payload) records to a ring of `capacity` slots.
+    # Record numbers only ever grow, so the oldest slot is overwritten first and a
+    # reader restores the order by sorting on them. Like IngestPipeline.push,
+    # record() may be called from the BLE stack's threads.
+    enabled = True
+
+    def __init__(self, path, capacity=CAPACITY):
+        self.path = path
+        self.lock = threading.Lock()  # Only taken when a new device gets a slot
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            # Anything but an earlier capture is left alone, and that keeps its size
+            with open(path, "rb") as file:
+                header = file.read(FILE_HEADER.size)
+            if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header)[:2] != (MAGIC, RECORD_SIZE):
+                raise ValueError(f"{path} exists and is not a capture file.")
+            capacity = FILE_HEADER.unpack(header)[2]
+        size = DATA_OFFSET + capacity * RECORD_SIZE
+        self.file = open(path, "r+b" if exists else "w+b")
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.capacity = capacity
+        if exists:
+            # Continue an earlier capture after its newest record
+            self.devices = {address: slot for slot, address in enumerate(read_devices(self.map))}
+            last = max(read_sequences(self.map, capacity), default=0)
+        else:
+            FILE_HEADER.pack_into(self.map, 0, MAGIC, RECORD_SIZE, capacity)
+            self.devices = {}
+            last = 0
+        self.sequence = itertools.count(last + 1)
+        self.unrecorded = 0  # Notifications from mats that found the device table full
+
+    @classmethod
+    def from_environment(cls):
+        path = os.environ.get(ENV_VAR)
+        return cls(path) if path else DISABLED
+
+    def device_slot(self, address):
+        # None once DEVICE_SLOTS mats have a slot: reusing one would relabel the
+        # records that already point at it
+        slot = self.devices.get(address)
+        if slot is None:
+            with self.lock:
+                slot = self.devices.get(address)
+                if slot is None:
+                    if len(self.devices) >= DEVICE_SLOTS:
+                        return None
+                    slot = len(self.devices)
+                    encoded = address.encode()[:DEVICE_SIZE]
+                    offset = FILE_HEADER.size + slot * DEVICE_SIZE
+                    self.map[offset:offset + DEVICE_SIZE] = encoded.ljust(DEVICE_SIZE, b"\x00")
+                    self.devices[address] = slot
+        return slot
+
+    def record(self, address, data, ts=None):
+        device = self.device_slot(address)
+        if device is None:
+            self.unrecorded += 1
+            return
+        # next() on a count is atomic under the GIL, so concurrent callers never share a slot
+        sequence = next(self.sequence)
+        offset = DATA_OFFSET + (sequence - 1) % self.capacity * RECORD_SIZE
+        data = data[:PAYLOAD_MAX]
+        RECORD_HEADER.pack_into(self.map, offset, sequence, time.time() if ts is None else ts, device, len(data))
+        start = offset + RECORD_HEADER.size
+        self.map[start:start + len(data)] = data
+
+    def recording(self, on_packet):
+        record = self.record
+
+        def recorded(address, data):
+            # The pipeline gets the same stamp, so a replay sees exactly what it saw
+            ts = time.time()
+            record(address, data, ts)
+            on_packet(address, data, ts)
+
+        return recorded
+
+    def close(self):
+        # The kernel writes dirty pages back without this; flush makes it durable now
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+class DisabledCapture:
+    enabled = False
+
+    def recording(self, on_packet):
+        return on_packet
+
+    def close(self):
+        pass
+
+
+DISABLED = DisabledCapture()
+
+
+def read_devices(buffer):
+    devices = []
+    for slot in range(DEVICE_SLOTS):
+        offset = FILE_HEADER.size + slot * DEVICE_SIZE
+        address = bytes(buffer[offset:offset + DEVICE_SIZE]).rstrip(b"\x00")
+        if not address:
+            break
+        devices.append(address.decode())
+    return devices
+
+
+def read_sequences(buffer, capacity):
+    return [
+        sequence
+        for sequence in (struct.unpack_from("<I", buffer, DATA_OFFSET + slot * RECORD_SIZE)[0] for slot in range(capacity))
+        if sequence
+    ]
+
+
+def read_capture(path):
+    # Every record still in the ring, oldest first: [(ts, address, payload)]
+    with open(path, "rb") as file:
+        buffer = file.read()
+    magic, record_size, capacity = FILE_HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or record_size != RECORD_SIZE:
+        raise ValueError(f"{path} is not a capture file.")
+    devices = read_devices(buffer)
+    records = []
+    for slot in range(capacity):
+        offset = DATA_OFFSET + slot * RECORD_SIZE
+        sequence, ts, device, length = RECORD_HEADER.unpack_from(buffer, offset)
+        if sequence:
+            start = offset + RECORD_HEADER.size
+            records.append((sequence, ts, devices[device], buffer[start:start + length]))
+    records.sort()
+    return [record[1:] for record in records]
+
+
+async def replay(records, data_dir, speed=None):
+    # Feeds records through a fresh MatService with their original timestamps, so a
+    # replay computes the same sips as the session that was captured. speed paces
+    # them: 1 is real time, N is N times faster, None is as fast as possible.
+    from mat_service import MatService
+    from instrumentation import DISABLED as NO_METRICS
+
+    # A replay records nothing and pushes nothing, whatever the environment says
+    service = MatService(data_dir, metrics=NO_METRICS, fleet=False, capture=DISABLED)
+    for address in {record[1] for record in records}:
+        service.manager.session(address)
+    push = service.ingest.push
+    started = time.perf_counter()
+    try:
+        if speed is None:
+            for index, (ts, address, data) in enumerate(records):
+                push(address, data, ts)
+                if index % 1000 == 999:
+                    # Let the pipeline drain in batches as it would live
+                    await asyncio.sleep(0)
+        elif records:
+            first = records[0][0]
+            for ts, address, data in records:
+                delay = (ts - first) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                push(address, data, ts)
+        await asyncio.sleep(0)
+        service.ingest.flush()
+        await service.wait_persisted()
+        elapsed = time.perf_counter() - started
+        result = {
+            "notifications": len(records),
+            "seconds": elapsed,
+            "notifications_per_second": len(records) / elapsed if elapsed else None,
+            "total": service.current_water_intake,
+            "devices": service.manager.state(),
+        }
+    finally:
+        await service.shutdown()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a notification capture through the ingest pipeline.")
+    parser.add_argument("capture", help=f"Capture file written with {ENV_VAR} set")
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--speed", type=float, default=None, help="Replay N times faster than recorded; 1 is real time")
+    pacing.add_argument("--realtime", dest="speed", action="store_const", const=1.0, help="Replay at the recorded pace")
+    parser.add_argument("--data-dir", help="Keep the replayed journal here instead of a temporary directory")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    records = read_capture(args.capture)
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        result = asyncio.run(replay(records, args.data_dir, args.speed))
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            result = asyncio.run(replay(records, data_dir, args.speed))
+    if args.json:
+        print(json.dumps(result, indent=4))
+    else:
+        rate = result["notifications_per_second"]
+        print(f"{result['notifications']} notifications in {result['seconds']:.2f} s" + (f" ({rate:.0f}/s)" if rate else ""))
+        print(f"Total: {result['total']} mL")
+        for address, device in sorted(result["devices"].items()):
+            link = device["link"]
+            print(f"  {address}: {device['total']} mL, {link['frames']} frames, {link['gaps']} gaps, {link['errors']} errors")
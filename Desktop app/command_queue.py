@@ -0,0 +1,150 @@
+import asyncio
+import collections
+
+PAYLOAD_SIZE = 20  # Bytes per write at the HM-10's default ATT MTU of 23
+MAX_PENDING = 32  # Commands kept while the mat is unreachable; the oldest go first
+MAX_ATTEMPTS = 3  # Writes that fail with the link still up are retried this often
+RETRY_DELAY = 0.2
+
+
+class Command:
+    __slots__ = ("kind", "data", "response", "futures")
+
+    def __init__(self, kind, data, response, future):
+        self.kind = kind
+        self.data = data
+        self.response = response
+        self.futures = [future]
+
+
+class CommandQueue:
+    # Outbound commands for one mat. Commands are newline-terminated lines, so
+    # consecutive ones are packed into a single write up to the payload size. A
+    # command with a kind replaces a pending one of the same kind instead of queueing
+    # behind it. While the link is down commands wait, up to max_pending of them.
+    # Every submit() returns a future that resolves once its bytes are written.
+
+    def __init__(self, write, max_pending=MAX_PENDING):
+        self.write = write  # async write(data, response)
+        self.max_pending = max_pending
+        self.payload_size = PAYLOAD_SIZE
+        self.pending = collections.deque()
+        self.kinds = {}  # kind -> Command not yet taken for writing
+        self.connected = False
+        self.task = None
+        self.partial_line = False  # A write broke off mid-line; the mat must drop it
+        self.writes = 0
+        self.sent = 0
+        self.superseded = 0
+        self.dropped = 0
+
+    def submit(self, data, kind=None, response=False):
+        future = asyncio.get_event_loop().create_future()
+        command = self.kinds.get(kind) if kind is not None else None
+        if command is not None:
+            # Only the newest state matters; both callers learn when it is written
+            command.data = data
+            command.response = command.response or response
+            command.futures.append(future)
+            self.superseded += 1
+            return future
+        if len(self.pending) >= self.max_pending:
+            self.fail(self.pop(), ConnectionError("Command dropped: too many commands queued while disconnected."))
+            self.dropped += 1
+        command = Command(kind, data, response, future)
+        self.pending.append(command)
+        if kind is not None:
+            self.kinds[kind] = command
+        self.wake()
+        return future
+
+    def pop(self):
+        command = self.pending.popleft()
+        if command.kind is not None and self.kinds.get(command.kind) is command:
+            del self.kinds[command.kind]
+        return command
+
+    def resume(self, payload_size=PAYLOAD_SIZE):
+        self.connected = True
+        self.payload_size = max(1, payload_size)
+        self.wake()
+
+    def pause(self):
+        self.connected = False
+
+    def wake(self):
+        if self.connected and self.pending and (self.task is None or self.task.done()):
+            self.task = asyncio.ensure_future(self.run())
+
+    def take_batch(self):
+        batch = [self.pop()]
+        size = len(batch[0].data)
+        while self.pending and size + len(self.pending[0].data) <= self.payload_size:
+            size += len(self.pending[0].data)
+            batch.append(self.pop())
+        return batch
+
+    async def run(self):
+        while self.connected and self.pending:
+            batch = self.take_batch()
+            data = b"".join(command.data for command in batch)
+            if self.partial_line:
+                data = b"\n" + data
+            response = any(command.response for command in batch)
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    await self.write_payload(data, response)
+                except ConnectionError:
+                    # The link went down; the batch waits at the front for resume()
+                    self.pending.extendleft(reversed(batch))
+                    for command in batch:
+                        if command.kind is not None:
+                            self.kinds.setdefault(command.kind, command)
+                    self.connected = False
+                    return
+                except Exception as e:
+                    if attempt < MAX_ATTEMPTS and self.connected:
+                        await asyncio.sleep(RETRY_DELAY * attempt)
+                        continue
+                    for command in batch:
+                        self.fail(command, e)
+                    break
+                self.sent += len(batch)
+                for command in batch:
+                    for future in command.futures:
+                        if not future.done():
+                            future.set_result(True)
+                break
+
+    async def write_payload(self, data, response):
+        # Anything longer than one payload goes out in order, acknowledged on the last part
+        for start in range(0, len(data), self.payload_size):
+            end = start + self.payload_size
+            self.writes += 1
+            try:
+                await self.write(data[start:end], response and end >= len(data))
+            except Exception:
+                self.partial_line = self.partial_line or start > 0
+                raise
+        self.partial_line = False
+
+    def fail(self, command, error):
+        for future in command.futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def cancel(self):
+        self.connected = False
+        if self.task is not None:
+            self.task.cancel()
+        while self.pending:
+            self.fail(self.pop(), ConnectionError("Command cancelled."))
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "sent": self.sent,
+            "writes": self.writes,
+            "superseded": self.superseded,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,143 @@
+import asyncio
+import functools
+from protocol import FrameParser
+from command_queue import CommandQueue
+
+CHARACTERISTIC_UUID = "0000ffe1-0000-1000-8000-00805f9b34fb"
+
+
+class DeviceSession:
+    # State for one mat: its BLE client plus the intake state that belongs to that
+    # mat alone; the window keeps a hydration reminder per address next to it.
+    # Sessions hold no threads or tasks of their own.
+    __slots__ = (
+        "address", "client", "total", "contribution", "sips", "last_sip_time", "on_packet", "parser", "detector",
+        "commands",
+    )
+
+    def __init__(self, address, on_packet, total=0, write=None):
+        self.address = address
+        self.client = None
+        self.total = total
+        self.contribution = 0
+        self.sips = 0
+        self.last_sip_time = None
+        self.on_packet = on_packet
+        self.parser = FrameParser()
+        self.detector = None  # SipDetector, created when the mat first streams raw samples
+        self.commands = CommandQueue(write)
+
+    @property
+    def is_connected(self):
+        return bool(self.client and self.client.is_connected)
+
+    def handle_notification(self, sender, data):
+        self.on_packet(self.address, data)
+
+    def record(self, ts, contribution):
+        self.contribution = contribution
+        self.total += contribution
+        self.sips += 1
+        self.last_sip_time = ts
+
+    def state(self):
+        return {
+            "connected": self.is_connected,
+            "total": self.total,
+            "contribution": self.contribution,
+            "last_sip_time": self.last_sip_time,
+            "link": self.parser.stats(),
+            "commands": self.commands.stats(),
+        }
+
+
+class ConnectionManager:
+    # Holds any number of concurrent BleakClient sessions on the running event loop,
+    # indexed by address.
+
+    def __init__(self, on_packet, on_disconnect=None):
+        self.on_packet = on_packet
+        self.on_disconnect = on_disconnect
+        self.sessions = {}
+
+    def session(self, address, total=0):
+        session = self.sessions.get(address)
+        if session is None:
+            write = functools.partial(self.write, address)
+            session = self.sessions[address] = DeviceSession(address, self.on_packet, total, write)
+        return session
+
+    def get(self, address):
+        return self.sessions.get(address)
+
+    def connected(self):
+        return [session for session in self.sessions.values() if session.is_connected]
+
+    @property
+    def total(self):
+        return sum(session.total for session in self.sessions.values())
+
+    def state(self):
+        return {address: session.state() for address, session in self.sessions.items()}
+
+    async def connect(self, address, device=None):
+        session = self.session(address)
+        if session.is_connected:
+            return session
+        from bleak import BleakClient
+
+        # A BLEDevice from a scan lets bleak skip its own discovery before connecting
+        client = BleakClient(device or address, disconnected_callback=self.handle_disconnect)
+        session.client = client
+        try:
+            await client.connect()
+        except Exception:
+            session.client = None
+            raise
+        return session
+
+    async def start_notify(self, session):
+        await session.client.start_notify(CHARACTERISTIC_UUID, session.handle_notification)
+        # Queued commands go out once replies to them can be received
+        session.commands.resume(getattr(session.client, "mtu_size", 23) - 3)
+
+    def handle_disconnect(self, client):
+        session = self.sessions.get(client.address)
+        unexpected = session is not None and session.client is client
+        if unexpected:
+            session.client = None
+            session.commands.pause()
+        if self.on_disconnect:
+            self.on_disconnect(client.address, unexpected)
+
+    async def disconnect(self, address=None):
+        sessions = [self.sessions[address]] if address in self.sessions else []
+        if address is None:
+            sessions = list(self.sessions.values())
+        clients = []
+        for session in sessions:
+            if session.is_connected:
+                clients.append(session.client)
+            session.client = None
+            session.commands.pause()
+        results = await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+        return [client.address for client, result in zip(clients, results) if not isinstance(result, Exception)]
+
+    def send(self, address, data, kind=None, response=False):
+        # Queued write; see CommandQueue. Returns a future for the write's completion.
+        return self.session(address).commands.submit(data, kind, response)
+
+    async def write(self, address, data, response=True):
+        session = self.sessions.get(address)
+        if session is None or not session.is_connected:
+            raise ConnectionError(f"{address} is not connected.")
+        try:
+            await session.client.write_gatt_char(CHARACTERISTIC_UUID, data, response=response)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            if not session.is_connected:
+                # bleak raises its own errors when the link drops mid-write; the queue
+                # keeps the command for the reconnect only on a ConnectionError
+                raise ConnectionError(f"{address} disconnected during the write: {str(e)}") from e
+            raise
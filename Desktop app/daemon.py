@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+from mat_service import MatService
+from ipc import IpcServer, socket_path
+from instrumentation import ENV_VAR
+from fleet import ENV_VAR as FLEET_ENV_VAR
+from capture import ENV_VAR as CAPTURE_ENV_VAR
+
+
+def log_event(event):
+    if event["type"] == "status":
+        print(event["text"])
+    elif event["type"] == "intake" and event["status"]:
+        print(f"{event['status']} Total: {event['total']} mL")
+
+
+async def run(addresses=(), data_dir=None, stream_raw=None):
+    service = MatService(data_dir or os.path.dirname(os.path.abspath(__file__)))
+    if stream_raw is not None:
+        service.update_settings(stream_raw=stream_raw)
+    service.subscribe(log_event)
+    server = IpcServer(service)
+    try:
+        await server.start()
+    except (RuntimeError, OSError) as e:
+        print(f"Failed to start the service: {str(e)}")
+        await service.shutdown()
+        return 1
+    print(f"Smart mat service listening on {socket_path()}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError):
+            pass
+
+    if addresses:
+        await asyncio.gather(*(service.connect(address) for address in addresses))
+    else:
+        await service.connect_saved()
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+        await service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Smart mat BLE ingest service without the GUI.")
+    parser.add_argument("--address", help="Mat to connect to instead of the saved device")
+    parser.add_argument("--simulate", type=int, metavar="MATS", help="Serve simulated mats instead of real ones")
+    parser.add_argument("--rate", type=float, default=0.2, help="Sips per second per simulated mat")
+    parser.add_argument("--raw", dest="stream_raw", action="store_const", const=True, help="Have mats stream raw weight samples and detect sips here")
+    parser.add_argument("--sips", dest="stream_raw", action="store_const", const=False, help="Have mats detect sips themselves (the default)")
+    parser.add_argument("--metrics", metavar="DIR", help=f"Export timings and counters to DIR (same as setting {ENV_VAR})")
+    parser.add_argument("--fleet", metavar="URL", help=f"Push intake to a fleet aggregation server (same as setting {FLEET_ENV_VAR})")
+    parser.add_argument("--capture", metavar="FILE", help=f"Record every notification to FILE for replay with capture.py (same as setting {CAPTURE_ENV_VAR})")
+    args = parser.parse_args()
+    if args.metrics:
+        os.environ[ENV_VAR] = args.metrics
+    if args.fleet:
+        os.environ[FLEET_ENV_VAR] = args.fleet
+    if args.capture:
+        os.environ[CAPTURE_ENV_VAR] = args.capture
+    addresses = [args.address] if args.address else []
+    data_dir = None
+    if args.simulate:
+        import simulator
+
+        simulator.install()
+        for index in range(args.simulate):
+            mat = simulator.add_mat(simulator.mat_address(index), name=f"Simulated mat {index + 1}", profile=simulator.MatProfile(rate=args.rate))
+            addresses.append(mat.address)
+        # Simulated sips never touch the real intake journal
+        data_dir = tempfile.mkdtemp(prefix="smart-mat-")
+    try:
+        sys.exit(asyncio.run(run(addresses, data_dir, args.stream_raw)))
+    except KeyboardInterrupt:
+        pass
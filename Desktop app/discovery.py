@@ -0,0 +1,51 @@
+import asyncio
+from reconnect import SERVICE_UUID
+
+SCAN_TIMEOUT = 5.0
+RSSI_STEP = 3  # dB change worth reporting for a device already listed
+
+
+class StreamingDiscovery:
+    # Reports mats as their advertisements arrive instead of after the whole scan
+    # window. Devices are deduplicated by address and ranked by signal strength.
+
+    def __init__(self, on_device, known_addresses=(), timeout=SCAN_TIMEOUT):
+        self.on_device = on_device
+        self.known_addresses = {address.upper() for address in known_addresses}
+        self.timeout = timeout
+        self.devices = {}
+        self.stopped = asyncio.Event()
+
+    def is_mat(self, device, advertisement):
+        uuids = [uuid.lower() for uuid in advertisement.service_uuids]
+        return SERVICE_UUID in uuids or device.address.upper() in self.known_addresses
+
+    def detected(self, device, advertisement):
+        if not self.is_mat(device, advertisement):
+            return
+        name = device.name or advertisement.local_name
+        rssi = advertisement.rssi
+        previous = self.devices.get(device.address)
+        self.devices[device.address] = (name, rssi)
+        if previous is None or previous[0] != name or abs(previous[1] - rssi) >= RSSI_STEP:
+            self.on_device(name, device.address, rssi)
+
+    def ranked(self):
+        ordered = sorted(self.devices.items(), key=lambda item: item[1][1], reverse=True)
+        return [(name, address, rssi) for address, (name, rssi) in ordered]
+
+    async def run(self):
+        from bleak import BleakScanner
+
+        scanner = BleakScanner(detection_callback=self.detected)
+        await scanner.start()
+        try:
+            await asyncio.wait_for(self.stopped.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await scanner.stop()
+        return self.ranked()
+
+    def cancel(self):
+        self.stopped.set()
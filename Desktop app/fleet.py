@@ -0,0 +1,539 @@
+import argparse
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from journal import day_bounds
+
+# Aggregates intake from every desktop instance on a floor. Clients push batches of
+# journaled sips over pooled keep-alive HTTP/1.1 connections; the server groups the
+# batches of all clients that arrive together into one SQLite transaction.
+
+FLEET_PORT = 47812
+ENV_VAR = "SMART_MAT_FLEET"  # Server URL; instances only push when it is set
+BATCH_SIZE = 500  # Events per POST
+PUSH_INTERVAL = 2.0  # Seconds a client waits to fill a batch
+POOL_SIZE = 2  # Persistent connections per client, so one slow reply does not stall the next batch
+MAX_BUFFERED = 50000  # Events kept while the server is unreachable; the oldest go first
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+REQUEST_TIMEOUT = 10.0
+COMMIT_WINDOW = 0.02  # Seconds the server waits for more batches to share a commit
+MAX_COMMIT_EVENTS = 20000
+MAX_BODY = 8 * 1024 * 1024
+IDLE_TIMEOUT = 120.0  # Server side; clients reconnect transparently
+BACKLOG = 1024  # Pending connections; a whole floor starting at once must not hit SYN retries
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+async def read_message(reader, max_body=MAX_BODY):
+    # One HTTP/1.1 request or response: (start line parts, headers, body), None at EOF
+    start = await reader.readline()
+    if not start:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = headers.get("content-length", "0")
+    if not (length.isascii() and length.isdigit()):
+        raise ValueError(f"Malformed Content-Length: {length!r}")
+    length = int(length)
+    if length > max_body:
+        raise BodyTooLarge("Body too large.")
+    body = await reader.readexactly(length) if length else b""
+    return start.decode("latin-1").split(" ", 2), headers, body
+
+
+def encode_message(start, body, close=False):
+    head = [start, "Content-Type: application/json", f"Content-Length: {len(body)}"]
+    if close:
+        head.append("Connection: close")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+def encode_json(value):
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_event(event):
+    # [ts, address, amount] or [ts, address, amount, seq, mat_time] as stored, checked
+    # here so one malformed client cannot fail the commit it shares with the others
+    if not isinstance(event, list) or len(event) not in (3, 5):
+        raise ValueError(f"Event must have 3 or 5 fields: {event!r}")
+    ts, address, amount, seq, mat_time = event if len(event) == 5 else (*event, None, None)
+    if not (is_int(ts) or isinstance(ts, float)):
+        raise ValueError(f"Event timestamp must be a number: {event!r}")
+    if address is not None and not isinstance(address, str):
+        raise ValueError(f"Event address must be a string: {event!r}")
+    if not is_int(amount) or not all(value is None or is_int(value) for value in (seq, mat_time)):
+        raise ValueError(f"Event amount, seq and mat_time must be integers: {event!r}")
+    return float(ts), address, amount, seq, mat_time
+
+
+class FleetStore:
+    # Every client's intake in one WAL-mode SQLite file, indexed by time and by
+    # client. A batch is recorded by id so a retried POST is not counted twice.
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS intake (
+                id INTEGER PRIMARY KEY,
+                client TEXT NOT NULL,
+                ts REAL NOT NULL,
+                address TEXT,
+                amount INTEGER NOT NULL,
+                seq INTEGER,
+                mat_time INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS intake_ts ON intake (ts);
+            CREATE INDEX IF NOT EXISTS intake_client_ts ON intake (client, ts);
+            CREATE UNIQUE INDEX IF NOT EXISTS intake_origin
+                ON intake (client, address, mat_time, seq) WHERE seq IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS batch (
+                client TEXT NOT NULL,
+                id TEXT NOT NULL,
+                received REAL NOT NULL,
+                PRIMARY KEY (client, id)
+            );
+            """
+        )
+
+    def write(self, batches):
+        # batches: (client, batch_id, events) from many requests, in one transaction.
+        # Returns the number of new events per batch.
+        added = []
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                now = time.time()
+                for client, batch_id, events in batches:
+                    before = self.conn.total_changes
+                    self.conn.execute("INSERT OR IGNORE INTO batch (client, id, received) VALUES (?, ?, ?)", (client, batch_id, now))
+                    if self.conn.total_changes == before:
+                        added.append(0)  # Already stored by an earlier attempt
+                        continue
+                    before += 1
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO intake (client, ts, address, amount, seq, mat_time) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(client, *event) for event in events],
+                    )
+                    added.append(self.conn.total_changes - before)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def totals(self, since, until):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT client, address, SUM(amount), COUNT(*) FROM intake WHERE ts >= ? AND ts < ? GROUP BY client, address",
+                (since, until),
+            ).fetchall()
+        clients = {}
+        for client, address, total, sips in rows:
+            clients.setdefault(client, {})[address or ""] = {"total": total, "sips": sips}
+        return clients
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM intake").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            self.conn.close()
+
+
+class FleetServer:
+    # POST /events {"client", "batch", "events": [[ts, address, amount, seq, mat_time]]}
+    # answers {"added": n} once the events are committed. Requests are only parsed on
+    # the event loop; a single writer thread commits whatever has queued up meanwhile.
+    # GET /totals?day=YYYY-MM-DD answers per client and mat totals for that day.
+
+    def __init__(self, store, host="127.0.0.1", port=FLEET_PORT, commit_window=COMMIT_WINDOW):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.commit_window = commit_window
+        self.server = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fleet-store")
+        self.queued = []  # (client, batch_id, events, future)
+        self.queued_events = 0
+        self.queue_ready = asyncio.Event()
+        self.committing = 0  # Batches handed to the writer thread and not yet answered
+        self.writer_task = None
+        self.connections = set()
+        self.requests = 0
+        self.commits = 0
+        self.events = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=BACKLOG)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.writer_task = asyncio.ensure_future(self.write_queued())
+        return self.server
+
+    async def handle_client(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(read_message(reader), IDLE_TIMEOUT)
+                except BodyTooLarge:
+                    writer.write(encode_message(f"HTTP/1.1 413 {STATUS_TEXT[413]}", b"{}", close=True))
+                    break
+                except ValueError as e:
+                    writer.write(encode_message(f"HTTP/1.1 400 {STATUS_TEXT[400]}", encode_json({"error": str(e)}), close=True))
+                    break
+                if message is None:
+                    break
+                start, headers, body = message
+                if len(start) != 3:
+                    writer.write(encode_message(f"HTTP/1.1 400 {STATUS_TEXT[400]}", encode_json({"error": "Malformed request line."}), close=True))
+                    break
+                method, target, _ = start
+                status, reply = await self.respond(method, target, body)
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(encode_message(f"HTTP/1.1 {status} {STATUS_TEXT[status]}", encode_json(reply), close))
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def respond(self, method, target, body):
+        self.requests += 1
+        url = urllib.parse.urlsplit(target)
+        try:
+            if method == "POST" and url.path == "/events":
+                request = json.loads(body)
+                events = [parse_event(event) for event in request["events"]]
+                added = await self.enqueue(str(request["client"]), str(request["batch"]), events)
+                return 200, {"added": added}
+            if method == "GET" and url.path == "/totals":
+                query = urllib.parse.parse_qs(url.query)
+                day = datetime.date.fromisoformat(query["day"][0]) if "day" in query else datetime.date.today()
+                clients = await asyncio.get_running_loop().run_in_executor(self.executor, self.store.totals, *day_bounds(day))
+                return 200, {"day": day.isoformat(), "clients": clients}
+            if method == "GET" and url.path == "/stats":
+                return 200, self.stats()
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+        return 404, {"error": f"No route for {method} {url.path}"}
+
+    def enqueue(self, client, batch_id, events):
+        future = asyncio.get_running_loop().create_future()
+        self.queued.append((client, batch_id, events, future))
+        self.queued_events += len(events)
+        self.queue_ready.set()
+        return future
+
+    async def write_queued(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.queue_ready.wait()
+            if self.queued_events < MAX_COMMIT_EVENTS:
+                # Batches from other clients arriving in the meantime share the commit
+                await asyncio.sleep(self.commit_window)
+            queued, self.queued, self.queued_events = self.queued, [], 0
+            self.queue_ready.clear()
+            self.committing = len(queued)
+            try:
+                try:
+                    added = await loop.run_in_executor(self.executor, self.store.write, [item[:3] for item in queued])
+                    self.commits += 1
+                except Exception as e:
+                    if len(queued) == 1:
+                        self.fail(queued, e)
+                        continue
+                    # Something in the shared commit is bad; each batch gets its own so
+                    # only the one at fault is rejected
+                    added = [await self.write_alone(item) for item in queued]
+            finally:
+                self.committing = 0
+            self.events += sum(count for count in added if count is not None)
+            for (*_, future), count in zip(queued, added):
+                if count is not None and not future.done():
+                    future.set_result(count)
+
+    async def write_alone(self, item):
+        try:
+            added = await asyncio.get_running_loop().run_in_executor(self.executor, self.store.write, [item[:3]])
+        except Exception as e:
+            self.fail([item], e)
+            return None
+        self.commits += 1
+        return added[0]
+
+    def fail(self, queued, error):
+        for *_, future in queued:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self):
+        return {"connections": len(self.connections), "requests": self.requests, "commits": self.commits, "events": self.events}
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+        if self.writer_task is not None:
+            while self.queued or self.committing:
+                # Let the queued batches commit before the writer goes away
+                await asyncio.sleep(self.commit_window)
+            self.writer_task.cancel()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.store.close)
+        self.executor.shutdown(wait=False)
+
+
+class FleetConnection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, method, path, host, payload=None):
+        body = encode_json(payload) if payload is not None else b""
+        self.writer.write(encode_message(f"{method} {path} HTTP/1.1\r\nHost: {host}", body))
+        await self.writer.drain()
+        message = await read_message(self.reader)
+        if message is None:
+            raise ConnectionError("Fleet server closed the connection.")
+        (_, status, _), headers, body = message
+        return int(status), headers, json.loads(body) if body else None
+
+    def close(self):
+        self.writer.close()
+
+
+class FleetClient:
+    # Pushes this instance's journaled sips to a FleetServer. push() only buffers;
+    # a background task sends full batches at once and partial ones every
+    # push_interval over a small pool of keep-alive connections. A batch that fails
+    # is retried with the same id, so the server stores it exactly once.
+
+    def __init__(self, url, client_id=None, pool_size=POOL_SIZE, batch_size=BATCH_SIZE, push_interval=PUSH_INTERVAL, max_buffered=MAX_BUFFERED):
+        parts = urllib.parse.urlsplit(url if "//" in url else f"http://{url}")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or FLEET_PORT
+        self.client_id = client_id or socket.gethostname()
+        self.batch_size = batch_size
+        self.push_interval = push_interval
+        self.buffer = collections.deque()
+        self.max_buffered = max_buffered
+        self.retries = collections.deque()  # (batch_id, events) that failed to send
+        self.session = os.urandom(4).hex()  # Keeps batch ids unique across restarts
+        self.batch_ids = itertools.count(1)
+        self.idle = []
+        self.slots = asyncio.Semaphore(pool_size)
+        self.batch_ready = asyncio.Event()
+        self.task = None
+        self.sending = set()
+        self.in_flight = 0  # Events posted and not yet answered
+        self.retry_delay = RETRY_DELAY
+        self.sent = 0
+        self.dropped = 0
+        self.failures = 0
+        self.connections_opened = 0
+
+    @classmethod
+    def from_environment(cls, client_id=None):
+        url = os.environ.get(ENV_VAR)
+        return cls(url, client_id) if url else None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    def push(self, events):
+        for event in events:
+            self.buffer.append((event[0], event[1], int(event[2]), *(event[3:5] if len(event) > 3 else (None, None))))
+        overflow = len(self.buffer) - self.max_buffered
+        for _ in range(max(0, overflow)):
+            self.buffer.popleft()
+            self.dropped += 1
+        if len(self.buffer) >= self.batch_size:
+            self.batch_ready.set()
+
+    def take_batch(self):
+        count = min(self.batch_size, len(self.buffer))
+        return f"{self.session}-{next(self.batch_ids)}", [self.buffer.popleft() for _ in range(count)]
+
+    async def run(self):
+        # Instances started together would otherwise all push in the same instant
+        await asyncio.sleep(random.uniform(0, self.push_interval))
+        while True:
+            try:
+                await asyncio.wait_for(self.batch_ready.wait(), self.push_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.batch_ready.clear()
+            failed = await self.send_pending()
+            if failed:
+                await asyncio.sleep(self.retry_delay)
+                self.retry_delay = min(MAX_RETRY_DELAY, self.retry_delay * 2)
+            else:
+                self.retry_delay = RETRY_DELAY
+
+    async def send_pending(self):
+        # Earlier failures go first, one at a time; then everything buffered with up to
+        # pool_size batches in flight. Returns True if a batch failed.
+        while self.retries:
+            await self.slots.acquire()
+            if not await self.send_batch(*self.retries.popleft()):
+                return True
+        while self.buffer:
+            await self.slots.acquire()
+            task = asyncio.ensure_future(self.send_batch(*self.take_batch()))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+        results = await asyncio.gather(*self.sending)
+        return not all(results)
+
+    async def flush(self):
+        # Sends everything buffered now, alongside the background task if it is mid-push.
+        # False if the server could not take it.
+        while self.buffer or self.retries or self.sending:
+            if self.sending:
+                await asyncio.wait(set(self.sending))
+            elif await self.send_pending():
+                return False
+        return True
+
+    async def send_batch(self, batch_id, events):
+        self.in_flight += len(events)
+        try:
+            await self.post_events(batch_id, events)
+        except ValueError:
+            # Rejected as malformed; sending it again would be rejected again
+            self.failures += 1
+            self.dropped += len(events)
+            return True
+        except Exception:
+            self.failures += 1
+            self.retries.append((batch_id, events))
+            return False
+        finally:
+            self.in_flight -= len(events)
+            self.slots.release()
+        self.sent += len(events)
+        return True
+
+    async def post_events(self, batch_id, events):
+        payload = {"client": self.client_id, "batch": batch_id, "events": events}
+        status, _, reply = await self.request("POST", "/events", payload)
+        if status == 400:
+            raise ValueError(reply.get("error") if reply else f"HTTP {status}")
+        if status != 200:
+            raise RuntimeError(reply.get("error") if reply else f"HTTP {status}")
+        return reply["added"]
+
+    async def totals(self, day=None):
+        path = "/totals" + (f"?day={day.isoformat()}" if day else "")
+        status, _, reply = await self.request("GET", path)
+        if status != 200:
+            raise RuntimeError(reply.get("error") if reply else f"HTTP {status}")
+        return reply
+
+    async def request(self, method, path, payload=None):
+        # A pooled connection the server already closed fails on first use; that one
+        # request is retried once on a fresh connection
+        reused = bool(self.idle)
+        connection = self.idle.pop() if reused else await self.open()
+        try:
+            result = await asyncio.wait_for(connection.request(method, path, self.host, payload), REQUEST_TIMEOUT)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            connection.close()
+            if not reused:
+                raise ConnectionError(f"Fleet server unreachable: {str(e)}")
+            return await self.request(method, path, payload)
+        except BaseException:
+            connection.close()
+            raise
+        if result[1].get("connection", "").lower() == "close":
+            connection.close()
+        else:
+            self.idle.append(connection)
+        return result
+
+    async def open(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), REQUEST_TIMEOUT)
+        self.connections_opened += 1
+        return FleetConnection(reader, writer)
+
+    def stats(self):
+        return {
+            "buffered": len(self.buffer) + sum(len(events) for _, events in self.retries),
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "connections_opened": self.connections_opened,
+        }
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for task in list(self.sending):
+            task.cancel()
+        while self.idle:
+            self.idle.pop().close()
+
+
+async def serve(path, host, port):
+    server = FleetServer(FleetStore(path), host, port)
+    await server.start()
+    print(f"Fleet aggregation listening on {host}:{server.port}, storing to {path}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect intake pushed by Smart mat instances across a floor.")
+    parser.add_argument("--db", default="fleet.db", help="SQLite file for the aggregated intake")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on; 127.0.0.1 keeps it local")
+    parser.add_argument("--port", type=int, default=FLEET_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.db, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
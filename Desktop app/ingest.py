@@ -0,0 +1,66 @@
+import asyncio
+import collections
+import time
+
+FRAME_INTERVAL = 1 / 60  # Widget refreshes are coalesced to at most one per frame
+
+
+class IngestPipeline:
+    # Notification callbacks only enqueue the raw packet. A single consumer on the
+    # event loop drains everything queued so far, applies each packet to the model,
+    # persists the batch at once and schedules at most one view refresh per frame.
+
+    def __init__(self, apply_packet, persist, refresh, frame_interval=FRAME_INTERVAL, loop=None):
+        self.apply_packet = apply_packet
+        self.persist = persist
+        self.refresh = refresh
+        self.frame_interval = frame_interval
+        self.loop = loop
+        self.packets = collections.deque()
+        self.drain_scheduled = False
+        self.refresh_handle = None
+        self.last_refresh = 0.0
+
+    def get_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        return self.loop
+
+    def push(self, address, data, ts=None):
+        # deque.append is atomic, so producers on other threads need no lock
+        self.packets.append((time.time() if ts is None else ts, address, bytes(data)))
+        if not self.drain_scheduled:
+            self.drain_scheduled = True
+            self.get_loop().call_soon_threadsafe(self.drain)
+
+    def drain(self):
+        self.drain_scheduled = False
+        events = []
+        popleft = self.packets.popleft
+        while self.packets:
+            ts, address, data = popleft()
+            events.extend(self.apply_packet(ts, address, data))
+        if events:
+            self.persist(events)
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        if self.refresh_handle is not None:
+            return
+        delay = self.last_refresh + self.frame_interval - time.monotonic()
+        if delay <= 0:
+            self.run_refresh()
+        else:
+            self.refresh_handle = self.get_loop().call_later(delay, self.run_refresh)
+
+    def run_refresh(self):
+        self.refresh_handle = None
+        self.last_refresh = time.monotonic()
+        self.refresh()
+
+    def flush(self):
+        if self.packets:
+            self.drain()
+        if self.refresh_handle is not None:
+            self.refresh_handle.cancel()
+            self.run_refresh()
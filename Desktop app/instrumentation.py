@@ -0,0 +1,223 @@
+import asyncio
+import bisect
+import collections
+import json
+import os
+import time
+
+ENV_VAR = "SMART_MAT_METRICS"  # Directory for the exports; instrumentation is off when unset
+EXPORT_INTERVAL = 5.0  # Seconds between Prometheus file rewrites and trace flushes
+LAG_INTERVAL = 0.25  # Event loop lag probe period
+SLOW = 1 / 60  # Spans and lag at least one frame long are written to the trace
+TRACE_MAX_BYTES = 4 * 1024 * 1024  # The trace rolls over to a single .1 backup past this
+BUCKETS = tuple(0.0001 * 2 ** i for i in range(17))  # Upper bounds in seconds, 0.1 ms to 6.5 s
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the quantile, None past the last bucket
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+
+class Instrumentation:
+    # Stage timing histograms, counters and an event loop lag probe for one process.
+    # Hot paths are instrumented by wrapping their callables once at construction, so
+    # with instrumentation disabled (see DISABLED) they run exactly as before.
+    enabled = True
+
+    def __init__(self, directory, role, export_interval=EXPORT_INTERVAL, lag_interval=LAG_INTERVAL):
+        self.role = role
+        self.export_interval = export_interval
+        self.lag_interval = lag_interval
+        self.prom_path = os.path.join(directory, f"{role}.prom")
+        self.trace_path = os.path.join(directory, f"{role}.trace.jsonl")
+        self.histograms = collections.defaultdict(Histogram)  # stage -> Histogram
+        self.counters = collections.Counter()
+        self.collectors = []
+        self.trace_lines = []
+        self.loop = None
+        self.lag_handle = None
+        self.export_handle = None
+        self.lag_expected = None
+
+    @classmethod
+    def from_environment(cls, role):
+        directory = os.environ.get(ENV_VAR)
+        return cls(directory, role) if directory else DISABLED
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+        if seconds >= SLOW:
+            self.trace("slow", stage=stage, ms=round(seconds * 1000, 3))
+
+    def inc(self, name, amount=1):
+        self.counters[name] += amount
+        self.trace("count", name=name)
+
+    def collect(self, collector):
+        # collector() returns {name: value} and is only called when exporting
+        self.collectors.append(collector)
+
+    def trace(self, kind, **fields):
+        self.trace_lines.append(json.dumps({"ts": time.time(), "kind": kind, **fields}, separators=(",", ":")))
+
+    def timed(self, stage, func):
+        observe = self.observe
+        clock = time.perf_counter
+
+        def timed_call(*args):
+            started = clock()
+            try:
+                return func(*args)
+            finally:
+                observe(stage, clock() - started)
+
+        return timed_call
+
+    def timed_packets(self, apply_packet):
+        # apply_packet(ts, address, data): the wall clock stamp taken when the packet
+        # was queued gives the receive stage, the call itself the parse stage
+        observe = self.observe
+        clock = time.perf_counter
+
+        def timed_apply(ts, address, data):
+            observe("receive", max(0.0, time.time() - ts))
+            started = clock()
+            try:
+                return apply_packet(ts, address, data)
+            finally:
+                observe("parse", clock() - started)
+
+        return timed_apply
+
+    def start(self, loop=None):
+        os.makedirs(os.path.dirname(self.prom_path), exist_ok=True)
+        self.loop = loop or asyncio.get_event_loop()
+        self.lag_expected = self.loop.time() + self.lag_interval
+        self.lag_handle = self.loop.call_later(self.lag_interval, self.probe_lag)
+        self.export_handle = self.loop.call_later(self.export_interval, self.export_soon)
+
+    def probe_lag(self):
+        # A callback due at lag_expected that runs late measures how long the loop was busy
+        now = self.loop.time()
+        lag = max(0.0, now - self.lag_expected)
+        self.histograms["loop_lag"].observe(lag)
+        if lag >= SLOW:
+            self.trace("loop_lag", ms=round(lag * 1000, 3))
+        self.lag_expected = now + self.lag_interval
+        self.lag_handle = self.loop.call_later(self.lag_interval, self.probe_lag)
+
+    def export_soon(self):
+        text, lines = self.render(), self.take_trace()
+        self.loop.run_in_executor(None, self.write, text, lines)
+        self.export_handle = self.loop.call_later(self.export_interval, self.export_soon)
+
+    def take_trace(self):
+        lines, self.trace_lines = self.trace_lines, []
+        return lines
+
+    def write(self, text, lines):
+        temp_path = self.prom_path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(text)
+        os.replace(temp_path, self.prom_path)
+        if not lines:
+            return
+        try:
+            if os.path.getsize(self.trace_path) > TRACE_MAX_BYTES:
+                os.replace(self.trace_path, self.trace_path + ".1")
+        except FileNotFoundError:
+            pass
+        with open(self.trace_path, "a") as file:
+            file.write("\n".join(lines) + "\n")
+
+    def render(self):
+        role = self.role
+        lines = ["# TYPE smart_mat_duration_seconds histogram"]
+        for stage, histogram in sorted(self.histograms.items()):
+            labels = f'role="{role}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'smart_mat_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'smart_mat_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"smart_mat_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"smart_mat_duration_seconds_count{{{labels}}} {histogram.count}")
+        lines.append("# TYPE smart_mat_events_total counter")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'smart_mat_events_total{{role="{role}",event="{name}"}} {value}')
+        for collector in self.collectors:
+            for name, value in sorted(collector().items()):
+                lines.append(f'smart_mat_{name}{{role="{role}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        return {
+            stage: {"count": histogram.count, "p50": histogram.quantile(0.5), "p99": histogram.quantile(0.99)}
+            for stage, histogram in self.histograms.items()
+        }
+
+    def stop(self):
+        for handle in (self.lag_handle, self.export_handle):
+            if handle is not None:
+                handle.cancel()
+        self.lag_handle = self.export_handle = None
+        if self.loop is not None:
+            self.write(self.render(), self.take_trace())
+
+
+class DisabledInstrumentation:
+    enabled = False
+
+    def observe(self, stage, seconds):
+        pass
+
+    def inc(self, name, amount=1):
+        pass
+
+    def collect(self, collector):
+        pass
+
+    def trace(self, kind, **fields):
+        pass
+
+    def timed(self, stage, func):
+        return func
+
+    def timed_packets(self, apply_packet):
+        return apply_packet
+
+    def start(self, loop=None):
+        pass
+
+    def render(self):
+        return ""
+
+    def summary(self):
+        return {}
+
+    def stop(self):
+        pass
+
+
+DISABLED = DisabledInstrumentation()
@@ -0,0 +1,288 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import tempfile
+
+IPC_PORT = 47811  # Loopback TCP fallback where Unix sockets are unavailable
+ATTACH_TIMEOUT = 0.2
+READ_LIMIT = 16 * 1024 * 1024  # Longest line; an events reply for months of history is one line
+WRITE_LIMIT = 2 * READ_LIMIT  # Bytes queued for one client before it counts as stalled
+
+
+def socket_path():
+    return os.path.join(tempfile.gettempdir(), f"smartmat-{os.getuid() if hasattr(os, 'getuid') else 'user'}.sock")
+
+
+def encode(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+async def open_connection():
+    if hasattr(socket, "AF_UNIX"):
+        return await asyncio.open_unix_connection(socket_path(), limit=READ_LIMIT)
+    return await asyncio.open_connection("127.0.0.1", IPC_PORT, limit=READ_LIMIT)
+
+
+class IpcServer:
+    # Streams MatService events to attached clients as newline-delimited JSON and
+    # runs the commands they send back. Each client first receives a full state event.
+
+    def __init__(self, service):
+        self.service = service
+        self.server = None
+        self.writers = set()
+        service.subscribe(self.broadcast)
+
+    async def start(self):
+        if hasattr(socket, "AF_UNIX"):
+            path = socket_path()
+            if os.path.exists(path):
+                try:
+                    _, writer = await asyncio.wait_for(open_connection(), ATTACH_TIMEOUT)
+                except (OSError, asyncio.TimeoutError):
+                    # Nobody answers: left behind by a service that did not exit cleanly
+                    os.remove(path)
+                else:
+                    writer.close()
+                    raise RuntimeError(f"Another Smart mat service is already listening on {path}.")
+            self.server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, "127.0.0.1", IPC_PORT)
+        return self.server
+
+    def broadcast(self, event):
+        if not self.writers:
+            return
+        payload = encode(event)
+        for writer in list(self.writers):
+            self.send(writer, payload)
+
+    def send(self, writer, payload):
+        # write() never waits for the client, so one that stops reading is dropped
+        # before the events queued for it grow without bound
+        if writer.is_closing():
+            self.writers.discard(writer)
+            return
+        if writer.transport.get_write_buffer_size() + len(payload) > WRITE_LIMIT:
+            print("Dropped a client that stopped reading events.")
+            self.writers.discard(writer)
+            writer.transport.abort()
+            return
+        writer.write(payload)
+
+    async def handle_client(self, reader, writer):
+        self.writers.add(writer)
+        writer.write(encode(self.service.state()))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Slow commands such as a scan must not hold up the rest of the stream
+                self.service.tasks.spawn(self.respond(line, writer), "ipc")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def respond(self, line, writer):
+        request = None
+        try:
+            request = json.loads(line)
+            result = await self.dispatch(request)
+            reply = {"type": "reply", "id": request.get("id"), "result": result}
+        except Exception as e:
+            reply = {"type": "reply", "id": request.get("id") if isinstance(request, dict) else None, "error": str(e)}
+        self.send(writer, encode(reply))
+
+    async def dispatch(self, request):
+        command = request.get("cmd")
+        if command == "state":
+            return self.service.state()
+        if command == "discover":
+            return await self.service.discover()
+        if command == "cancel_discovery":
+            return self.service.cancel_discovery()
+        if command == "connect":
+            return await self.service.connect(request["address"])
+        if command == "connect_saved":
+            return await self.service.connect_saved()
+        if command == "disconnect":
+            return await self.service.disconnect(request.get("address"))
+        if command == "send":
+            return await self.service.send_text(request["text"], request.get("address"))
+        if command == "settings":
+            return self.service.update_settings(**request["values"])
+        if command == "summary":
+            return self.service.summary(request.get("address"), request.get("days", 7))
+        if command == "events":
+            return await self.service.events(request.get("since"), request.get("until"), request.get("address"))
+        if command == "forget":
+            return self.service.forget_device(request.get("address"))
+        if command == "metrics":
+            # Prometheus text, for scraping over the socket instead of the exported file
+            return self.service.metrics.render()
+        raise ValueError(f"Unknown command: {command}")
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.writers):
+            writer.close()
+        if hasattr(socket, "AF_UNIX") and os.path.exists(socket_path()):
+            os.remove(socket_path())
+
+
+class RemoteMatService:
+    # Client side of IpcServer with the same surface as MatService, so the GUI can
+    # attach to a running daemon instead of owning the BLE link itself.
+
+    def __init__(self, reader, writer, initial_state):
+        self.reader = reader
+        self.writer = writer
+        self.listeners = []
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.last_state = initial_state
+        self.closed = False
+        self.read_task = asyncio.ensure_future(self.read_events())
+
+    @classmethod
+    async def attach(cls, timeout=ATTACH_TIMEOUT):
+        reader, writer = await asyncio.wait_for(open_connection(), timeout)
+        initial_state = json.loads(await asyncio.wait_for(reader.readline(), timeout))
+        return cls(reader, writer, initial_state)
+
+    @property
+    def saved_device(self):
+        return self.last_state.get("address")
+
+    @property
+    def is_connected(self):
+        return bool(self.last_state.get("connected"))
+
+    def state(self):
+        return dict(self.last_state)
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        return lambda: self.listeners.remove(listener) if listener in self.listeners else None
+
+    async def read_events(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    event = None
+                if not isinstance(event, dict):
+                    print(f"Skipped a line from the service that is not an event: {line[:80]!r}")
+                    continue
+                if event.get("type") == "reply":
+                    future = self.pending.pop(event.get("id"), None)
+                    if future and not future.done():
+                        if "error" in event:
+                            future.set_exception(RuntimeError(event["error"]))
+                        else:
+                            future.set_result(event.get("result"))
+                    continue
+                self.track_state(event)
+                self.emit(event)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Service connection closed."))
+            self.pending.clear()
+            if not self.closed:
+                self.emit({"type": "status", "text": "Lost connection to the Smart mat service."})
+
+    def emit(self, event):
+        # As in MatService.emit, one failing listener neither stops the others nor the stream
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Listener failed on {event.get('type')} event: {str(e)}")
+
+    def track_state(self, event):
+        kind = event.get("type")
+        if kind == "state":
+            self.last_state = event
+        elif kind == "intake":
+            self.last_state["total"] = event["total"]
+            self.last_state["contribution"] = event["contribution"]
+            devices = self.last_state.setdefault("devices", {})
+            for address, total in event["devices"].items():
+                devices.setdefault(address, {"connected": True})["total"] = total
+        elif kind == "connected":
+            self.last_state["connected"] = True
+            self.last_state["address"] = event["address"]
+            self.last_state.setdefault("devices", {}).setdefault(event["address"], {"total": 0})["connected"] = True
+        elif kind == "disconnected":
+            devices = self.last_state.setdefault("devices", {})
+            if event["address"] in devices:
+                devices[event["address"]]["connected"] = False
+            self.last_state["connected"] = any(device.get("connected") for device in devices.values())
+
+    async def request(self, cmd, **fields):
+        request_id = next(self.ids)
+        future = asyncio.get_event_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(encode({"cmd": cmd, "id": request_id, **fields}))
+        return await future
+
+    async def discover(self):
+        return [tuple(device) for device in await self.request("discover")]
+
+    def cancel_discovery(self):
+        self.writer.write(encode({"cmd": "cancel_discovery", "id": next(self.ids)}))
+
+    async def connect(self, address):
+        return await self.request("connect", address=address)
+
+    async def connect_saved(self):
+        return await self.request("connect_saved")
+
+    async def disconnect(self, address=None):
+        return await self.request("disconnect", address=address)
+
+    async def send_text(self, text, address=None):
+        return await self.request("send", text=text, address=address)
+
+    async def summary(self, address=None, days=7):
+        return await self.request("summary", address=address, days=days)
+
+    async def events(self, since=None, until=None, address=None):
+        return await self.request("events", since=since, until=until, address=address)
+
+    async def metrics_text(self):
+        return await self.request("metrics")
+
+    def update_settings(self, **values):
+        self.last_state.update(values)
+        self.writer.write(encode({"cmd": "settings", "id": next(self.ids), "values": values}))
+
+    def forget_device(self, address=None):
+        forgotten = (address or self.last_state.get("address")) is not None
+        if address is None or address == self.last_state.get("address"):
+            self.last_state["address"] = None
+        self.writer.write(encode({"cmd": "forget", "id": next(self.ids), "address": address}))
+        return forgotten
+
+    async def shutdown(self, timeout=None):
+        # The daemon owns the links and keeps them; detaching is immediate
+        self.close()
+
+    def close(self):
+        self.closed = True
+        self.read_task.cancel()
+        self.writer.close()
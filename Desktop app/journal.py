@@ -0,0 +1,168 @@
+import datetime
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SNAPSHOT_EVERY = 200  # Appends between automatic snapshots of the daily total
+
+
+def day_bounds(day):
+    start = datetime.datetime.combine(day, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    return start.timestamp(), end.timestamp()
+
+
+class IntakeJournal:
+    # Append-only log of every intake contribution, stored in a WAL-mode SQLite file.
+    # The running total for a day is a snapshot row plus the events appended after it.
+    # Live batches are committed on the single `writer` thread, in the order queued.
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS intake (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                address TEXT,
+                amount INTEGER NOT NULL,
+                seq INTEGER,
+                mat_time INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS intake_ts ON intake (ts);
+            CREATE TABLE IF NOT EXISTS snapshot (
+                day TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                last_id INTEGER NOT NULL
+            );
+            """
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(intake)")]
+        for column in ("seq", "mat_time"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE intake ADD COLUMN {column} INTEGER")
+        # A sip's origin on its mat; the same sip replayed from the mat's backlog is ignored
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS intake_origin ON intake (address, mat_time, seq) WHERE seq IS NOT NULL"
+        )
+        self.appends_since_snapshot = 0
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-writer")
+
+    def append(self, amount, address=None, ts=None):
+        if ts is None:
+            ts = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO intake (ts, address, amount) VALUES (?, ?, ?)",
+                (ts, address, int(amount)),
+            )
+            self.appends_since_snapshot += 1
+        if self.appends_since_snapshot >= SNAPSHOT_EVERY:
+            self.snapshot()
+        return cursor.lastrowid
+
+    def append_many(self, events):
+        # events: iterable of (ts, address, amount) or (ts, address, amount, seq, mat_time),
+        # written in a single transaction. Returns how many were new.
+        rows = [(event[0], event[1], int(event[2]), *(event[3:5] if len(event) > 3 else (None, None))) for event in events]
+        if not rows:
+            return 0
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO intake (ts, address, amount, seq, mat_time) VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            added = self.conn.total_changes - before
+            self.appends_since_snapshot += added
+        if self.appends_since_snapshot >= SNAPSHOT_EVERY:
+            self.snapshot()
+        return added
+
+    def known_origins(self, address, origins):
+        # The (seq, mat_time) pairs among origins that are already journaled for address
+        origins = list(origins)
+        if not origins:
+            return set()
+        times = [mat_time for _, mat_time in origins]
+        with self.lock:
+            stored = self.conn.execute(
+                "SELECT seq, mat_time FROM intake WHERE address = ? AND mat_time BETWEEN ? AND ? AND seq IS NOT NULL",
+                (address, min(times), max(times)),
+            ).fetchall()
+        return set(stored) & set(origins)
+
+    def total_for_day(self, day=None):
+        day = day or datetime.date.today()
+        start, end = day_bounds(day)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT total, last_id FROM snapshot WHERE day = ?", (day.isoformat(),)
+            ).fetchone()
+            total, last_id = row if row else (0, 0)
+            tail = self.conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM intake WHERE id > ? AND ts >= ? AND ts < ?",
+                (last_id, start, end),
+            ).fetchone()[0]
+        return total + tail
+
+    def totals_by_address(self, day=None):
+        start, end = day_bounds(day or datetime.date.today())
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT address, SUM(amount) FROM intake WHERE ts >= ? AND ts < ? GROUP BY address",
+                (start, end),
+            ).fetchall())
+
+    def snapshot(self, day=None):
+        day = day or datetime.date.today()
+        start, end = day_bounds(day)
+        with self.lock:
+            last_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM intake").fetchone()[0]
+            row = self.conn.execute(
+                "SELECT total, last_id FROM snapshot WHERE day = ?", (day.isoformat(),)
+            ).fetchone()
+            total, previous_id = row if row else (0, 0)
+            total += self.conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM intake WHERE id > ? AND id <= ? AND ts >= ? AND ts < ?",
+                (previous_id, last_id, start, end),
+            ).fetchone()[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshot (day, total, last_id) VALUES (?, ?, ?)",
+                (day.isoformat(), total, last_id),
+            )
+            self.appends_since_snapshot = 0
+        return total
+
+    def events(self, since=None, until=None, address=None):
+        query = "SELECT ts, address, amount FROM intake WHERE ts >= ? AND ts < ?"
+        params = [since if since is not None else 0, until if until is not None else float("inf")]
+        if address is not None:
+            query += " AND address = ?"
+            params.append(address)
+        with self.lock:
+            return self.conn.execute(query + " ORDER BY ts", params).fetchall()
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM intake LIMIT 1").fetchone() is None
+
+    def close(self):
+        # Batches still queued on the writer are committed first
+        self.writer.shutdown(wait=True)
+        try:
+            self.snapshot()
+            with self.lock:
+                self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        finally:
+            self.conn.close()
@@ -2,53 +2,108 @@ from PySide6.QtWidgets import (
     QMainWindow, QWidget, QPushButton, QApplication, QGridLayout,
     QVBoxLayout, QStackedWidget, QComboBox, QLabel, QHBoxLayout, QProgressBar, QInputDialog
 )
-from PySide6.QtCore import Qt, QTimer, QSize, QPropertyAnimation, QUrl
-from qasync import QEventLoop, asyncSlot
+from PySide6.QtCore import Qt, QTimer, QSize, QPropertyAnimation, Signal
+from qasync import QEventLoop
 import asyncio
-from bleak import BleakScanner, BleakClient
-import json
-from PySide6.QtGui import QIcon
 import os
 import time
-import datetime
-from PySide6.QtMultimedia import QSoundEffect
+from ipc import RemoteMatService
+from assets import AssetRegistry
+from scheduler import ReminderScheduler, HydrationReminders
+from instrumentation import Instrumentation
+from supervisor import TaskSupervisor, SHUTDOWN_TIMEOUT, time_left
+
+TIMELINE_RANGES = [("Day", 86400), ("Week", 7 * 86400), ("Month", 30 * 86400)]
+TASK_LIMITS = {"send": 4}  # Concurrent tasks per scope
 
 class MainWindow(QMainWindow):
+    first_frame = Signal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Smart mat")
 
         self.timer_duration = 45 * 60  # Default timer duration in seconds (45 minutes)
         self.remaining_time = self.timer_duration
-        self.countdown_timer = QTimer()
-        self.countdown_timer.setInterval(1000)
-        self.countdown_timer.timeout.connect(self.update_timer)
-        self.timer_end_time = None
+        self.scheduler = ReminderScheduler()
+        self.reminders = HydrationReminders(self.scheduler, self.timer_expired, self.update_timer, self.timer_duration)
         self.is_timer_running = False
         self.animation = None
+        self.assets = AssetRegistry()
+        self.metrics = Instrumentation.from_environment("gui")
+        self.tasks = TaskSupervisor(self.report_task_error, TASK_LIMITS)
+        self.shutdown_task = None
+        self.ready_to_close = False
 
         self.daily_goal = 2500  # Default daily water consumption goal in milliliters
         self.current_water_intake = 0
         self.current_contribution = 0
+        self.discovered_devices = {}
+        self.is_scanning = False
+        self.service = None
+        self.started = False
+        self.timer_label = None
+        self.water_progress = None
+        self.timeline = None
 
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
 
         main_layout = QVBoxLayout(self.central_widget)
 
+        # Only the setup view is built up front; the others are built on first switch_view
         self.stacked_widget = QStackedWidget()
         self.stacked_widget.addWidget(self.create_view_setup())
-        self.stacked_widget.addWidget(self.create_view_1())
-        self.stacked_widget.addWidget(self.create_view_2())
+        self.view_builders = {1: self.create_view_1, 2: self.create_view_2}
+        for _ in self.view_builders:
+            self.stacked_widget.addWidget(QWidget())
 
         main_layout.addWidget(self.stacked_widget)
 
-        self.saved_device = self.load_saved_device()
-        self.ble_client = None
-        self.load_water_data()
-
         self.showMinimized()
 
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        self.update_display_activity()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_display_activity()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_display_activity()
+
+    def update_display_activity(self):
+        # No countdown ticks while nobody can see the label
+        scheduler = getattr(self, "scheduler", None)
+        if scheduler is not None:
+            scheduler.set_display_active(self.isVisible() and not self.isMinimized())
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.started:
+            QTimer.singleShot(0, self.first_frame.emit)
+
+    def start(self):
+        # Service attach and auto-connect run only once the first frame is up
+        if self.started:
+            return
+        self.started = True
+        self.metrics.start()
+        self.tasks.spawn(self.start_service(), "startup")
+
+    async def start_service(self):
+        # Decode the alarm now so the first reminder does not wait on disk and decoder warm-up
+        self.assets.sound("alarm.wav", self)
+        self.attach_service(await open_service())
+        await self.auto_connect_to_saved_device()
+
+    def attach_service(self, service):
+        self.service = service
+        self.service.subscribe(self.metrics.timed("ui", self.handle_service_event))
+        self.load_water_data()
+
     def create_view_setup(self):
         view = QWidget()
         layout = QVBoxLayout(view)
@@ -60,9 +115,9 @@ class MainWindow(QMainWindow):
         self.device_dropdown = QComboBox()
         layout.addWidget(self.device_dropdown)
 
-        scan_button = QPushButton("Scan for Devices")
-        scan_button.clicked.connect(self.scan_for_devices)
-        layout.addWidget(scan_button)
+        self.scan_button = QPushButton("Scan for Devices")
+        self.scan_button.clicked.connect(self.scan_for_devices)
+        layout.addWidget(self.scan_button)
 
         connect_button = QPushButton("Connect")
         connect_button.clicked.connect(self.connect_to_device)
@@ -70,87 +125,122 @@ class MainWindow(QMainWindow):
 
         return view
 
-    @asyncSlot()
     async def discover_devices(self):
         self.status_label.setText("Scanning for devices...")
-        devices = await BleakScanner.discover()
+        self.discovered_devices = {}
         self.device_dropdown.clear()
-        for device in devices:
-            self.device_dropdown.addItem(f"{device.name} ({device.address})", device.address)
-        self.status_label.setText("Select a device from the dropdown.")
+        self.is_scanning = True
+        self.scan_button.setText("Stop Scan")
+        try:
+            devices = await self.service.discover()
+        except Exception as e:
+            self.status_label.setText(f"Scan failed: {str(e)}")
+            return
+        finally:
+            self.is_scanning = False
+            self.scan_button.setText("Scan for Devices")
+        if devices:
+            self.status_label.setText("Select a device from the dropdown.")
+        else:
+            self.status_label.setText("No Smart mat found nearby.")
 
     def scan_for_devices(self):
-        self.discover_devices()
+        if self.service is None:
+            self.status_label.setText("Still starting up, try again in a moment.")
+        elif self.is_scanning:
+            self.service.cancel_discovery()
+        else:
+            self.tasks.spawn(self.discover_devices(), "scan")
+
+    def add_discovered_device(self, name, address, rssi):
+        # Entries stay ordered by RSSI; only a rank change moves an existing entry
+        self.discovered_devices[address] = rssi
+        ranked = sorted(self.discovered_devices, key=self.discovered_devices.get, reverse=True)
+        position = ranked.index(address)
+        text = f"{name} ({address}) {rssi} dBm"
+        index = self.device_dropdown.findData(address)
+        if index == position:
+            self.device_dropdown.setItemText(index, text)
+            return
+        selected = self.device_dropdown.currentData()
+        if index != -1:
+            self.device_dropdown.removeItem(index)
+        self.device_dropdown.insertItem(position, text, address)
+        if selected is not None:
+            self.device_dropdown.setCurrentIndex(self.device_dropdown.findData(selected))
+        if len(self.discovered_devices) == 1:
+            self.status_label.setText("Select a device from the dropdown.")
 
-    @asyncSlot()
     async def connect_to_selected_device(self, address):
-        self.status_label.setText(f"Connecting to {address}...")
-        try:
-            self.ble_client = BleakClient(address)
-            await self.ble_client.connect()
-            if self.ble_client.is_connected:
-                self.status_label.setText(f"Connected to {address}")
-                self.save_device(address)
-                characteristic_uuid = "0000ffe1-0000-1000-8000-00805f9b34fb"
-                try:
-                    await self.ble_client.start_notify(characteristic_uuid, self.handle_notification)
-                    self.status_label.setText("Notification subscription successful.")
-                except Exception as e:
-                    self.status_label.setText(f"Failed to subscribe to notifications: {str(e)}")
-                self.switch_view(0)
-        except Exception as e:
-            self.status_label.setText(f"Failed to connect: {str(e)}")
-            if self.ble_client:
-                await self.ble_client.disconnect()
-                self.ble_client = None
-
-    def handle_notification(self, sender, data):
-        try:
-            received_text = data.decode("utf-8")
-            self.status_label.setText(f"Received: {received_text}")
-            if received_text.isdigit() and int(received_text) > 0:
-                contribution = int(received_text)
-                self.current_contribution = contribution  # Update current_contribution
-                self.current_water_intake += contribution
-                self.update_water_progress()
-                self.save_water_data()
-                self.status_label.setText(f"Received {contribution} mL. Water intake updated.")
-                if self.is_timer_running:
-                    self.remaining_time = self.timer_duration
-                    self.timer_end_time = time.time() + self.remaining_time
-                    self.countdown_timer.start()
-                    self.timer_label.setText(self.format_time(self.remaining_time))
-        except Exception as e:
-            self.status_label.setText(f"Failed to process notification: {str(e)}")
+        if await self.service.connect(address):
+            self.switch_view(0)
+
+    def handle_service_event(self, event):
+        kind = event["type"]
+        if kind == "status":
+            self.status_label.setText(event["text"])
+        elif kind == "intake":
+            self.current_water_intake = event["total"]
+            self.current_contribution = event["contribution"]
+            self.update_water_progress()
+            if self.timeline is not None:
+                self.timeline.add_sips(event.get("new_sips", []))
+            if event["status"]:
+                self.status_label.setText(event["status"])
+            if event["sips"]:
+                self.reminders.sipped({sip[1] for sip in event.get("new_sips", [])} or {self.reminders.displayed})
+        elif kind == "state":
+            self.load_water_data(event)
+        elif kind == "device_found" and self.is_scanning:
+            self.add_discovered_device(event["name"], event["address"], event["rssi"])
+        elif kind == "connected":
+            self.reminders.connected(event["address"])
+        elif kind == "disconnected":
+            self.status_label.setText(f"Device {event['address']} disconnected.")
+            self.reminders.disconnected(event["address"])
 
     def disconnect_device(self):
-        if self.ble_client and self.ble_client.is_connected:
-            asyncio.create_task(self.ble_client.disconnect())
-            self.ble_client = None
+        if self.service.is_connected:
+            self.tasks.spawn(self.service.disconnect(), "connection")
             self.status_label.setText("Disconnected from device.")
             self.switch_view(-1)
 
+    def report_task_error(self, scope, error):
+        self.status_label.setText(f"Background {scope} task failed: {str(error)}")
+
     def closeEvent(self, event):
-        if self.ble_client and self.ble_client.is_connected:
-            asyncio.create_task(self.ble_client.disconnect())
-        super().closeEvent(event)
+        # The window goes away at once; the process exits when shutdown() is done
+        if self.ready_to_close:
+            super().closeEvent(event)
+            return
+        event.ignore()
+        if self.shutdown_task is None:
+            self.hide()
+            self.shutdown_task = asyncio.ensure_future(self.shutdown())
+
+    async def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            self.reminders.reset()
+            await self.tasks.shutdown(time_left(deadline))
+            if self.service is not None:
+                await self.service.shutdown(time_left(deadline))
+        finally:
+            self.metrics.stop()
+            self.ready_to_close = True
+            self.close()
 
-    @asyncSlot()
     async def send_text(self, address, text):
         if not self.is_valid_address(address):
             self.status_label.setText("Invalid device address.")
             return
-        if not self.ble_client or not self.ble_client.is_connected:
-            self.status_label.setText("Device is not connected.")
-            return
-        try:
-            characteristic_uuid = "0000ffe1-0000-1000-8000-00805f9b34fb"
-            await self.ble_client.write_gatt_char(characteristic_uuid, text.encode())
-            self.status_label.setText(f"Sent: {text}")
-        except Exception as e:
-            self.status_label.setText(f"Failed to send text: {str(e)}")
+        # A mat that is reconnecting gets the text once it is back
+        await self.service.send_text(text)
 
     def connect_to_device(self):
+        if self.service is None:
+            self.status_label.setText("Still starting up, try again in a moment.")
+            return
         selected_index = self.device_dropdown.currentIndex()
         if selected_index == -1:
             self.status_label.setText("No device selected.")
@@ -159,7 +249,9 @@ class MainWindow(QMainWindow):
         if not address:
             self.status_label.setText("Invalid device address.")
             return
-        self.connect_to_selected_device(address)
+        if self.is_scanning:
+            self.service.cancel_discovery()
+        self.tasks.spawn(self.connect_to_selected_device(address), "connection")
 
     def create_view_1(self):
         view = QWidget()
@@ -172,7 +264,7 @@ class MainWindow(QMainWindow):
 
         self.pause_play_button = QPushButton()
         self.pause_play_button.setObjectName("pause_play_button")
-        self.pause_play_button.setIcon(QIcon(os.path.join(os.path.dirname(__file__), "icons", "play.png")))
+        self.pause_play_button.setIcon(self.assets.icon("play.png"))
         self.pause_play_button.setIconSize(QSize(26, 26))
         self.pause_play_button.setFixedSize(64, 64)
         self.pause_play_button.clicked.connect(self.toggle_timer)
@@ -191,17 +283,31 @@ class MainWindow(QMainWindow):
 
         layout.addLayout(progress_layout)
 
-        icons_path = os.path.join(os.path.dirname(__file__), "icons")
+        # numpy comes in with the chart, so only once this view is first shown
+        from timeline import IntakeTimeline
+
+        self.timeline = IntakeTimeline()
+        self.timeline.set_goal(self.daily_goal)
+        layout.addWidget(self.timeline)
+
+        range_layout = QHBoxLayout()
+        for text, span in TIMELINE_RANGES:
+            button = QPushButton(text)
+            button.clicked.connect(lambda _, span=span: self.timeline.show_range(span))
+            range_layout.addWidget(button)
+        layout.addLayout(range_layout)
+        self.tasks.spawn(self.load_timeline(), "timeline")
+
         services = [
-            ("Reset", os.path.join(icons_path, "reset.png"), "Reset Message"),
-            ("Daily Intake", os.path.join(icons_path, "water.png"), "Daily Intake Message"),
-            ("Settings", os.path.join(icons_path, "clock.png"), None),
+            ("Reset", "reset.png", "Reset Message"),
+            ("Daily Intake", "water.png", "Daily Intake Message"),
+            ("Settings", "clock.png", None),
         ]
 
         grid = QGridLayout()
-        for i, (text, icon_path, message) in enumerate(services):
+        for i, (text, icon_name, message) in enumerate(services):
             button = QPushButton()
-            button.setIcon(QIcon(icon_path))
+            button.setIcon(self.assets.icon(icon_name))
             button.setIconSize(QSize(64, 64))
             button.setText(text)
             if text == "Reset":
@@ -220,20 +326,38 @@ class MainWindow(QMainWindow):
 
         layout.addLayout(grid)
         layout.setAlignment(Qt.AlignTop)
+        self.update_water_progress()
         return view
 
+    async def load_timeline(self):
+        if self.service is None:
+            return
+        from timeline import MAX_SPAN
+
+        # As far back as the chart can zoom out
+        since = time.time() - MAX_SPAN
+        try:
+            events = await self.service.events(since)
+        except Exception as e:
+            self.status_label.setText(f"Could not load intake history: {str(e)}")
+            return
+        self.timeline.set_events(events)
+
     def calculate_percentage(self):
         if self.daily_goal == 0:
             return 0
         return int((self.current_water_intake / self.daily_goal) * 100)
 
     def update_water_progress(self):
+        if self.water_progress is None:
+            return
         self.water_progress.setValue(self.current_water_intake)
         self.water_progress.setFormat(f"{self.current_water_intake} / {self.daily_goal} mL")
         self.percentage_label.setText(f"{self.calculate_percentage()}%")
+        if self.timeline is not None:
+            self.timeline.set_goal(self.daily_goal)
 
     def set_daily_goal(self):
-        self.load_water_data()
         new_goal, ok = QInputDialog.getInt(
             self,
             "Set Daily Goal",
@@ -249,52 +373,32 @@ class MainWindow(QMainWindow):
             self.save_water_data()
             self.status_label.setText(f"Daily goal set to {self.daily_goal} mL.")
 
-    def load_water_data(self):
-        try:
-            if not os.path.exists("data.json"):
-                self.save_water_data()
-                return
-            with open("data.json", "r") as file:
-                data = json.load(file)
-                saved_date = data.get("date", None)
-                current_date = datetime.date.today().isoformat()
-                if saved_date != current_date:
-                    self.current_water_intake = 0
-                else:
-                    self.current_water_intake = data.get("current_water_intake", self.current_water_intake)
-                self.daily_goal = data.get("daily_goal", self.daily_goal)
-                self.timer_duration = data.get("timer_duration", self.timer_duration)
-                self.remaining_time = self.timer_duration
-                self.water_progress.setRange(0, self.daily_goal)
-                self.water_progress.setValue(self.current_water_intake)
-                self.update_water_progress()
+    def load_water_data(self, state=None):
+        state = state or self.service.state()
+        self.current_water_intake = state["total"]
+        self.daily_goal = state["daily_goal"]
+        self.timer_duration = state["timer_duration"]
+        self.reminders.duration = self.timer_duration
+        if not self.is_timer_running:
+            self.remaining_time = self.timer_duration
+            if self.timer_label is not None:
                 self.timer_label.setText(self.format_time(self.remaining_time))
-        except Exception as e:
-            print(f"Failed to load water data: {str(e)}")
+        if self.water_progress is not None:
+            self.water_progress.setRange(0, self.daily_goal)
+        self.update_water_progress()
 
     def save_water_data(self):
-        try:
-            data = {}
-            if os.path.exists("data.json"):
-                with open("data.json", "r") as file:
-                    data = json.load(file)
-            data["daily_goal"] = self.daily_goal
-            data["current_water_intake"] = self.current_water_intake
-            data["timer_duration"] = self.timer_duration
-            data["date"] = datetime.date.today().isoformat()
-            with open("data.json", "w") as file:
-                json.dump(data, file, indent=4)
-        except Exception as e:
-            print(f"Failed to save water data: {str(e)}")
+        self.service.update_settings(daily_goal=self.daily_goal, timer_duration=self.timer_duration)
 
     def send_serial_message(self, message):
-        if not self.saved_device:
+        saved_device = self.service.saved_device
+        if not saved_device:
             self.status_label.setText("No device connected.")
             return
-        if not self.is_valid_address(self.saved_device):
+        if not self.is_valid_address(saved_device):
             self.status_label.setText("Invalid saved device address.")
             return
-        asyncio.create_task(self.send_text(self.saved_device, message))
+        self.tasks.spawn(self.send_text(saved_device, message), "send")
 
     def timer_action(self):
         self.status_label.setText("Timer service selected.")
@@ -307,11 +411,10 @@ class MainWindow(QMainWindow):
 
     def reset_action(self):
         self.remaining_time = self.timer_duration
-        self.timer_end_time = None
+        self.reminders.reset()
         self.timer_label.setText(self.format_time(self.remaining_time))
-        self.countdown_timer.stop()
         self.is_timer_running = False
-        self.pause_play_button.setIcon(QIcon(os.path.join(os.path.dirname(__file__), "icons", "play.png")))
+        self.pause_play_button.setIcon(self.assets.icon("play.png"))
         self.status_label.setText("Timer reset.")
 
     def is_valid_address(self, address):
@@ -394,6 +497,7 @@ class MainWindow(QMainWindow):
                 raise ValueError("Invalid time values.")
             self.timer_duration = hours * 3600 + minutes * 60 + seconds
             self.remaining_time = self.timer_duration
+            self.reminders.set_duration(self.timer_duration)
             self.timer_label.setText(self.format_time(self.remaining_time))
             self.status_label.setText("Timer duration updated.")
             self.save_water_data()
@@ -402,36 +506,39 @@ class MainWindow(QMainWindow):
 
     def start_timer(self):
         if self.remaining_time > 0:
-            self.timer_end_time = time.time() + self.remaining_time + 1
-            self.countdown_timer.start()
+            # Every connected mat gets a countdown; the saved one is shown
+            devices = self.service.state()["devices"] if self.service is not None else {}
+            addresses = [address for address, device in devices.items() if device["connected"]]
+            self.reminders.start(addresses, self.remaining_time, self.service.saved_device if self.service is not None else None)
             self.timer_label.setText(self.format_time(self.remaining_time))
             self.status_label.setText("Timer started.")
         else:
             self.status_label.setText("Set a valid timer duration before starting.")
 
-    def update_timer(self):
-        if self.timer_end_time:
-            self.remaining_time = max(0, int(self.timer_end_time - time.time()))
-            self.timer_label.setText(self.format_time(self.remaining_time))
-            if self.remaining_time == 0:
-                self.countdown_timer.stop()
-                self.timer_label.setText("00:00:00")
-                self.status_label.setText("Time's up!")
-                self.play_alarm()  # Play alarm when timer ends
-                self.pause_play_button.setIcon(QIcon(os.path.join(os.path.dirname(__file__), "icons", "play.png")))  # Set play icon
-                self.is_timer_running = False  # Ensure timer is marked as not running
-        else:
-            self.countdown_timer.stop()
-            self.status_label.setText("Timer not running.")
+    def pause_timer(self):
+        remaining = self.reminders.pause()
+        if remaining is not None:
+            self.remaining_time = remaining
+
+    def update_timer(self, remaining_time):
+        self.remaining_time = remaining_time
+        self.timer_label.setText(self.format_time(self.remaining_time))
+
+    def timer_expired(self, address=None):
+        if self.timeline is not None:
+            self.timeline.add_reminder(time.time())
+        self.status_label.setText("Time's up!" if address is None else f"Time's up for {address}!")
+        self.play_alarm()  # Play alarm when timer ends
+        if not self.reminders.running:
+            self.remaining_time = 0
+            self.timer_label.setText("00:00:00")
+            self.pause_play_button.setIcon(self.assets.icon("play.png"))  # Set play icon
+            self.is_timer_running = False  # Ensure timer is marked as not running
 
     def play_alarm(self):
-        alarm_sound_path = os.path.join(os.path.dirname(__file__), "alarm.wav")
-        if os.path.exists(alarm_sound_path):
-            self.alarm_sound = QSoundEffect(self)
-            self.alarm_sound.setSource(QUrl.fromLocalFile(alarm_sound_path))
-            self.alarm_sound.setLoopCount(1)  # Play the sound only once
-            self.alarm_sound.setVolume(0.5)  # Set volume (0.0 to 1.0)
-            self.alarm_sound.play()
+        alarm_sound = self.assets.sound("alarm.wav", self)
+        if alarm_sound is not None:
+            alarm_sound.play()
         else:
             self.status_label.setText("Alarm sound file not found.")
 
@@ -441,61 +548,45 @@ class MainWindow(QMainWindow):
         seconds = seconds % 60
         return f"{hours:02}:{minutes:02}:{seconds:02}"
 
-    def save_device(self, address):
-        try:
-            data = {}
-            if os.path.exists("data.json"):
-                with open("data.json", "r") as file:
-                    data = json.load(file)
-            data["address"] = address
-            with open("data.json", "w") as file:
-                json.dump(data, file, indent=4)
-        except Exception as e:
-            self.status_label.setText(f"Failed to save device: {str(e)}")
-
-    def load_saved_device(self):
-        try:
-            with open("data.json", "r") as file:
-                data = json.load(file)
-                return data.get("address")
-        except FileNotFoundError:
-            return None
-        except Exception as e:
-            self.status_label.setText(f"Failed to load device: {str(e)}")
-            return None
-
     def forget_device(self):
-        try:
-            if os.path.exists("data.json"):
-                with open("data.json", "r") as file:
-                    data = json.load(file)
-                data.pop("address", None)
-                with open("data.json", "w") as file:
-                    json.dump(data, file)
-                self.saved_device = None
-                self.status_label.setText("Device forgotten.")
-                self.switch_view(-1)
-            else:
-                self.status_label.setText("No device to forget.")
-        except Exception as e:
-            self.status_label.setText(f"Failed to forget device: {str(e)}")
+        if self.service.forget_device():
+            self.status_label.setText("Device forgotten.")
+            self.switch_view(-1)
+        else:
+            self.status_label.setText("No device to forget.")
 
     async def auto_connect_to_saved_device(self):
-        if self.saved_device:
-            if not self.is_valid_address(self.saved_device):
+        if self.service.is_connected:
+            # Attached to a service that already holds the link
+            self.switch_view(0)
+            return
+        saved_device = self.service.saved_device
+        if saved_device:
+            if not self.is_valid_address(saved_device):
                 self.status_label.setText("Invalid saved device address.")
                 return
-            self.status_label.setText(f"Auto-connecting to {self.saved_device}...")
-            await self.connect_to_selected_device(self.saved_device)
+            self.status_label.setText(f"Auto-connecting to {saved_device}...")
+            if await self.service.connect_saved():
+                self.switch_view(0)
+
+    def ensure_view(self, stack_index):
+        builder = self.view_builders.pop(stack_index, None)
+        if builder is None:
+            return
+        placeholder = self.stacked_widget.widget(stack_index)
+        self.stacked_widget.insertWidget(stack_index, builder())
+        self.stacked_widget.removeWidget(placeholder)
+        placeholder.deleteLater()
 
     def switch_view(self, index):
+        self.ensure_view(index + 1)
         self.stacked_widget.setCurrentIndex(index + 1)
         if index == 1:
             self.set_timer_dropdown_values()
 
     def toggle_timer(self):
         if self.is_timer_running:
-            self.countdown_timer.stop()
+            self.pause_timer()
             self.animate_icon_transition("pause.png", "play.png")
             self.status_label.setText("Timer paused.")
         else:
@@ -514,33 +605,45 @@ class MainWindow(QMainWindow):
         self.animation.setEndValue(self.pause_play_button.geometry())
         self.animation.start()
 
-        self.animation.finished.connect(lambda: self.pause_play_button.setIcon(
-            QIcon(os.path.join(os.path.dirname(__file__), "icons", to_icon))
-        ))
+        self.animation.finished.connect(lambda: self.pause_play_button.setIcon(self.assets.icon(to_icon)))
 
 
-if __name__ == "__main__":
-    app = QApplication([])
-
-    app.setStyleSheet("QMainWindow { background-color: #e8eaf6; }")
-
-    loop = QEventLoop(app)
-    asyncio.set_event_loop(loop)
-
+def apply_style(app):
     try:
         qss_path = os.path.join(os.path.dirname(__file__), "style.qss")
         with open(qss_path, "r") as file:
             app.setStyleSheet(file.read())
     except FileNotFoundError:
         print("QSS file not found. Using default styles.")
+        app.setStyleSheet("QMainWindow { background-color: #e8eaf6; }")
+
+
+async def open_service():
+    try:
+        return await RemoteMatService.attach()
+    except (OSError, asyncio.TimeoutError):
+        # The BLE stack is only imported when this process has to own the link itself
+        from mat_service import MatService
+        return MatService(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    app = QApplication([])
+    apply_style(app)
+
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
 
     window = MainWindow()
+    window.first_frame.connect(window.start)
     window.show()
+    if window.isMinimized():
+        # A minimized window does not paint until restored, so start right away
+        QTimer.singleShot(0, window.start)
 
-    def start_auto_connect():
-        asyncio.run_coroutine_threadsafe(window.auto_connect_to_saved_device(), loop)
+    with loop:
+        loop.run_forever()
 
-    QTimer.singleShot(0, start_auto_connect)
 
-    with loop:
-        loop.run_forever()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+import asyncio
+import datetime
+import functools
+import os
+import time
+from journal import IntakeJournal, day_bounds
+from settings_store import SettingsStore
+from ingest import IngestPipeline
+from connection_manager import ConnectionManager
+from reconnect import ReconnectSupervisor
+from discovery import StreamingDiscovery
+from protocol import FrameParser, Text, FRAME_SIP, FRAME_RAW, FRAME_BACKLOG, MODE_RAW, MODE_SIP, sync_command
+from instrumentation import Instrumentation
+from fleet import FleetClient
+from capture import CaptureRecorder
+from supervisor import TaskSupervisor, SHUTDOWN_TIMEOUT, time_left, until
+
+DEFAULT_DAILY_GOAL = 2500  # Milliliters
+DEFAULT_TIMER_DURATION = 45 * 60  # Seconds
+TASK_LIMITS = {"commands": 8, "ipc": 32}  # Concurrent tasks per scope
+RAW_KEEPALIVE = 10.0  # Seconds between MODE RAW repeats; the firmware gives up after 30
+LEAVE_RAW_TIMEOUT = 1.0  # Seconds a disconnect waits for mats to take MODE SIP
+
+
+class MatService:
+    # Owns the BLE connections, notification parsing and persistence without any Qt
+    # dependency. The GUI and the headless daemon both drive it; state changes are
+    # published to subscribers as plain dict events.
+
+    def __init__(self, data_dir, metrics=None, fleet=None, capture=None):
+        # metrics, fleet and capture follow their environment opt-ins unless given;
+        # fleet=False keeps this instance from pushing anywhere
+        self.metrics = metrics or Instrumentation.from_environment("service")
+        self.tasks = TaskSupervisor(self.report_task_error, TASK_LIMITS)
+        self.settings = SettingsStore(os.path.join(data_dir, "data.json"), legacy_path="data.json")
+        self.journal = IntakeJournal(os.path.join(data_dir, "intake.db"))
+        self.ingest = IngestPipeline(
+            self.metrics.timed_packets(self.apply_notification),
+            self.metrics.timed("persist", self.persist_intake),
+            self.metrics.timed("ui", self.publish_intake),
+        )
+        self.capture = capture or CaptureRecorder.from_environment()
+        self.manager = ConnectionManager(self.capture.recording(self.ingest.push), self.handle_disconnect)
+        self.reconnector = ReconnectSupervisor(self.connect, self.status, spawn=functools.partial(self.tasks.spawn, scope="reconnect"))
+        self.discovery = None
+        self.analytics = None
+        self.fallback_parser = FrameParser()
+        self.fallback_detector = None
+        self.backlogs = {}  # address -> [(frame, received)] replayed but not yet applied
+        # address -> last backlog seq journaled. Live frames leave it alone: one that
+        # overtakes sips still buffered on the mat must not skip them on the next SYNC.
+        self.acked = dict(self.settings.get("acked", {}))
+        self.acked_changed = False
+        self.writes = set()  # append_many futures not yet committed
+        self.unpersisted = set()  # (address, seq, mat_time) of sips in those batches
+        self.listeners = []
+        self.current_contribution = 0
+        self.sips_since_publish = 0
+        self.new_sips = []  # [ts, address, amount] for the timeline, sent with the next publish
+        self.last_notification_status = None
+        self.migrate_legacy_intake()
+        self.today = datetime.date.today()
+        self.current_water_intake = self.journal.total_for_day()
+        self.device_totals = self.journal.totals_by_address()
+        self.rollover_handle = None
+        self.schedule_rollover()
+        self.fleet = FleetClient.from_environment() if fleet is None else fleet or None
+        if self.fleet is not None:
+            self.fleet.start()
+        self.metrics.collect(self.collect_metrics)
+        self.metrics.start()
+
+    def migrate_legacy_intake(self):
+        saved_date = self.settings.get("date")
+        legacy_intake = self.settings.get("current_water_intake", 0)
+        if saved_date == datetime.date.today().isoformat() and legacy_intake > 0 and self.journal.is_empty():
+            # Carry over today's total from the pre-journal data.json format
+            self.journal.append(legacy_intake, self.settings.get("address"))
+        self.settings.pop("current_water_intake")
+
+    @property
+    def saved_device(self):
+        return self.settings.get("address")
+
+    @property
+    def saved_devices(self):
+        devices = list(self.settings.get("devices", []))
+        if self.saved_device and self.saved_device not in devices:
+            devices.insert(0, self.saved_device)
+        return devices
+
+    @property
+    def is_connected(self):
+        return bool(self.manager.connected())
+
+    def state(self):
+        return {
+            "type": "state",
+            "address": self.saved_device,
+            "connected": self.is_connected,
+            "total": self.current_water_intake,
+            "contribution": self.current_contribution,
+            "daily_goal": self.settings.get("daily_goal", DEFAULT_DAILY_GOAL),
+            "timer_duration": self.settings.get("timer_duration", DEFAULT_TIMER_DURATION),
+            "devices": self.manager.state(),
+            "reconnect": self.reconnector.metrics(),
+        }
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        return lambda: self.listeners.remove(listener) if listener in self.listeners else None
+
+    def emit(self, event):
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Listener failed on {event.get('type')} event: {str(e)}")
+
+    def status(self, text):
+        self.emit({"type": "status", "text": text})
+
+    def schedule_rollover(self):
+        # Wakes just after midnight; record_sips checks as well in case the loop was
+        # suspended past it
+        midnight = day_bounds(datetime.date.today())[1]
+        self.rollover_handle = asyncio.get_event_loop().call_later(max(1.0, midnight - time.time() + 1), self.rollover)
+
+    def rollover(self):
+        self.check_day()
+        self.schedule_rollover()
+
+    def check_day(self):
+        # Today's totals restart from the journal once the date changes
+        today = datetime.date.today()
+        if today == self.today:
+            return
+        self.today = today
+        self.current_water_intake = self.journal.total_for_day(today)
+        self.device_totals = self.journal.totals_by_address(today)
+        self.current_contribution = 0
+        for address, session in self.manager.sessions.items():
+            session.total = self.device_totals.get(address, 0)
+            session.contribution = 0
+            session.sips = 0
+        self.emit(self.state())
+
+    def report_task_error(self, scope, error):
+        self.metrics.inc("task_failures")
+        self.status(f"Background {scope} task failed: {str(error)}")
+
+    def update_settings(self, **values):
+        self.settings.update(date=datetime.date.today().isoformat(), **values)
+        if "stream_raw" in values:
+            for session in self.manager.connected():
+                self.tasks.spawn(self.set_stream_mode(session.address, values["stream_raw"]), "commands")
+            if values["stream_raw"]:
+                self.keep_raw_mode()
+        self.emit(self.state())
+
+    async def set_stream_mode(self, address, raw):
+        # Raw mode moves sip detection from the mat's blocking loop onto the host
+        try:
+            await self.manager.send(address, MODE_RAW if raw else MODE_SIP, kind="mode")
+        except Exception as e:
+            self.metrics.inc("failed_writes")
+            self.status(f"Failed to switch {address} to {'raw' if raw else 'sip'} mode: {str(e)}")
+            return False
+        return True
+
+    def keep_raw_mode(self):
+        if not self.tasks.tasks("keepalive"):
+            self.tasks.spawn(self.raw_keepalive(), "keepalive")
+
+    async def raw_keepalive(self):
+        # A mat falls back to sip mode once the host goes quiet, so one left behind by
+        # a crash buffers its sips for the next SYNC instead of streaming them to nobody
+        while self.settings.get("stream_raw"):
+            await asyncio.sleep(RAW_KEEPALIVE)
+            if not self.settings.get("stream_raw"):
+                break
+            for session in self.manager.connected():
+                self.tasks.spawn(self.set_stream_mode(session.address, True), "commands")
+
+    async def leave_raw_mode(self, address=None):
+        # Mats stop streaming samples before the host stops listening
+        if not self.settings.get("stream_raw"):
+            return
+        sessions = self.manager.connected()
+        addresses = [session.address for session in sessions if address is None or session.address == address]
+        await asyncio.gather(*(self.set_stream_mode(address, False) for address in addresses))
+
+    def forget_device(self, address=None):
+        address = address or self.saved_device
+        devices = [device for device in self.saved_devices if device != address]
+        forgotten = address is not None and address in self.saved_devices
+        if address is not None:
+            self.reconnector.cancel(address)
+            session = self.manager.get(address)
+            if session is not None:
+                session.commands.cancel()
+        if forgotten:
+            self.settings.update(devices=devices)
+            if self.saved_device == address:
+                self.settings.pop("address")
+                if devices:
+                    self.settings.update(address=devices[0])
+            self.emit(self.state())
+        return forgotten
+
+    async def discover(self):
+        self.cancel_discovery()
+        self.status("Scanning for devices...")
+        discovery = self.discovery = StreamingDiscovery(self.device_found, self.saved_devices)
+        try:
+            return await discovery.run()
+        finally:
+            if self.discovery is discovery:
+                self.discovery = None
+
+    def device_found(self, name, address, rssi):
+        self.emit({"type": "device_found", "name": name, "address": address, "rssi": rssi})
+
+    def cancel_discovery(self):
+        if self.discovery is not None:
+            self.discovery.cancel()
+
+    async def connect(self, address, device=None):
+        self.status(f"Connecting to {address}...")
+        session = self.manager.session(address, self.device_totals.get(address, 0))
+        try:
+            await self.manager.connect(address, device)
+        except Exception as e:
+            self.metrics.inc("connect_failures")
+            self.status(f"Failed to connect: {str(e)}")
+            await self.manager.disconnect(address)
+            return False
+        if not session.is_connected:
+            self.metrics.inc("connect_failures")
+            return False
+        self.metrics.inc("connects")
+        self.status(f"Connected to {address}")
+        devices = self.saved_devices
+        if address not in devices:
+            devices.append(address)
+        self.settings.update(address=address, devices=devices)
+        try:
+            await self.manager.start_notify(session)
+            self.status("Notification subscription successful.")
+        except Exception as e:
+            self.status(f"Failed to subscribe to notifications: {str(e)}")
+        if self.settings.get("stream_raw"):
+            await self.set_stream_mode(address, True)
+            self.keep_raw_mode()
+        await self.request_backlog(address, self.acked.get(address))
+        self.emit({"type": "connected", "address": address})
+        return True
+
+    async def connect_saved(self):
+        # Every saved mat is connected concurrently on this loop. One that is out of
+        # range is left to the reconnector, which keeps scanning for it.
+        addresses = self.saved_devices
+        results = await asyncio.gather(*(self.connect(address) for address in addresses))
+        for address, connected in zip(addresses, results):
+            if not connected:
+                self.reconnector.watch(address)
+        return any(results)
+
+    async def disconnect(self, address=None):
+        self.reconnector.cancel(address)
+        await until(asyncio.get_running_loop().time() + LEAVE_RAW_TIMEOUT, self.leave_raw_mode(address))
+        if await self.manager.disconnect(address):
+            self.status("Disconnected from device.")
+
+    def handle_disconnect(self, address, unexpected):
+        self.metrics.inc("unexpected_disconnects" if unexpected else "disconnects")
+        if self.backlogs.get(address):
+            # The end of the backlog never arrived; keep the sips that did
+            session = self.manager.get(address)
+            parser = session.parser if session is not None else self.fallback_parser
+            events = self.record_sips(address, session, self.finish_backlog(address, parser, None, None))
+            if events:
+                self.ingest.persist(events)
+                self.ingest.schedule_refresh()
+        self.emit({"type": "disconnected", "address": address})
+        if unexpected and address in self.saved_devices:
+            self.reconnector.watch(address)
+
+    async def send_text(self, text, address=None):
+        address = address or self.saved_device
+        if address is None:
+            self.metrics.inc("failed_writes")
+            self.status("Device is not connected.")
+            return False
+        # Lines are what the mat parses, and what lets several share one write
+        sent = self.manager.send(address, text.encode() + b"\n", response=True)
+        if not self.manager.session(address).is_connected:
+            # Kept for the reconnect instead of failing outright
+            self.status(f"Queued until {address} reconnects: {text}")
+            sent.add_done_callback(lambda future: self.report_sent(text, future))
+            return False
+        try:
+            await sent
+        except Exception:
+            pass
+        return self.report_sent(text, sent)
+
+    def report_sent(self, text, future):
+        if future.cancelled() or future.exception() is not None:
+            self.metrics.inc("failed_writes")
+            error = "cancelled" if future.cancelled() else str(future.exception())
+            self.status(f"Failed to send text: {error}")
+            return False
+        self.status(f"Sent: {text}")
+        return True
+
+    async def request_backlog(self, address, after=None):
+        # Sips the mat buffered while nobody was listening come back as FRAME_BACKLOG
+        try:
+            await self.manager.send(address, sync_command(after), kind="sync")
+        except Exception as e:
+            self.metrics.inc("failed_writes")
+            self.status(f"Failed to request buffered sips from {address}: {str(e)}")
+
+    def apply_notification(self, ts, address, data):
+        session = self.manager.get(address)
+        parser = session.parser if session is not None else self.fallback_parser
+        events = []
+        try:
+            items = parser.feed(data)
+        except Exception as e:
+            self.last_notification_status = f"Failed to process notification: {str(e)}"
+            return events
+        for item in items:
+            if isinstance(item, Text):
+                self.last_notification_status = f"Received: {item.text}"
+                continue
+            if item.type == FRAME_SIP:
+                sip_time = parser.host_time(item, ts)
+                # Only single-sip frames have an origin that identifies one sip
+                origin = (item.seq, item.mat_time) if len(item.readings) == 1 else (None, None)
+                sips = [(sip_time, contribution, origin, True) for contribution in item.readings]
+            elif item.type == FRAME_RAW:
+                sips = [
+                    (sip_time, contribution, (None, None), True)
+                    for sip_time, contribution in self.detector_for(session).sips(item, parser.host_time(item, ts))
+                ]
+            elif item.type == FRAME_BACKLOG:
+                if item.readings:
+                    self.backlogs.setdefault(address, []).append((item, ts))
+                    continue
+                sips = self.finish_backlog(address, parser, item, ts)
+            else:
+                continue
+            self.record_sips(address, session, sips, events)
+        return events
+
+    def record_sips(self, address, session, sips, events=None):
+        # sips: (sip_time, contribution, (seq, mat_time), counts_today)
+        events = [] if events is None else events
+        self.check_day()
+        for sip_time, contribution, origin, counts_today in sips:
+            if contribution <= 0:
+                continue
+            events.append((sip_time, address, contribution, *origin))
+            self.new_sips.append([sip_time, address, contribution])
+            if not counts_today:
+                continue
+            if session is not None:
+                session.record(sip_time, contribution)
+            self.current_contribution = contribution
+            self.current_water_intake += contribution
+            self.sips_since_publish += 1
+            self.last_notification_status = f"Received {contribution} mL. Water intake updated."
+        return events
+
+    def finish_backlog(self, address, parser, end, received):
+        # Applies the replayed sips at once. The end frame carries the mat's clock at the
+        # time of the reply, which anchors the mapping even for sips from hours ago.
+        entries = self.backlogs.pop(address, [])
+        if end is not None:
+            parser.host_time(end, received)
+        seen = self.journal.known_origins(address, [(frame.seq, frame.mat_time) for frame, _ in entries])
+        seen.update(parser.recent_times.items())  # Live frames not yet persisted
+        seen.update(origin[1:] for origin in self.unpersisted if origin[0] == address)
+        day_start = day_bounds(datetime.date.today())[0]
+        sips = []
+        for frame, frame_received in entries:
+            origin = (frame.seq, frame.mat_time)
+            if origin in seen:
+                continue
+            seen.add(origin)
+            sip_time = parser.host_time(frame, frame_received)
+            # Sips from an earlier day are journaled but are not part of today's total
+            sips.append((sip_time, frame.readings[0], origin, sip_time >= day_start))
+        if entries:
+            self.acknowledge(address, entries[-1][0].seq)
+            self.last_notification_status = f"Caught up on {len(sips)} buffered sips from {address}."
+        return sips
+
+    def acknowledge(self, address, seq):
+        if self.acked.get(address) != seq:
+            self.acked[address] = seq
+            self.acked_changed = True
+
+    def detector_for(self, session):
+        # numpy is only imported once a mat actually streams raw samples
+        from sip_detection import SipDetector
+
+        if session is None:
+            if self.fallback_detector is None:
+                self.fallback_detector = SipDetector()
+            return self.fallback_detector
+        if session.detector is None:
+            session.detector = SipDetector()
+        return session.detector
+
+    def persist_intake(self, events):
+        # The commit and snapshot run on the journal's writer thread, so a GUI hosting
+        # the service never waits on SQLite. Batches commit in the order they come.
+        if self.analytics is not None:
+            self.analytics.add_many(events)
+        origins = {(event[1], *event[3:5]) for event in events if len(event) > 3 and event[3] is not None}
+        self.unpersisted |= origins
+        future = asyncio.get_event_loop().run_in_executor(self.journal.writer, self.journal.append_many, events)
+        self.writes.add(future)
+        future.add_done_callback(functools.partial(self.persisted, events, origins))
+
+    def persisted(self, events, origins, future):
+        self.writes.discard(future)
+        self.unpersisted -= origins
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.metrics.inc("persist_failures")
+            self.status(f"Failed to save intake: {str(error)}")
+            return
+        if self.fleet is not None:
+            self.fleet.push(events)
+        if self.acked_changed:
+            # Acknowledged only once the sips are committed
+            self.acked_changed = False
+            self.settings.update(acked=dict(self.acked))
+
+    async def wait_persisted(self):
+        # Until every batch handed to the journal so far is committed
+        while self.writes:
+            await asyncio.wait(set(self.writes))
+
+    def get_analytics(self):
+        # Built from the full journal on first use, then kept current by persist_intake
+        if self.analytics is None:
+            from analytics import IntakeAnalytics
+            self.analytics = IntakeAnalytics.from_journal(self.journal)
+        return self.analytics
+
+    def summary(self, address=None, days=7):
+        goal = self.settings.get("daily_goal", DEFAULT_DAILY_GOAL)
+        return self.get_analytics().summary(goal, address, days)
+
+    async def events(self, since=None, until=None, address=None):
+        # Journaled sips as [ts, address, amount], read off the event loop
+        rows = await asyncio.get_event_loop().run_in_executor(None, self.journal.events, since, until, address)
+        return [list(row) for row in rows]
+
+    def collect_metrics(self):
+        reconnect = self.reconnector.metrics()
+        links = [session.parser.stats() for session in self.manager.sessions.values()]
+        return {
+            "reconnects_total": reconnect["reconnects"],
+            "reconnect_failed_attempts_total": reconnect["failed_attempts"],
+            "connected_mats": len(self.manager.connected()),
+            "queued_packets": len(self.ingest.packets),
+            "frames_total": sum(link["frames"] for link in links),
+            "frame_gaps_total": sum(link["gaps"] for link in links),
+            "frame_errors_total": sum(link["errors"] for link in links),
+            "background_tasks": sum(self.tasks.stats().values()),
+            "task_failures_total": self.tasks.failures,
+            **({"fleet_buffered_events": self.fleet.stats()["buffered"]} if self.fleet is not None else {}),
+        }
+
+    def publish_intake(self):
+        sips, self.sips_since_publish = self.sips_since_publish, 0
+        status, self.last_notification_status = self.last_notification_status, None
+        new_sips, self.new_sips = self.new_sips, []
+        if not sips and not new_sips and status is None:
+            # Raw sample frames that completed no sip leave nothing to redraw
+            return
+        self.emit({
+            "type": "intake",
+            "total": self.current_water_intake,
+            "contribution": self.current_contribution,
+            "sips": sips,
+            "new_sips": new_sips,
+            "status": status,
+            "devices": {address: session.total for address, session in self.manager.sessions.items()},
+        })
+
+    async def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        # Steps that can lose data go first and each gets what is left of one deadline,
+        # so a mat that never answers cannot hold the exit up
+        deadline = asyncio.get_running_loop().time() + timeout
+        self.tasks.closing = True
+        self.cancel_discovery()
+        self.reconnector.cancel()
+        self.tasks.cancel("reconnect")
+        self.tasks.cancel("keepalive")
+        self.ingest.flush()
+        await until(deadline, self.wait_persisted())
+        await until(deadline, self.leave_raw_mode())
+        writes = [session.commands.task for session in self.manager.connected() if session.commands.task is not None]
+        if writes:
+            await asyncio.wait(writes, timeout=time_left(deadline))
+        # A link that hangs on disconnect must not cost the fleet its last events
+        await asyncio.gather(
+            until(deadline, self.manager.disconnect()),
+            until(deadline, self.fleet.flush()) if self.fleet is not None else asyncio.sleep(0),
+        )
+        await self.tasks.shutdown(time_left(deadline))
+        self.close()
+
+    def close(self):
+        # Releases files and handles; shutdown() first for a graceful exit
+        if self.rollover_handle is not None:
+            self.rollover_handle.cancel()
+        self.cancel_discovery()
+        self.reconnector.cancel()
+        self.tasks.closing = True
+        self.tasks.cancel()
+        self.ingest.flush()
+        if self.fleet is not None:
+            self.fleet.close()
+        self.journal.close()
+        if self.acked_changed:
+            # Whatever was still queued is committed by now
+            self.settings.update(acked=dict(self.acked))
+        self.capture.close()
+        self.settings.close()
+        self.metrics.stop()
@@ -0,0 +1,221 @@
+import collections
+import struct
+
+# Binary frames on the FFE1 characteristic, little endian:
+#
+#   0  u8   magic 0xA5
+#   1  u8   version
+#   2  u8   frame type
+#   3  u8   reading count N
+#   4  u16  sequence number, wraps at 65536
+#   6  u32  mat clock in milliseconds since boot
+#  10  i16  reading x N
+#  ..  u8   CRC-8 (poly 0x07) over every preceding byte of the frame
+#
+# A frame may be split across notifications or several frames may share one.
+# Notifications that are plain ASCII digits are the pre-framing firmware format
+# and are still accepted as a single sip reading.
+
+MAGIC = 0xA5
+VERSION = 1
+HEADER = struct.Struct("<BBBBHI")
+CRC_SIZE = 1
+MAX_READINGS = 255
+
+FRAME_SIP = 1  # Readings are sip volumes in mL
+FRAME_RAW = 2  # Readings are load-cell samples in grams; mat_time is the last sample's
+FRAME_BACKLOG = 3  # A buffered sip resent after SYNC, with its original seq and mat_time.
+                   # One with no readings ends the backlog and carries the mat's current clock.
+
+# Lines written to the mat to pick what it sends
+MODE_SIP = b"MODE SIP\n"
+MODE_RAW = b"MODE RAW\n"
+
+
+def sync_command(acked_seq=None):
+    # Asks the mat to resend its buffered sips after acked_seq, or all of them
+    return b"SYNC\n" if acked_seq is None else f"SYNC {acked_seq}\n".encode()
+
+SEQUENCE_MODULO = 1 << 16
+RECENT_SEQUENCES = 64  # Window used to recognise duplicates after a retransmit
+
+
+def make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+CRC_TABLE = make_crc_table()
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = CRC_TABLE[crc ^ byte]
+    return crc
+
+
+Frame = collections.namedtuple("Frame", "type seq mat_time readings")
+Text = collections.namedtuple("Text", "text")
+
+READINGS = [struct.Struct(f"<{count}h") for count in range(MAX_READINGS + 1)]
+
+
+def encode_frame(frame_type, seq, mat_time, readings):
+    body = HEADER.pack(MAGIC, VERSION, frame_type, len(readings), seq % SEQUENCE_MODULO, mat_time & 0xFFFFFFFF)
+    body += READINGS[len(readings)].pack(*readings)
+    return body + bytes([crc8(body)])
+
+
+class FrameParser:
+    # Incremental parser for one mat. feed() takes raw notification bytes and returns
+    # the complete frames found so far; partial frames stay buffered for the next call.
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.last_seq = None
+        self.recent = collections.deque(maxlen=RECENT_SEQUENCES)
+        self.recent_times = {}  # seq -> mat clock of the frame that carried it
+        self.clock_offset = None
+        self.last_mat_time = None
+        self.frames = 0
+        self.gaps = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.backlog = 0
+
+    def feed(self, data):
+        if data and MAGIC not in data and self.is_legacy(data):
+            return [self.legacy(bytes(data))]
+        self.buffer += data
+        items = []
+        view = memoryview(self.buffer)
+        offset = 0
+        try:
+            while True:
+                start = self.buffer.find(MAGIC, offset)
+                if start == -1:
+                    offset = len(self.buffer)
+                    break
+                if start > offset:
+                    self.errors += 1  # Bytes between frames are noise
+                if len(self.buffer) - start < HEADER.size:
+                    offset = start
+                    break
+                magic, version, frame_type, count, seq, mat_time = HEADER.unpack_from(view, start)
+                if version != VERSION:
+                    self.errors += 1
+                    offset = start + 1
+                    continue
+                end = start + HEADER.size + 2 * count + CRC_SIZE
+                if len(self.buffer) < end:
+                    if self.valid_frame_after(view, start):
+                        # A corrupted count made this look longer than it is; without
+                        # this check it would hold back every frame behind it
+                        self.errors += 1
+                        offset = start + 1
+                        continue
+                    offset = start
+                    break
+                if crc8(view[start:end - CRC_SIZE]) != self.buffer[end - CRC_SIZE]:
+                    # Not a real frame start; resynchronise on the next magic byte
+                    self.errors += 1
+                    offset = start + 1
+                    continue
+                readings = READINGS[count].unpack_from(view, start + HEADER.size)
+                offset = end
+                if frame_type == FRAME_BACKLOG:
+                    # Replayed frames are old by design; they are deduplicated against
+                    # the journal rather than the live sequence window
+                    self.backlog += 1
+                    items.append(Frame(frame_type, seq, mat_time, readings))
+                elif self.accept(seq, mat_time):
+                    items.append(Frame(frame_type, seq, mat_time, readings))
+        finally:
+            view.release()
+        del self.buffer[:offset]
+        return items
+
+    def valid_frame_after(self, view, start):
+        candidate = self.buffer.find(MAGIC, start + 1)
+        while candidate != -1 and len(self.buffer) - candidate >= HEADER.size:
+            version, count = self.buffer[candidate + 1], self.buffer[candidate + 3]
+            end = candidate + HEADER.size + 2 * count + CRC_SIZE
+            if version == VERSION and end <= len(self.buffer) and crc8(view[candidate:end - CRC_SIZE]) == self.buffer[end - CRC_SIZE]:
+                return True
+            candidate = self.buffer.find(MAGIC, candidate + 1)
+        return False
+
+    def is_legacy(self, data):
+        # Checked for every notification, so a partial frame left in the buffer cannot
+        # swallow a legacy packet behind it. With a frame pending, only printable ASCII
+        # that does not complete that frame is taken as a legacy packet.
+        if not self.buffer:
+            return True
+        if not all(32 <= byte < 127 or byte in b"\r\n\t" for byte in data):
+            return False
+        if len(self.buffer) < HEADER.size:
+            return True
+        end = HEADER.size + 2 * self.buffer[3] + CRC_SIZE
+        if len(self.buffer) + len(data) < end:
+            return True
+        frame = self.buffer + data[:end - len(self.buffer)]
+        return crc8(frame[:-CRC_SIZE]) != frame[-1]
+
+    def legacy(self, data):
+        text = data.decode("utf-8", errors="replace")
+        if text.isdigit():
+            return Frame(FRAME_SIP, None, None, (int(text),))
+        return Text(text)
+
+    def accept(self, seq, mat_time):
+        if self.recent_times.get(seq) == mat_time:
+            self.duplicates += 1
+            return False
+        if self.last_mat_time is not None and mat_time + 1000 < self.last_mat_time:
+            # A frame that is not a resend but carries an older clock means the mat rebooted
+            self.reset_link()
+            self.last_mat_time = None
+        self.last_mat_time = mat_time if self.last_mat_time is None else max(mat_time, self.last_mat_time)
+        if self.last_seq is not None:
+            gap = (seq - self.last_seq - 1) % SEQUENCE_MODULO
+            if gap < SEQUENCE_MODULO // 2:
+                self.gaps += gap
+        if self.last_seq is None or (seq - self.last_seq) % SEQUENCE_MODULO < SEQUENCE_MODULO // 2:
+            self.last_seq = seq
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_times.pop(self.recent[0], None)
+        self.recent.append(seq)
+        self.recent_times[seq] = mat_time
+        self.frames += 1
+        return True
+
+    def reset_link(self):
+        self.last_seq = None
+        self.recent.clear()
+        self.recent_times.clear()
+        self.clock_offset = None
+
+    def host_time(self, frame, received):
+        # Map the mat clock onto host time. Delivery delay is never negative, so the
+        # smallest (received - mat_time) seen so far is the tightest estimate.
+        if frame.mat_time is None:
+            return received
+        offset = received - frame.mat_time / 1000
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        return frame.mat_time / 1000 + self.clock_offset
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "gaps": self.gaps,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "backlog": self.backlog,
+        }
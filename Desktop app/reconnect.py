@@ -0,0 +1,92 @@
+import asyncio
+import collections
+import random
+import time
+
+SERVICE_UUID = "0000ffe0-0000-1000-8000-00805f9b34fb"  # HM-10 service that carries the FFE1 characteristic
+BASE_DELAY = 0.5  # Seconds before the first retry
+MAX_DELAY = 30.0
+SCAN_TIMEOUT = 10.0
+
+
+def advertises_mat(address):
+    address = address.upper()
+
+    def match(device, advertisement):
+        if device.address.upper() != address:
+            return False
+        # Some stacks leave the service list out of the advertisement entirely
+        uuids = [uuid.lower() for uuid in advertisement.service_uuids]
+        return not uuids or SERVICE_UUID in uuids
+
+    return match
+
+
+class ReconnectSupervisor:
+    # Brings back mats that drop off unexpectedly or were out of range at startup.
+    # Each lost mat gets one task that scans only for that address and retries with
+    # jittered exponential backoff.
+
+    def __init__(self, connect, status, base_delay=BASE_DELAY, max_delay=MAX_DELAY, scan_timeout=SCAN_TIMEOUT, spawn=asyncio.ensure_future):
+        self.connect = connect
+        self.status = status
+        self.spawn = spawn
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.scan_timeout = scan_timeout
+        self.tasks = {}
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.latencies = collections.deque(maxlen=100)
+
+    def watch(self, address):
+        task = self.tasks.get(address)
+        if task is None or task.done():
+            task = self.spawn(self.reconnect(address))
+            if task is not None:
+                self.tasks[address] = task
+
+    def cancel(self, address=None):
+        addresses = [address] if address is not None else list(self.tasks)
+        for address in addresses:
+            task = self.tasks.pop(address, None)
+            if task is not None:
+                task.cancel()
+
+    async def reconnect(self, address):
+        from bleak import BleakScanner
+
+        lost_at = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                self.status(f"Reconnecting to {address}...")
+                try:
+                    device = await BleakScanner.find_device_by_filter(advertises_mat(address), timeout=self.scan_timeout)
+                except Exception as e:
+                    device = None
+                    self.status(f"Scan for {address} failed: {str(e)}")
+                if device is not None and await self.connect(address, device):
+                    latency = time.monotonic() - lost_at
+                    self.reconnects += 1
+                    self.latencies.append(latency)
+                    self.status(f"Reconnected to {address} in {latency:.1f} s.")
+                    return latency
+                self.failed_attempts += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                await asyncio.sleep(delay)
+        finally:
+            if self.tasks.get(address) is asyncio.current_task():
+                del self.tasks[address]
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        return {
+            "reconnects": self.reconnects,
+            "failed_attempts": self.failed_attempts,
+            "pending": sorted(self.tasks),
+            "last_latency": self.latencies[-1] if self.latencies else None,
+            "median_latency": latencies[len(latencies) // 2] if latencies else None,
+            "max_latency": latencies[-1] if latencies else None,
+        }
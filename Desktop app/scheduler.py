@@ -0,0 +1,221 @@
+import functools
+import heapq
+import itertools
+import math
+import time
+
+
+def qt_timer(callback):
+    # The one single-shot timer behind a scheduler; start(ms) re-arms it, stop() disarms
+    from PySide6.QtCore import Qt, QTimer
+
+    timer = QTimer()
+    timer.setSingleShot(True)
+    timer.setTimerType(Qt.PreciseTimer)
+    timer.timeout.connect(callback)
+    return timer
+
+
+class ReminderScheduler:
+    # Keeps every pending reminder in a deadline heap and arms one single-shot timer
+    # for whatever comes next: the earliest reminder or, while a countdown is on
+    # screen, the next moment its displayed second changes. Nothing wakes in between.
+
+    def __init__(self, clock=time.monotonic, timer=qt_timer):
+        self.clock = clock
+        self.heap = []
+        self.reminders = {}  # key -> (deadline, sequence, callback, repeat)
+        self.sequence = itertools.count()
+        self.display_key = None
+        self.display_callback = None
+        self.display_active = True
+        self.timer = timer(self.fire)
+
+    def schedule(self, key, delay, callback, repeat=None):
+        # Rescheduling a key replaces it; the stale heap entry is skipped when popped
+        deadline = self.clock() + delay
+        sequence = next(self.sequence)
+        self.reminders[key] = (deadline, sequence, callback, repeat)
+        heapq.heappush(self.heap, (deadline, sequence, key))
+        self.arm()
+        return key
+
+    def cancel(self, key):
+        if self.reminders.pop(key, None) is not None:
+            self.arm()
+
+    def remaining(self, key):
+        reminder = self.reminders.get(key)
+        if reminder is None:
+            return None
+        return max(0.0, reminder[0] - self.clock())
+
+    def is_scheduled(self, key):
+        return key in self.reminders
+
+    def show_countdown(self, key, callback):
+        # callback receives whole seconds left and runs only when that number changes
+        self.display_key = key
+        self.display_callback = callback
+        self.refresh_display()
+        self.arm()
+
+    def set_display_active(self, active):
+        if active == self.display_active:
+            return
+        self.display_active = active
+        if active:
+            self.refresh_display()
+        self.arm()
+
+    def refresh_display(self):
+        remaining = self.remaining(self.display_key) if self.display_key is not None else None
+        if remaining is not None and self.display_callback is not None and self.display_active:
+            self.display_callback(math.ceil(remaining))
+
+    def next_display_tick(self, now):
+        if not self.display_active or self.display_callback is None:
+            return None
+        reminder = self.reminders.get(self.display_key)
+        if reminder is None:
+            return None
+        remaining = reminder[0] - now
+        fraction = remaining - math.floor(remaining)
+        return now + (fraction if fraction > 0 else 1.0)
+
+    def peek(self):
+        while self.heap:
+            deadline, sequence, key = self.heap[0]
+            reminder = self.reminders.get(key)
+            if reminder is not None and reminder[1] == sequence:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def arm(self):
+        now = self.clock()
+        candidates = [when for when in (self.peek(), self.next_display_tick(now)) if when is not None]
+        if not candidates:
+            self.timer.stop()
+            return
+        self.timer.start(max(0, math.ceil((min(candidates) - now) * 1000)))
+
+    def fire(self):
+        now = self.clock()
+        due = []
+        while self.peek() is not None and self.heap[0][0] <= now:
+            _, _, key = heapq.heappop(self.heap)
+            due.append((key, self.reminders.pop(key)))
+        self.refresh_display()
+        for key, (deadline, _, callback, repeat) in due:
+            if repeat:
+                self.schedule(key, max(0.0, deadline + repeat - now), callback, repeat)
+            callback()
+        self.arm()
+
+
+class HydrationReminders:
+    # The hydration timer as one countdown per connected mat, each a reminder keyed
+    # (HYDRATION, address) in a ReminderScheduler. A sip restarts only its own mat's
+    # countdown, and the screen follows one of them. With no mat connected the timer
+    # runs on its own under the address None.
+    HYDRATION = "hydration"
+
+    def __init__(self, scheduler, expired, show, duration=0):
+        self.scheduler = scheduler
+        self.expired = expired  # expired(address) once a countdown runs out
+        self.show = show  # show(seconds) for the countdown on screen
+        self.duration = duration
+        self.paused = {}  # address -> seconds that were left at the last pause
+        self.displayed = None
+        self.running = False
+
+    def key(self, address):
+        return (self.HYDRATION, address)
+
+    def addresses(self):
+        return [key[1] for key in self.scheduler.reminders if key[0] == self.HYDRATION]
+
+    def remaining(self, address):
+        return self.scheduler.remaining(self.key(address))
+
+    def set_duration(self, duration):
+        # Time left from an earlier pause belongs to the old duration
+        self.duration = duration
+        self.paused.clear()
+
+    def start(self, addresses, remaining, preferred=None):
+        addresses = list(addresses) or [None]
+        for address in addresses:
+            # A mat resumes where it was paused; one connected since then gets remaining
+            self.schedule(address, self.paused.get(address, remaining))
+        self.paused.clear()
+        self.running = True
+        self.display(preferred if preferred in addresses else addresses[0])
+
+    def pause(self):
+        # Returns the seconds left on the countdown that was on screen
+        for address in self.addresses():
+            self.paused[address] = math.ceil(self.remaining(address))
+            self.scheduler.cancel(self.key(address))
+        self.running = False
+        return self.paused.get(self.displayed)
+
+    def reset(self):
+        for address in self.addresses():
+            self.scheduler.cancel(self.key(address))
+        self.paused.clear()
+        self.running = False
+
+    def sipped(self, addresses):
+        if not self.running:
+            return
+        for address in addresses:
+            self.schedule(address, self.duration)
+        if self.displayed is None and addresses and None not in addresses:
+            # A timer started before any mat connected moves onto the first one used
+            self.scheduler.cancel(self.key(None))
+            self.display(next(iter(addresses)))
+        self.scheduler.refresh_display()
+
+    def connected(self, address):
+        if not self.running or address in self.addresses():
+            return
+        standalone = self.remaining(None)
+        if standalone is None:
+            self.schedule(address, self.duration)
+            return
+        # The timer that ran without a mat carries on as this mat's countdown
+        self.scheduler.cancel(self.key(None))
+        self.schedule(address, standalone)
+        self.display(address)
+
+    def disconnected(self, address):
+        remaining = self.remaining(address)
+        if not self.running or remaining is None:
+            return
+        self.scheduler.cancel(self.key(address))
+        if not self.addresses():
+            # The last mat is gone; its countdown carries on without one
+            self.schedule(None, remaining)
+            self.display(None)
+        elif self.displayed == address:
+            self.display(self.next_due())
+
+    def next_due(self):
+        return min(self.addresses(), key=self.remaining, default=None)
+
+    def schedule(self, address, delay):
+        self.scheduler.schedule(self.key(address), delay, functools.partial(self.fire, address))
+
+    def display(self, address):
+        self.displayed = address
+        self.scheduler.show_countdown(self.key(address), self.show)
+
+    def fire(self, address):
+        # The other mats keep counting; the screen moves on to whichever is due next
+        if not self.addresses():
+            self.running = False
+        elif address == self.displayed:
+            self.display(self.next_due())
+        self.expired(address)
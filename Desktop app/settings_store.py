@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+FLUSH_DELAY = 0.5  # Seconds to coalesce writes before flushing to disk
+
+
+class SettingsStore:
+    # Loads data.json once and serves every read from memory. Changes are
+    # coalesced and written atomically (temp file, fsync, rename) off the event loop.
+
+    def __init__(self, path, legacy_path=None, flush_delay=FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.data = self.read(path)
+        if not self.data and legacy_path and os.path.abspath(legacy_path) != os.path.abspath(path):
+            self.data = self.read(legacy_path)
+            if self.data:
+                self.write(self.encode())
+        self.version = 0
+        self.flushed_version = 0
+        self.flush_handle = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settings-flush")
+
+    def read(self, path):
+        try:
+            with open(path, "r") as file:
+                data = json.load(file)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Failed to load settings from {path}: {str(e)}")
+            return {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def update(self, **values):
+        changed = False
+        for key, value in values.items():
+            if self.data.get(key) != value or key not in self.data:
+                self.data[key] = value
+                changed = True
+        if changed:
+            self.mark_dirty()
+
+    def pop(self, key):
+        if key in self.data:
+            value = self.data.pop(key)
+            self.mark_dirty()
+            return value
+        return None
+
+    def mark_dirty(self):
+        self.version += 1
+        if self.flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or loop.is_closed():
+            self.flush()
+            return
+        self.flush_handle = loop.call_later(self.flush_delay, self.start_flush, loop)
+
+    def start_flush(self, loop):
+        self.flush_handle = None
+        if self.version == self.flushed_version:
+            return
+        version = self.version
+        future = loop.run_in_executor(self.executor, self.write, self.encode())
+        future.add_done_callback(lambda f: self.flush_done(f, version))
+
+    def flush_done(self, future, version):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error:
+            print(f"Failed to save settings: {str(error)}")
+        else:
+            self.flushed_version = max(self.flushed_version, version)
+
+    def encode(self):
+        return json.dumps(self.data, indent=4)
+
+    def write(self, text):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def flush(self):
+        # Blocking flush of any pending change; queued behind in-flight writes
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.version == self.flushed_version:
+            return
+        version = self.version
+        self.executor.submit(self.write, self.encode()).result()
+        self.flushed_version = version
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
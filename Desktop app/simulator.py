@@ -0,0 +1,371 @@
+import asyncio
+import collections
+import random
+import sys
+import time
+import types
+from protocol import encode_frame, FRAME_SIP, FRAME_RAW, FRAME_BACKLOG, MODE_RAW, MODE_SIP
+from reconnect import SERVICE_UUID
+from connection_manager import CHARACTERISTIC_UUID
+
+# Stand-in for the parts of bleak the app uses: BleakClient, BleakScanner and the
+# device/advertisement objects they hand out. install() registers it as the
+# "bleak" module, so the lazy imports in ConnectionManager, ReconnectSupervisor
+# and StreamingDiscovery pick it up without any other change.
+
+SAMPLE_RATE = 80  # Raw mode samples per second, as the HX711 delivers them
+SAMPLES_PER_FRAME = 8
+CUP_GRAMS = 400  # A full cup, refilled once it runs low
+BACKLOG_SIZE = 48  # Sips the firmware keeps for SYNC
+NOTIFICATION_SIZE = 20  # HM-10 notification payload
+HOST_TIMEOUT = 30.0  # Seconds without a command before raw mode ends, as in the firmware
+
+Device = collections.namedtuple("Device", "address name")
+Advertisement = collections.namedtuple("Advertisement", "service_uuids local_name rssi")
+
+
+class MatProfile:
+    # How a simulated mat behaves once something subscribes to its notifications.
+    # rate is sip frames per second (0 sends as fast as the loop allows), burst is how
+    # many frames share one notification, malformed is the chance a frame is corrupted
+    # and disconnect_after drops the link that many seconds after notify starts.
+    # A raw mat streams load-cell samples instead, and rate is then sips per second.
+
+    def __init__(self, rate=1.0, burst=1, malformed=0.0, split=0.0, disconnect_after=None, amounts=(20, 250), raw=False, noise=1.0, seed=None):
+        self.rate = rate
+        self.raw = raw
+        self.noise = noise  # Standard deviation of raw samples in grams
+        self.burst = max(1, burst)
+        self.malformed = malformed
+        self.split = split  # Chance a notification is cut in two, as a small MTU would
+        self.disconnect_after = disconnect_after
+        self.amounts = amounts
+        self.seed = seed
+
+
+class SimulatedMat:
+    def __init__(self, address, name="Smart mat", rssi=-60, profile=None):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+        self.profile = profile or MatProfile()
+        self.random = random.Random(self.profile.seed)
+        self.booted = time.monotonic()
+        self.seq = 0
+        self.client = None
+        self.sent = collections.deque()  # perf_counter of every sip sent and not yet claimed
+        self.frames = 0
+        self.corrupted = 0
+        self.notifications = 0
+        self.disconnects = 0
+        self.writes = []
+        self.raw = self.profile.raw
+        self.host_timeout = HOST_TIMEOUT
+        self.last_command = time.monotonic()
+        self.mode_changed = asyncio.Event()
+        self.samples = 0
+        self.lost = 0  # Sips taken in raw mode with no host to detect them
+        self.weights = self.weight_signal()
+        self.backlog = collections.deque(maxlen=BACKLOG_SIZE)  # (seq, mat_time, mL) of sips sent
+        self.callback = None
+        self.line = bytearray()
+        self.commands = []
+
+    @property
+    def device(self):
+        return Device(self.address, self.name)
+
+    @property
+    def advertisement(self):
+        return Advertisement([SERVICE_UUID], self.name, self.rssi + self.random.randint(-4, 4))
+
+    def weight_signal(self):
+        # Yields (grams, sip) per sample: the cup rests, is lifted, drunk from and put
+        # back, with noise and a settling wobble. sip is the amount drunk on the sample
+        # where the cup lands again, 0 elsewhere.
+        level = CUP_GRAMS
+        random = self.random
+        while True:
+            rest = max(0.5, random.expovariate(self.profile.rate) if self.profile.rate else 0.5)
+            for _ in range(int(rest * SAMPLE_RATE)):
+                yield level + random.gauss(0, self.profile.noise), 0
+            for step in range(4):
+                yield level * (3 - step) / 4, 0
+            for _ in range(int(random.uniform(1, 3) * SAMPLE_RATE)):
+                yield abs(random.gauss(0, self.profile.noise)), 0
+            amount = random.randint(*self.profile.amounts)
+            sip = 0
+            if level - amount < 50:
+                level = CUP_GRAMS
+            else:
+                level -= amount
+                sip = amount
+            yield level * 1.3, sip
+            for step in range(4):
+                yield level + random.uniform(-20, 20) / (step + 1), 0
+
+    def next_frame(self):
+        # Returns the frame and how many sips the host should find in it
+        mat_time = int((time.monotonic() - self.booted) * 1000)
+        if self.raw:
+            readings = []
+            sips = 0
+            for _ in range(SAMPLES_PER_FRAME):
+                grams, sip = next(self.weights)
+                readings.append(int(round(grams)))
+                sips += sip > 0
+            self.samples += len(readings)
+            frame = encode_frame(FRAME_RAW, self.seq, mat_time, readings)
+        else:
+            amount = self.random.randint(*self.profile.amounts)
+            frame = encode_frame(FRAME_SIP, self.seq, mat_time, [amount])
+            self.backlog.append((self.seq, mat_time, amount))
+            sips = 1
+        self.seq += 1
+        self.frames += 1
+        if self.random.random() < self.profile.malformed:
+            # Flip one byte after the magic so the CRC rejects it. A lost sip frame loses
+            # its sip; a lost raw frame only costs a few samples of a longer signal.
+            self.corrupted += 1
+            position = self.random.randrange(1, len(frame))
+            return frame[:position] + bytes([frame[position] ^ 0xFF]) + frame[position + 1:], sips if self.raw else 0
+        return frame, sips
+
+    async def stream(self, client, callback):
+        profile = self.profile
+        started = time.monotonic()
+        try:
+            while client.is_connected:
+                self.check_host()
+                if profile.disconnect_after is not None and time.monotonic() - started >= profile.disconnect_after:
+                    self.disconnects += 1
+                    client.drop()
+                    return
+                payload = bytearray()
+                sips = 0
+                for _ in range(profile.burst):
+                    frame, expected = self.next_frame()
+                    payload += frame
+                    sips += expected
+                self.notify(callback, payload, sips)
+                if self.raw:
+                    # Samples arrive at the HX711's pace whatever the sip rate
+                    await self.pause(profile.burst * SAMPLES_PER_FRAME / SAMPLE_RATE)
+                elif profile.rate:
+                    # Exponential gaps give Poisson arrivals rather than a metronome
+                    await self.pause(self.random.expovariate(profile.rate / profile.burst))
+                else:
+                    await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            pass
+
+    async def pause(self, seconds):
+        # A mode change ends the wait, as the firmware's loop picks it up at once
+        self.mode_changed.clear()
+        try:
+            await asyncio.wait_for(self.mode_changed.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def notify(self, callback, payload, sips):
+        now = time.perf_counter()
+        self.sent.extend([now] * sips)
+        if len(payload) > 1 and self.random.random() < self.profile.split:
+            cut = self.random.randrange(1, len(payload))
+            chunks = [payload[:cut], payload[cut:]]
+        else:
+            chunks = [payload]
+        for chunk in chunks:
+            self.notifications += 1
+            callback(CHARACTERISTIC_UUID, chunk)
+
+    def check_host(self):
+        # The firmware's fallback: raw mode ends once the host has been quiet too long
+        if self.raw and time.monotonic() - self.last_command > self.host_timeout:
+            self.raw = False
+
+    def mat_clock(self):
+        return int((time.monotonic() - self.booted) * 1000)
+
+    def drink_offline(self, count, spacing=60.0):
+        # Sips taken while no host was listening, `spacing` seconds apart and ending now.
+        # The mat clock is moved forward so they come after everything sent before.
+        self.check_host()
+        if self.raw:
+            # Streamed as samples with nobody listening; only sip mode buffers them
+            self.lost += count
+            return
+        self.booted -= count * spacing
+        now = self.mat_clock()
+        for index in range(count):
+            amount = self.random.randint(*self.profile.amounts)
+            self.backlog.append((self.seq, now - int((count - 1 - index) * spacing * 1000), amount))
+            self.seq += 1
+
+    def replay(self, after=None):
+        # The firmware's answer to SYNC: buffered sips after `after` (all of them when
+        # `after` is unknown or from an earlier boot), then an empty end frame
+        newest = self.backlog[-1][0] if self.backlog else None
+        if after is not None and newest is not None and (newest - after) % 65536 >= 32768:
+            after = None
+        payload = bytearray()
+        for seq, mat_time, amount in self.backlog:
+            if after is None or 0 < (seq - after) % 65536 < 32768:
+                payload += encode_frame(FRAME_BACKLOG, seq, mat_time, [amount])
+        payload += encode_frame(FRAME_BACKLOG, self.seq, self.mat_clock(), [])
+        for start in range(0, len(payload), NOTIFICATION_SIZE):
+            self.notifications += 1
+            self.callback(CHARACTERISTIC_UUID, payload[start:start + NOTIFICATION_SIZE])
+
+    def receive(self, data):
+        # Parses written bytes into lines the way readCommands() in the firmware does
+        self.line += data
+        while b"\n" in self.line:
+            end = self.line.index(b"\n")
+            command = self.line[:end].decode(errors="replace").strip()
+            del self.line[:end + 1]
+            self.commands.append(command)
+            self.last_command = time.monotonic()
+            if command + "\n" in (MODE_RAW.decode(), MODE_SIP.decode()):
+                raw = command + "\n" == MODE_RAW.decode()
+                if raw != self.raw:
+                    self.raw = raw
+                    self.mode_changed.set()
+            elif command == "SYNC" and self.callback is not None:
+                self.replay()
+            elif command.startswith("SYNC ") and self.callback is not None:
+                self.replay(int(command[5:]))
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "corrupted": self.corrupted,
+            "notifications": self.notifications,
+            "samples": self.samples,
+            "disconnects": self.disconnects,
+            "lost": self.lost,
+        }
+
+
+MATS = {}  # address -> SimulatedMat, the "radio environment" the fakes see
+
+
+def add_mat(address, **kwargs):
+    mat = MATS[address.upper()] = SimulatedMat(address.upper(), **kwargs)
+    return mat
+
+
+def find_mat(address_or_device):
+    address = getattr(address_or_device, "address", address_or_device)
+    return MATS.get(address.upper())
+
+
+class BleakClient:
+    def __init__(self, address_or_device, disconnected_callback=None, **kwargs):
+        self.address = getattr(address_or_device, "address", address_or_device).upper()
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.task = None
+
+    async def connect(self, **kwargs):
+        mat = find_mat(self.address)
+        if mat is None:
+            raise ConnectionError(f"Device with address {self.address} was not found.")
+        await asyncio.sleep(0.01)
+        self.is_connected = True
+        mat.client = self
+        return True
+
+    async def disconnect(self):
+        if self.is_connected:
+            self.stop()
+            if self.disconnected_callback:
+                self.disconnected_callback(self)
+        return True
+
+    def drop(self):
+        # The mat went away: the callback fires as it would for a real link loss
+        self.stop()
+        if self.disconnected_callback:
+            self.disconnected_callback(self)
+
+    def stop(self):
+        self.is_connected = False
+        mat = find_mat(self.address)
+        if mat is not None and mat.client is self:
+            mat.client = None
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.task = None
+
+    async def start_notify(self, characteristic, callback, **kwargs):
+        if not self.is_connected:
+            raise ConnectionError("Not connected")
+        mat = find_mat(self.address)
+        mat.callback = callback
+        self.task = asyncio.ensure_future(mat.stream(self, callback))
+
+    async def stop_notify(self, characteristic):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        if not self.is_connected:
+            raise ConnectionError("Not connected")
+        mat = find_mat(self.address)
+        mat.writes.append((bytes(data), response))
+        mat.receive(bytes(data))
+
+
+class BleakScanner:
+    def __init__(self, detection_callback=None, **kwargs):
+        self.detection_callback = detection_callback
+        self.task = None
+
+    async def start(self):
+        self.task = asyncio.ensure_future(self.advertise())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def advertise(self):
+        try:
+            while True:
+                for mat in list(MATS.values()):
+                    if mat.client is None and self.detection_callback:
+                        self.detection_callback(mat.device, mat.advertisement)
+                await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            pass
+
+    @classmethod
+    async def discover(cls, timeout=5.0, **kwargs):
+        await asyncio.sleep(min(timeout, 0.1))
+        return [mat.device for mat in MATS.values() if mat.client is None]
+
+    @classmethod
+    async def find_device_by_filter(cls, filterfunc, timeout=10.0, **kwargs):
+        deadline = time.monotonic() + timeout
+        while True:
+            for mat in list(MATS.values()):
+                if mat.client is None and filterfunc(mat.device, mat.advertisement):
+                    return mat.device
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(0.05)
+
+
+def install():
+    module = types.ModuleType("bleak")
+    module.BleakClient = BleakClient
+    module.BleakScanner = BleakScanner
+    module.simulated = True
+    sys.modules["bleak"] = module
+    return module
+
+
+def mat_address(index):
+    return f"5A:11:00:00:00:{index:02X}"
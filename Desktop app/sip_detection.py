@@ -0,0 +1,158 @@
+import collections
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Host-side sip detection for mats streaming raw load-cell samples (FRAME_RAW).
+# Each mat gets a chain of generator stages; a chunk of samples is sent through
+# every stage in turn and only the classifier loops in Python, once per stable
+# segment rather than once per sample.
+
+SAMPLE_RATE = 80.0  # HX711 with its RATE pin high
+MEDIAN_WIDTH = 5  # Samples; removes single-sample spikes from knocks on the table
+EMA_ALPHA = 0.3
+EMA_BLOCK = 64  # Longest run solved in closed form before the powers lose precision
+STABLE_SAMPLES = 20  # A quarter of a second at 80 SPS
+STABLE_TOLERANCE = 5.0  # Grams of spread allowed within a stable window
+EMPTY_GRAMS = 10.0  # Same threshold as noWeight() in the firmware
+MIN_SIP = 5.0  # Smaller drops are drift or the cup settling
+
+LIFT = "lift"
+PLACE = "place"
+DRINK = "drink"
+REFILL = "refill"
+
+MatEvent = collections.namedtuple("MatEvent", "time kind grams")
+
+
+def primed(generator_function):
+    def start(*args, **kwargs):
+        generator = generator_function(*args, **kwargs)
+        next(generator)
+        return generator
+
+    return start
+
+
+def ema(values, alpha, previous):
+    # y[i] = alpha * x[i] + (1 - alpha) * y[i - 1], solved per block with a cumulative sum
+    decay = 1.0 - alpha
+    result = np.empty_like(values)
+    for start in range(0, values.size, EMA_BLOCK):
+        block = values[start:start + EMA_BLOCK]
+        powers = decay ** np.arange(block.size)
+        smoothed = powers * (alpha * np.cumsum(block / powers) + decay * previous)
+        result[start:start + block.size] = smoothed
+        previous = smoothed[-1]
+    return result, previous
+
+
+@primed
+def median_stage(width=MEDIAN_WIDTH):
+    tail = None
+    chunk = None
+    while True:
+        times, values = yield chunk
+        if tail is None:
+            tail = np.full(width - 1, values[0])
+        joined = np.concatenate([tail, values])
+        tail = joined[-(width - 1):]
+        chunk = times, np.median(sliding_window_view(joined, width), axis=1)
+
+
+@primed
+def ema_stage(alpha=EMA_ALPHA):
+    previous = None
+    chunk = None
+    while True:
+        times, values = yield chunk
+        if previous is None:
+            previous = values[0]
+        smoothed, previous = ema(values, alpha, previous)
+        chunk = times, smoothed
+
+
+@primed
+def stability_stage(window=STABLE_SAMPLES, tolerance=STABLE_TOLERANCE):
+    # A sample is stable when the last `window` filtered samples span at most `tolerance`
+    tail = np.full(window - 1, np.nan)
+    chunk = None
+    while True:
+        times, values = yield chunk
+        joined = np.concatenate([tail, values])
+        tail = joined[-(window - 1):]
+        windows = sliding_window_view(joined, window)
+        with np.errstate(invalid="ignore"):
+            stable = (windows.max(axis=1) - windows.min(axis=1)) <= tolerance
+        chunk = times, values, stable
+
+
+@primed
+def classify_stage(empty=EMPTY_GRAMS, min_sip=MIN_SIP):
+    # Works on the start of each stable segment: an empty mat after a cup means a
+    # lift; a cup after an empty mat is a place, and its new weight against the last
+    # settled weight tells a drink from a refill. A drop without a lift (a straw)
+    # counts as a drink too.
+    was_stable = False
+    lifted = False
+    settled = None
+    events = None
+    while True:
+        times, values, stable = yield events
+        events = []
+        previous = np.concatenate([[was_stable], stable[:-1]])
+        was_stable = bool(stable[-1])
+        for index in np.flatnonzero(stable & ~previous):
+            time, level = float(times[index]), float(values[index])
+            if level <= empty:
+                if not lifted and settled is not None:
+                    events.append(MatEvent(time, LIFT, settled))
+                lifted = True
+                continue
+            if lifted:
+                events.append(MatEvent(time, PLACE, level))
+            if settled is not None:
+                change = settled - level
+                if change >= min_sip:
+                    events.append(MatEvent(time, DRINK, change))
+                elif change <= -min_sip:
+                    events.append(MatEvent(time, REFILL, -change))
+            lifted = False
+            settled = level
+
+
+class SipDetector:
+    # One per mat. feed_frame() takes a FRAME_RAW frame (readings in grams) with the
+    # host time of its last sample and returns the MatEvents it completes.
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.stages = [median_stage(), ema_stage(), stability_stage(), classify_stage()]
+        self.last_time = None
+        self.samples = 0
+
+    def sample_times(self, count, end_time):
+        # Samples are evenly spaced since the previous frame; after a gap or at the
+        # start the nominal rate is used instead
+        nominal = count / self.sample_rate
+        if self.last_time is not None and 0 < end_time - self.last_time <= 2 * nominal:
+            start = self.last_time
+        else:
+            start = end_time - nominal
+        self.last_time = end_time
+        return np.linspace(start, end_time, count + 1)[1:]
+
+    def feed(self, times, values):
+        self.samples += values.size
+        chunk = times, values
+        for stage in self.stages:
+            chunk = stage.send(chunk)
+        return chunk
+
+    def feed_frame(self, frame, end_time):
+        if not frame.readings:
+            return []
+        values = np.asarray(frame.readings, dtype=np.float64)
+        return self.feed(self.sample_times(values.size, end_time), values)
+
+    def sips(self, frame, end_time):
+        return [(event.time, int(round(event.grams))) for event in self.feed_frame(frame, end_time) if event.kind == DRINK]
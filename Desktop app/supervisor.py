@@ -0,0 +1,90 @@
+import asyncio
+import collections
+import functools
+
+SHUTDOWN_TIMEOUT = 3.0  # Seconds from the close request to the process being free to exit
+
+
+def time_left(deadline):
+    return max(0.0, deadline - asyncio.get_running_loop().time())
+
+
+async def until(deadline, awaitable):
+    # Awaits with whatever is left of the deadline; False if it ran out first
+    try:
+        await asyncio.wait_for(awaitable, time_left(deadline))
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+class TaskSupervisor:
+    # Owns the background coroutines of one component. Tasks are grouped in named
+    # scopes that can be cancelled or awaited together, and a scope can be given a
+    # concurrency limit. A task that fails without anyone awaiting it is passed to
+    # report(scope, error) instead of ending up as a "never retrieved" warning.
+
+    def __init__(self, report=None, limits=None):
+        self.report = report
+        self.limits = {scope: asyncio.Semaphore(limit) for scope, limit in (limits or {}).items()}
+        self.scopes = collections.defaultdict(set)
+        self.closing = False
+        self.failures = 0
+
+    def spawn(self, coroutine, scope="default"):
+        if self.closing:
+            # Nothing new starts once shutdown has begun
+            coroutine.close()
+            return None
+        limit = self.limits.get(scope)
+        task = asyncio.ensure_future(self.limited(limit, coroutine) if limit else coroutine)
+        self.scopes[scope].add(task)
+        task.add_done_callback(functools.partial(self.finished, scope))
+        return task
+
+    async def limited(self, semaphore, coroutine):
+        try:
+            async with semaphore:
+                return await coroutine
+        finally:
+            # Cancelled while waiting for a slot: the coroutine never started
+            coroutine.close()
+
+    def finished(self, scope, task):
+        self.scopes[scope].discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            return
+        self.failures += 1
+        if self.report is not None:
+            self.report(scope, error)
+        else:
+            print(f"Background {scope} task failed: {str(error)}")
+
+    def tasks(self, scope=None):
+        if scope is not None:
+            return set(self.scopes.get(scope, ()))
+        return set().union(*self.scopes.values())
+
+    def cancel(self, scope=None):
+        for task in self.tasks(scope):
+            task.cancel()
+
+    async def wait(self, scope=None, timeout=None):
+        # True once every task in the scope is done, False if the timeout came first
+        tasks = self.tasks(scope)
+        if not tasks:
+            return True
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return not pending
+
+    async def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        # Cancels everything still running and waits up to timeout for it to unwind
+        self.closing = True
+        self.cancel()
+        return await self.wait(timeout=timeout)
+
+    def stats(self):
+        return {scope: len(tasks) for scope, tasks in self.scopes.items() if tasks}
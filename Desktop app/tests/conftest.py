@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture(autouse=True)
+def no_opt_ins(monkeypatch):
+    # Tests never push to a fleet server, export metrics or write a capture
+    for name in ("SMART_MAT_FLEET", "SMART_MAT_METRICS", "SMART_MAT_CAPTURE"):
+        monkeypatch.delenv(name, raising=False)
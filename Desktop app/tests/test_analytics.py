@@ -0,0 +1,120 @@
+import datetime
+import random
+import time
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from analytics import IntakeAnalytics, ALL
+
+GOAL = 500
+
+
+@pytest.fixture(autouse=True)
+def berlin(monkeypatch):
+    # A zone with DST, so local days are not all 24 hours long
+    monkeypatch.setenv("TZ", "Europe/Berlin")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def recompute(events, address=ALL):
+    # The aggregates the slow way: every event through datetime, all at once
+    hourly, daily = defaultdict(int), defaultdict(int)
+    for ts, mat, amount in events:
+        if address is not ALL and mat != address:
+            continue
+        moment = datetime.datetime.fromtimestamp(ts)
+        hourly[moment.date(), moment.hour] += amount
+        daily[moment.date()] += amount
+    return hourly, daily
+
+
+def reference_streaks(daily, today):
+    if not daily:
+        return 0, 0
+    day, met = min(daily), []
+    while day <= today:
+        met.append(daily.get(day, 0) >= GOAL)
+        day += datetime.timedelta(days=1)
+    longest = run = 0
+    for reached in met:
+        run = run + 1 if reached else 0
+        longest = max(longest, run)
+    if not met[-1]:
+        met.pop()  # Today is not over yet
+    current = 0
+    for reached in reversed(met):
+        if not reached:
+            break
+        current += 1
+    return current, longest
+
+
+def generate(seed):
+    # Sips across a month that spans the end of DST, delivered in batches, with
+    # backlog batches reaching back before what came earlier
+    rng = random.Random(seed)
+    ts = datetime.datetime(2024, 10, 14, 22, 30).timestamp()
+    batches = []
+    while ts < datetime.datetime(2024, 11, 12).timestamp():
+        batch = []
+        for _ in range(rng.randint(1, 12)):
+            ts += rng.choice([30, 600, 3600, 5 * 3600, 30 * 3600])
+            batch.append((ts, rng.choice(["AA", "BB", None]), rng.randint(20, 250)))
+        if rng.random() < 0.2:
+            batch = [(t - rng.uniform(0, 4 * 86400), mat, amount) for t, mat, amount in batch]
+            rng.shuffle(batch)
+        batches.append(batch)
+    return batches
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_aggregates_match_a_full_recompute(seed):
+    batches = generate(seed)
+    analytics = IntakeAnalytics()
+    for batch in batches:
+        analytics.add_many(batch)
+    events = [event for batch in batches for event in batch]
+    start = datetime.date(2024, 10, 10)
+    today = datetime.date(2024, 11, 14)
+    for address in (ALL, "AA", "BB"):
+        hourly, daily = recompute(events, address)
+        days = [start + datetime.timedelta(days=n) for n in range((today - start).days + 1)]
+        assert analytics.daily_totals(start, today, address).tolist() == [daily.get(day, 0) for day in days]
+        for day in days:
+            assert analytics.hourly_totals(day, address).tolist() == [hourly.get((day, hour), 0) for hour in range(24)]
+        weeks = defaultdict(int)
+        for day, amount in daily.items():
+            weeks[day - datetime.timedelta(days=day.weekday())] += amount
+        mondays = sorted({day - datetime.timedelta(days=day.weekday()) for day in days})
+        assert analytics.weekly_totals(start, today, address).tolist() == [weeks.get(monday, 0) for monday in mondays]
+        assert analytics.streaks(GOAL, address, today) == reference_streaks(daily, today)
+        stamps = sorted(ts for ts, mat, _ in events if address is ALL or mat == address)
+        assert np.array_equal(analytics.sip_intervals(address=address), np.diff(stamps))
+
+
+def test_sips_across_midnight_and_week_boundaries():
+    analytics = IntakeAnalytics()
+    sunday_night = datetime.datetime(2024, 11, 10, 23, 59, 59).timestamp()
+    analytics.add_many([(sunday_night, "AA", 100), (sunday_night + 1, "AA", 200)])
+    # A backlog sip from the day before lands afterwards
+    analytics.add_many([(sunday_night - 86400, "AA", 300)])
+    saturday = datetime.date(2024, 11, 9)
+    assert analytics.daily_totals(saturday, saturday + datetime.timedelta(days=2)).tolist() == [300, 100, 200]
+    assert analytics.weekly_totals(saturday, saturday + datetime.timedelta(days=2)).tolist() == [400, 200]
+    assert analytics.hourly_totals(saturday + datetime.timedelta(days=1))[23] == 100
+    assert analytics.hourly_totals(saturday + datetime.timedelta(days=2))[0] == 200
+
+
+def test_sips_without_a_mat_count_only_in_the_total():
+    analytics = IntakeAnalytics()
+    now = time.time()
+    analytics.add_many([(now, None, 100), (now, "AA", 50)])
+    assert analytics.addresses() == ["AA"]
+    assert analytics.get("") is None
+    assert analytics.daily_totals(datetime.date.today()).tolist() == [150]
+    assert analytics.daily_totals(datetime.date.today(), address="AA").tolist() == [50]
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import capture
+import mat_service
+from capture import CaptureRecorder, read_capture, replay
+from protocol import encode_frame, FRAME_SIP
+
+ADDRESS = "5A:11:00:00:00:00"
+
+
+def record_sips(path, amounts):
+    recorder = CaptureRecorder(path, capacity=16)
+    now = time.time()
+    for seq, amount in enumerate(amounts):
+        recorder.record(ADDRESS, encode_frame(FRAME_SIP, seq, seq * 1000, [amount]), now + seq)
+    recorder.close()
+
+
+def test_replay_ignores_the_opt_ins(tmp_path, monkeypatch):
+    path = str(tmp_path / "session.cap")
+    record_sips(path, [100, 50])
+    with open(path, "rb") as file:
+        before = file.read()
+    monkeypatch.setenv(capture.ENV_VAR, path)
+    monkeypatch.setenv("SMART_MAT_METRICS", str(tmp_path / "metrics"))
+    # Nothing listens here, so a push would only show up as a fleet client
+    monkeypatch.setenv("SMART_MAT_FLEET", "http://127.0.0.1:9")
+    services = []
+    original = mat_service.MatService.__init__
+
+    def spy(self, *args, **kwargs):
+        original(self, *args, **kwargs)
+        services.append(self)
+
+    monkeypatch.setattr(mat_service.MatService, "__init__", spy)
+    data_dir = tmp_path / "replay"
+    data_dir.mkdir()
+    result = asyncio.run(replay(read_capture(path), str(data_dir)))
+    assert result["total"] == 150
+    service, = services
+    assert service.fleet is None
+    assert not service.metrics.enabled
+    assert not service.capture.enabled
+    assert not os.path.exists(tmp_path / "metrics")
+    with open(path, "rb") as file:
+        assert file.read() == before
+
+
+def test_recorder_refuses_a_file_that_is_not_a_capture(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"not a capture")
+    with pytest.raises(ValueError):
+        CaptureRecorder(str(path), capacity=16)
+    assert path.read_bytes() == b"not a capture"
+
+
+def test_recorder_continues_an_earlier_capture(tmp_path):
+    path = str(tmp_path / "session.cap")
+    record_sips(path, [100, 50])
+    # The file's own capacity wins over the one asked for
+    recorder = CaptureRecorder(path, capacity=64)
+    recorder.record(ADDRESS, encode_frame(FRAME_SIP, 2, 2000, [25]))
+    recorder.close()
+    records = read_capture(path)
+    assert recorder.capacity == 16
+    assert [data for _, _, data in records][-1] == encode_frame(FRAME_SIP, 2, 2000, [25])
+    assert len(records) == 3
+
+
+def test_mats_past_the_device_table_are_not_recorded(tmp_path):
+    path = str(tmp_path / "session.cap")
+    recorder = CaptureRecorder(path, capacity=256)
+    addresses = [f"5A:11:00:00:00:{index:02X}" for index in range(capture.DEVICE_SLOTS + 1)]
+    for index, address in enumerate(addresses):
+        recorder.record(address, encode_frame(FRAME_SIP, index, index * 1000, [index + 1]))
+    # The first mat is still labelled as itself after the table filled up
+    recorder.record(addresses[0], encode_frame(FRAME_SIP, 99, 99000, [7]))
+    recorder.close()
+    records = read_capture(path)
+    assert recorder.unrecorded == 1
+    assert [address for _, address, _ in records] == addresses[:-1] + addresses[:1]
@@ -0,0 +1,55 @@
+import asyncio
+
+from command_queue import CommandQueue
+
+
+class Link:
+    def __init__(self):
+        self.writes = []
+
+    async def write(self, data, response):
+        self.writes.append(data)
+
+
+def test_commands_of_a_kind_coalesce_while_queued():
+    async def main():
+        link = Link()
+        queue = CommandQueue(link.write)
+        first = queue.submit(b"MODE RAW\n", kind="mode")
+        second = queue.submit(b"MODE SIP\n", kind="mode")
+        sync = queue.submit(b"SYNC\n", kind="sync")
+        queue.resume()
+        await asyncio.gather(first, second, sync)
+        return link.writes, queue.superseded
+
+    writes, superseded = asyncio.run(main())
+    # Only the newest mode is sent, packed into one write with the SYNC
+    assert writes == [b"MODE SIP\nSYNC\n"]
+    assert superseded == 1
+
+
+def test_plain_commands_queue_in_order_and_split_at_payload_size():
+    async def main():
+        link = Link()
+        queue = CommandQueue(link.write)
+        futures = [queue.submit(f"text {index}\n".encode()) for index in range(4)]
+        queue.resume(payload_size=16)
+        await asyncio.gather(*futures)
+        return link.writes
+
+    writes = asyncio.run(main())
+    assert b"".join(writes) == b"text 0\ntext 1\ntext 2\ntext 3\n"
+    assert all(len(write) <= 16 for write in writes)
+
+
+def test_oldest_command_is_dropped_when_the_queue_is_full():
+    async def main():
+        queue = CommandQueue(Link().write, max_pending=2)
+        oldest = queue.submit(b"a\n")
+        queue.submit(b"b\n")
+        queue.submit(b"c\n")
+        return oldest, queue.dropped
+
+    oldest, dropped = asyncio.run(main())
+    assert dropped == 1
+    assert isinstance(oldest.exception(), ConnectionError)
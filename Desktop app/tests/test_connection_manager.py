@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from connection_manager import ConnectionManager
+
+
+class BleakError(Exception):
+    pass
+
+
+class FlakyClient:
+    # Fails its writes with a bleak-style error, dropping the link first if told to
+    def __init__(self, address, error=True, drop=True):
+        self.address = address
+        self.is_connected = True
+        self.error = error
+        self.drop = drop
+        self.written = []
+
+    async def start_notify(self, characteristic, callback):
+        pass
+
+    async def write_gatt_char(self, characteristic, data, response=False):
+        if self.error:
+            self.is_connected = not self.drop
+            raise BleakError("Write failed")
+        self.written.append(bytes(data))
+
+
+def test_write_that_loses_the_link_raises_connection_error():
+    async def main():
+        manager = ConnectionManager(lambda *args: None)
+        manager.session("AA").client = FlakyClient("AA")
+        with pytest.raises(ConnectionError):
+            await manager.write("AA", b"SYNC\n")
+
+    asyncio.run(main())
+
+
+def test_other_write_errors_pass_through():
+    async def main():
+        manager = ConnectionManager(lambda *args: None)
+        manager.session("AA").client = FlakyClient("AA", drop=False)
+        with pytest.raises(BleakError):
+            await manager.write("AA", b"SYNC\n")
+
+    asyncio.run(main())
+
+
+def test_command_survives_a_drop_mid_write():
+    async def main():
+        manager = ConnectionManager(lambda *args: None)
+        session = manager.session("AA")
+        session.client = FlakyClient("AA")
+        await manager.start_notify(session)
+        sent = manager.send("AA", b"SYNC\n", kind="sync")
+        await asyncio.sleep(0.01)
+        assert not sent.done()
+        # The reconnect writes the command that was cut off
+        session.client = FlakyClient("AA", error=False)
+        await manager.start_notify(session)
+        await asyncio.wait_for(sent, 1)
+        return session.client.written
+
+    assert asyncio.run(main()) == [b"SYNC\n"]
@@ -0,0 +1,153 @@
+import asyncio
+import socket
+
+import fleet
+from fleet import FleetClient, FleetServer, FleetStore
+
+ADDRESS = "5A:11:00:00:00:00"
+
+
+def sips(count, start=0):
+    return [(1.7e9 + seq, ADDRESS, 100, seq, seq * 1000) for seq in range(start, start + count)]
+
+
+async def start_server(tmp_path, port=0, commit_window=fleet.COMMIT_WINDOW):
+    server = FleetServer(FleetStore(str(tmp_path / "fleet.db")), port=port, commit_window=commit_window)
+    await server.start()
+    return server
+
+
+async def raw_request(port, head):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(head)
+    await writer.drain()
+    status = (await reader.readline()).split()[1]
+    writer.close()
+    return int(status)
+
+
+def test_pushed_sips_reach_the_server_once(tmp_path):
+    async def main():
+        server = await start_server(tmp_path)
+        client = FleetClient(f"127.0.0.1:{server.port}", "desk-1", batch_size=100)
+        try:
+            client.push(sips(450))
+            assert await client.flush()
+            # The same sips again under new batch ids are known by their origin
+            client.push(sips(50))
+            assert await client.flush()
+            return server.store.count(), client.stats(), server.stats()
+        finally:
+            client.close()
+            await server.close()
+
+    count, client_stats, server_stats = asyncio.run(main())
+    assert count == 450
+    assert client_stats["sent"] == 500 and client_stats["buffered"] == 0
+    # Six batches over the pooled keep-alive connections
+    assert client_stats["connections_opened"] <= fleet.POOL_SIZE
+    assert server_stats["requests"] == 6
+
+
+def test_retried_batch_is_stored_once(tmp_path):
+    async def main():
+        server = await start_server(tmp_path)
+        client = FleetClient(f"127.0.0.1:{server.port}", "desk-1")
+        try:
+            events = [[ts, address, amount] for ts, address, amount, *_ in sips(3)]
+            first = await client.post_events("batch-1", events)
+            again = await client.post_events("batch-1", events)
+            return first, again, server.store.count()
+        finally:
+            client.close()
+            await server.close()
+
+    assert asyncio.run(main()) == (3, 0, 3)
+
+
+def test_malformed_batch_is_rejected_alone(tmp_path):
+    async def main():
+        server = await start_server(tmp_path, commit_window=0.05)
+        good = FleetClient(f"127.0.0.1:{server.port}", "desk-1")
+        bad = FleetClient(f"127.0.0.1:{server.port}", "desk-2")
+        try:
+            good.push(sips(5))
+            bad.push(sips(5))
+            bad.buffer.append((1.7e9, ADDRESS, "a lot", None, None))
+            results = await asyncio.gather(good.flush(), bad.flush())
+            return results, server.store.count(), bad.stats()
+        finally:
+            good.close()
+            bad.close()
+            await server.close()
+
+    results, count, bad_stats = asyncio.run(main())
+    # Not worth retrying: the batch is dropped rather than sent again
+    assert results == [True, True]
+    assert count == 5
+    assert bad_stats["dropped"] == 6 and bad_stats["failures"] == 1
+
+
+def test_batches_arriving_together_share_a_commit(tmp_path):
+    async def main():
+        server = await start_server(tmp_path, commit_window=0.1)
+        clients = [FleetClient(f"127.0.0.1:{server.port}", f"desk-{index}") for index in range(8)]
+        try:
+            for client in clients:
+                client.push(sips(10))
+            assert all(await asyncio.gather(*(client.flush() for client in clients)))
+            return server.stats(), server.store.count()
+        finally:
+            for client in clients:
+                client.close()
+            await server.close()
+
+    stats, count = asyncio.run(main())
+    assert count == 80
+    assert stats["events"] == 80
+    assert stats["commits"] < 8
+
+
+def test_client_retries_until_the_server_is_up(tmp_path):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    async def main():
+        client = FleetClient(f"127.0.0.1:{port}", "desk-1")
+        client.push(sips(20))
+        assert not await client.flush()
+        assert client.stats()["buffered"] == 20
+        server = await start_server(tmp_path, port)
+        try:
+            assert await client.flush()
+            # The server drops the idle keep-alive connection; the next request reconnects
+            for writer in list(server.connections):
+                writer.close()
+            await asyncio.sleep(0.05)
+            client.push(sips(5, start=20))
+            assert await client.flush()
+            return server.store.count(), client.stats()
+        finally:
+            client.close()
+            await server.close()
+
+    count, stats = asyncio.run(main())
+    assert count == 25
+    assert stats["sent"] == 25 and stats["failures"] == 1
+    assert stats["connections_opened"] == 2
+
+
+def test_content_length_errors(tmp_path):
+    async def main():
+        server = await start_server(tmp_path)
+        try:
+            head = "POST /events HTTP/1.1\r\nHost: fleet\r\nContent-Length: {}\r\n\r\n"
+            return [
+                await raw_request(server.port, head.format(length).encode())
+                for length in ("abc", "-5", fleet.MAX_BODY + 1)
+            ]
+        finally:
+            await server.close()
+
+    assert asyncio.run(main()) == [400, 400, 413]
@@ -0,0 +1,111 @@
+import asyncio
+import socket
+
+import pytest
+
+import ipc
+from ipc import IpcServer, RemoteMatService
+from mat_service import MatService
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "smartmat.sock")
+    monkeypatch.setattr(ipc, "socket_path", lambda: path)
+    return path
+
+
+def test_stale_socket_is_replaced(tmp_path, socket_path):
+    open(socket_path, "w").close()
+
+    async def main():
+        service = MatService(str(tmp_path))
+        server = IpcServer(service)
+        try:
+            await server.start()
+            remote = await RemoteMatService.attach()
+            remote.close()
+        finally:
+            await server.close()
+            await service.shutdown()
+
+    asyncio.run(main())
+
+
+def test_second_service_leaves_a_live_one_alone(tmp_path, socket_path):
+    async def main():
+        service = MatService(str(tmp_path))
+        server = IpcServer(service)
+        await server.start()
+        try:
+            with pytest.raises(RuntimeError):
+                await IpcServer(service).start()
+            remote = await RemoteMatService.attach()
+            remote.close()
+        finally:
+            await server.close()
+            await service.shutdown()
+
+    asyncio.run(main())
+
+
+def test_bad_lines_and_failing_listeners_do_not_end_the_stream(tmp_path, socket_path):
+    async def serve(reader, writer):
+        writer.write(ipc.encode({"type": "state", "total": 0}))
+        writer.write(b"{not json\n" + b"[1, 2]\n")
+        writer.write(ipc.encode({"type": "status", "text": "first"}))
+        writer.write(ipc.encode({"type": "status", "text": "second"}))
+        await writer.drain()
+        await reader.read()
+
+    async def main():
+        server = await asyncio.start_unix_server(serve, socket_path)
+        remote = await RemoteMatService.attach()
+        received = []
+
+        def broken(event):
+            raise RuntimeError("slot bug")
+
+        remote.subscribe(broken)
+        remote.subscribe(lambda event: received.append(event["text"]))
+        for _ in range(50):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        alive = not remote.read_task.done()
+        remote.close()
+        server.close()
+        await server.wait_closed()
+        return received, alive
+
+    received, alive = asyncio.run(main())
+    assert received == ["first", "second"]
+    assert alive
+
+
+def test_client_that_stops_reading_is_dropped(tmp_path, socket_path, monkeypatch):
+    monkeypatch.setattr(ipc, "WRITE_LIMIT", 64 * 1024)
+
+    async def main():
+        service = MatService(str(tmp_path))
+        server = IpcServer(service)
+        await server.start()
+        try:
+            # Attaches and never reads
+            client = socket.socket(socket.AF_UNIX)
+            client.connect(socket_path)
+            for _ in range(50):
+                if server.writers:
+                    break
+                await asyncio.sleep(0.01)
+            for index in range(2000):
+                service.status(f"status {index} " + "x" * 1000)
+                await asyncio.sleep(0)
+            dropped = not server.writers
+            client.close()
+            return dropped
+        finally:
+            await server.close()
+            await service.shutdown()
+
+    assert asyncio.run(main())
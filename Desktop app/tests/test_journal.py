@@ -0,0 +1,30 @@
+import time
+
+from journal import IntakeJournal
+
+
+def test_append_many_ignores_sips_already_journaled(tmp_path):
+    journal = IntakeJournal(str(tmp_path / "intake.db"))
+    now = time.time()
+    events = [(now, "AA", 100, 1, 1000), (now + 1, "AA", 50, 2, 2000)]
+    try:
+        assert journal.append_many(events) == 2
+        # The same sips replayed from the mat's backlog add nothing
+        assert journal.append_many(events) == 0
+        assert journal.append_many([(now + 2, "AA", 25, 3, 3000), *events]) == 1
+        assert journal.total_for_day() == 175
+        # Without an origin every event counts
+        assert journal.append_many([(now, "AA", 10), (now, "AA", 10)]) == 2
+        assert journal.totals_by_address() == {"AA": 195}
+    finally:
+        journal.close()
+
+
+def test_same_origin_on_another_mat_is_a_different_sip(tmp_path):
+    journal = IntakeJournal(str(tmp_path / "intake.db"))
+    now = time.time()
+    try:
+        assert journal.append_many([(now, "AA", 100, 1, 1000), (now, "BB", 100, 1, 1000)]) == 2
+        assert journal.known_origins("AA", [(1, 1000), (2, 2000)]) == {(1, 1000)}
+    finally:
+        journal.close()
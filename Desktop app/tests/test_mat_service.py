@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+
+from mat_service import MatService
+from protocol import encode_frame, FRAME_SIP, FRAME_BACKLOG
+
+ADDRESS = "5A:11:00:00:00:00"
+
+
+def backlog(*sips, clock):
+    # The firmware's answer to SYNC: each buffered sip, then the end frame
+    frames = b"".join(encode_frame(FRAME_BACKLOG, seq, seq * 1000, [amount]) for seq, amount in sips)
+    return frames + encode_frame(FRAME_BACKLOG, clock, clock * 1000, [])
+
+
+def test_backlog_skips_sips_already_received(tmp_path):
+    async def main():
+        service = MatService(str(tmp_path))
+        service.manager.session(ADDRESS)
+        push = service.ingest.push
+        try:
+            now = time.time()
+            push(ADDRESS, encode_frame(FRAME_SIP, 1, 1000, [100]), now)
+            await asyncio.sleep(0)
+            service.ingest.flush()
+            # Seq 2 arrives live but is not journaled yet when the backlog replays it
+            push(ADDRESS, encode_frame(FRAME_SIP, 2, 2000, [50]) + backlog((1, 100), (2, 50), (3, 25), clock=4), now + 3)
+            await asyncio.sleep(0)
+            service.ingest.flush()
+            await service.wait_persisted()
+            return service.journal.events(address=ADDRESS), service.current_water_intake, service.acked[ADDRESS]
+        finally:
+            await service.shutdown()
+
+    events, total, acked = asyncio.run(main())
+    assert sorted(amount for _, _, amount in events) == [25, 50, 100]
+    assert total == 175
+    assert acked == 3
+
+
+def test_batches_commit_off_the_loop_in_order(tmp_path):
+    async def main():
+        service = MatService(str(tmp_path))
+        service.manager.session(ADDRESS)
+        commits = []
+        append_many = service.journal.append_many
+
+        def spy(events):
+            commits.append((threading.current_thread().name, [amount for _, _, amount, *_ in events]))
+            time.sleep(0.01)  # A slow disk: the next batches queue up behind this one
+            append_many(events)
+
+        service.journal.append_many = spy
+        try:
+            now = time.time()
+            for seq in range(1, 6):
+                service.ingest.push(ADDRESS, encode_frame(FRAME_SIP, seq, seq * 1000, [seq * 10]), now + seq)
+                await asyncio.sleep(0)
+                service.ingest.flush()
+            # The loop moved on while the writer still had batches queued
+            assert service.writes
+            await service.wait_persisted()
+            return commits, service.journal.events(address=ADDRESS)
+        finally:
+            await service.shutdown()
+
+    commits, events = asyncio.run(main())
+    assert all(name.startswith("journal-writer") for name, _ in commits)
+    assert [amount for _, amounts in commits for amount in amounts] == [10, 20, 30, 40, 50]
+    assert [amount for _, _, amount in events] == [10, 20, 30, 40, 50]
+
+
+def test_live_sips_leave_the_backlog_acknowledgement_alone(tmp_path):
+    async def main():
+        service = MatService(str(tmp_path))
+        service.manager.session(ADDRESS)
+        push = service.ingest.push
+        try:
+            now = time.time()
+            push(ADDRESS, backlog((1, 100), clock=2), now)
+            await asyncio.sleep(0)
+            service.ingest.flush()
+            # Seq 3 arrives live while seq 2 is still only in the mat's buffer
+            push(ADDRESS, encode_frame(FRAME_SIP, 3, 3000, [50]), now + 3)
+            await asyncio.sleep(0)
+            service.ingest.flush()
+            await service.wait_persisted()
+            return service.acked[ADDRESS], service.settings.get("acked")
+        finally:
+            await service.shutdown()
+
+    acked, saved = asyncio.run(main())
+    # The next SYNC still asks for everything after seq 1
+    assert acked == 1
+    assert saved == {ADDRESS: 1}
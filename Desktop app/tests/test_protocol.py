@@ -0,0 +1,72 @@
+from protocol import FrameParser, Text, encode_frame, FRAME_SIP, FRAME_BACKLOG
+
+
+def sip(seq, amount, mat_time=None):
+    return encode_frame(FRAME_SIP, seq, seq * 1000 if mat_time is None else mat_time, [amount])
+
+
+def amounts(items):
+    return [item.readings[0] for item in items]
+
+
+def test_frame_split_across_notifications():
+    parser = FrameParser()
+    frame = sip(1, 120)
+    assert parser.feed(frame[:3]) == []
+    assert parser.feed(frame[3:7]) == []
+    assert amounts(parser.feed(frame[7:])) == [120]
+    assert parser.stats()["errors"] == 0
+
+
+def test_several_frames_in_one_notification():
+    parser = FrameParser()
+    assert amounts(parser.feed(sip(1, 10) + sip(2, 20) + sip(3, 30))) == [10, 20, 30]
+
+
+def test_resync_after_noise_and_a_bad_crc():
+    parser = FrameParser()
+    bad = bytearray(sip(2, 20))
+    bad[-1] ^= 0xFF
+    items = parser.feed(sip(1, 10) + b"\x00\x01" + bytes(bad) + sip(3, 30))
+    assert amounts(items) == [10, 30]
+    # The noise, the failed CRC and the rest of the bad frame skipped as noise
+    assert parser.stats()["errors"] == 3
+    assert parser.stats()["gaps"] == 1
+
+
+def test_corrupted_count_does_not_hold_back_later_frames():
+    parser = FrameParser()
+    bad = bytearray(sip(1, 10))
+    bad[3] = 200  # Claims 200 readings, far past the end of what arrived
+    assert amounts(parser.feed(bytes(bad) + sip(2, 20))) == [20]
+    assert parser.stats()["errors"] >= 1
+
+
+def test_duplicate_frame_is_dropped():
+    parser = FrameParser()
+    parser.feed(sip(1, 10))
+    assert parser.feed(sip(1, 10)) == []
+    assert parser.stats()["duplicates"] == 1
+
+
+def test_backlog_frames_bypass_the_live_window():
+    parser = FrameParser()
+    parser.feed(sip(5, 10))
+    items = parser.feed(encode_frame(FRAME_BACKLOG, 5, 5000, [10]) + encode_frame(FRAME_BACKLOG, 6, 6000, []))
+    assert [(item.type, item.seq, item.readings) for item in items] == [(FRAME_BACKLOG, 5, (10,)), (FRAME_BACKLOG, 6, ())]
+
+
+def test_legacy_digits_and_text():
+    parser = FrameParser()
+    assert amounts(parser.feed(b"150")) == [150]
+    assert parser.feed(b"hello") == [Text("hello")]
+
+
+def test_legacy_packet_behind_a_partial_frame():
+    parser = FrameParser()
+    frame = encode_frame(FRAME_SIP, 1, 1000, [100])
+    assert parser.feed(frame[:7]) == []
+    assert amounts(parser.feed(b"150")) == [150]
+    # The partial frame was left as it was and completes with its next part
+    assert amounts(parser.feed(frame[7:])) == [100]
+    assert parser.errors == 0
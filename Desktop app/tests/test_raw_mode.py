@@ -0,0 +1,74 @@
+import asyncio
+
+import simulator
+
+simulator.install()
+
+import mat_service
+from mat_service import MatService
+
+ADDRESS = simulator.mat_address(0)
+
+
+def run_with_mat(data_dir, scenario, **profile):
+    # A raw-mode service connected to one simulated mat that takes no sips of its own
+    simulator.MATS.clear()
+    mat = simulator.add_mat(ADDRESS, profile=simulator.MatProfile(rate=0.001, **profile))
+
+    async def main():
+        service = MatService(str(data_dir))
+        service.settings.update(stream_raw=True)
+        try:
+            assert await service.connect(ADDRESS)
+            await asyncio.sleep(0.05)
+            assert mat.raw
+            return await scenario(service, mat)
+        finally:
+            await service.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_disconnect_returns_mat_to_sip_mode(tmp_path):
+    async def scenario(service, mat):
+        await service.disconnect(ADDRESS)
+        assert mat.commands[-1] == "MODE SIP"
+        assert not mat.raw
+        # Taken while nobody listens, buffered, and caught up on the next connect
+        mat.drink_offline(3)
+        offline = list(mat.backlog)[-3:]
+        assert await service.connect(ADDRESS)
+        await asyncio.sleep(0.1)
+        return offline, list(mat.backlog), service.journal.events(address=ADDRESS)
+
+    offline, backlog, events = run_with_mat(tmp_path, scenario)
+    assert set(offline) <= set(backlog)
+    # Every sip the mat sent or buffered is journaled once
+    assert sorted(amount for _, _, amount in events) == sorted(amount for _, _, amount in backlog)
+
+
+def test_shutdown_returns_mat_to_sip_mode(tmp_path):
+    async def scenario(service, mat):
+        return mat
+
+    mat = run_with_mat(tmp_path, scenario)
+    assert mat.commands[-1] == "MODE SIP"
+    assert not mat.raw
+    buffered = len(mat.backlog)
+    mat.drink_offline(2)
+    assert len(mat.backlog) == buffered + 2 and mat.lost == 0
+
+
+def test_mat_leaves_raw_mode_when_host_goes_quiet(tmp_path, monkeypatch):
+    monkeypatch.setattr(mat_service, "RAW_KEEPALIVE", 0.05)
+
+    async def scenario(service, mat):
+        mat.host_timeout = 0.2
+        await asyncio.sleep(0.5)
+        # The keepalive held raw mode past the timeout
+        assert mat.raw
+        service.tasks.cancel("keepalive")
+        await asyncio.sleep(0.5)
+        return mat.raw
+
+    assert not run_with_mat(tmp_path, scenario)
@@ -0,0 +1,32 @@
+import asyncio
+
+import simulator
+
+simulator.install()
+
+from mat_service import MatService
+
+PRESENT = simulator.mat_address(0)
+ABSENT = simulator.mat_address(1)
+
+
+def test_saved_mat_out_of_range_is_connected_once_it_appears(tmp_path):
+    simulator.MATS.clear()
+    simulator.add_mat(PRESENT, profile=simulator.MatProfile(rate=0.001))
+
+    async def main():
+        service = MatService(str(tmp_path))
+        service.settings.update(address=PRESENT, devices=[PRESENT, ABSENT])
+        try:
+            assert await service.connect_saved()
+            assert service.reconnector.metrics()["pending"] == [ABSENT]
+            simulator.add_mat(ABSENT, profile=simulator.MatProfile(rate=0.001))
+            for _ in range(50):
+                if service.manager.get(ABSENT).is_connected:
+                    break
+                await asyncio.sleep(0.05)
+            return sorted(session.address for session in service.manager.connected())
+        finally:
+            await service.shutdown()
+
+    assert asyncio.run(main()) == [PRESENT, ABSENT]
@@ -0,0 +1,129 @@
+from scheduler import HydrationReminders, ReminderScheduler
+from test_scheduler import FakeClock, FakeTimer, advance
+
+DURATION = 60
+
+
+class Window:
+    # What MainWindow does with the callbacks: remember what it was told
+    def __init__(self):
+        self.clock = FakeClock()
+        self.scheduler = ReminderScheduler(self.clock, FakeTimer)
+        self.expired = []
+        self.shown = []
+        self.reminders = HydrationReminders(self.scheduler, self.expired.append, self.shown.append, DURATION)
+
+    def advance(self, seconds):
+        advance(self.scheduler, self.clock, seconds)
+
+
+def test_one_reminder_per_connected_mat():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA", "BB"], DURATION, preferred="BB")
+    assert sorted(reminders.addresses()) == ["AA", "BB"]
+    assert reminders.displayed == "BB"
+    assert window.shown[-1] == DURATION
+
+
+def test_without_a_mat_the_timer_runs_on_its_own():
+    window = Window()
+    reminders = window.reminders
+    reminders.start([], 30)
+    assert reminders.addresses() == [None]
+    window.advance(10)
+    # The first mat to connect takes over what was left
+    reminders.connected("AA")
+    assert reminders.addresses() == ["AA"]
+    assert reminders.displayed == "AA"
+    assert reminders.remaining("AA") == 20
+
+
+def test_sip_restarts_only_its_own_mat():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA", "BB"], DURATION)
+    window.advance(40)
+    reminders.sipped({"AA"})
+    assert reminders.remaining("AA") == DURATION
+    assert reminders.remaining("BB") == 20
+
+
+def test_mat_firing_leaves_the_others_running():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA", "BB"], DURATION, preferred="AA")
+    window.advance(30)
+    reminders.sipped({"BB"})
+    window.advance(31)
+    assert window.expired == ["AA"]
+    assert reminders.running
+    assert reminders.addresses() == ["BB"]
+    assert reminders.remaining("BB") == 29
+    # The screen moved on to the mat still counting
+    assert reminders.displayed == "BB"
+    window.advance(29)
+    assert window.expired == ["AA", "BB"]
+    assert not reminders.running
+
+
+def test_pause_and_resume_keep_each_mat_where_it_was():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA", "BB"], DURATION, preferred="AA")
+    window.advance(20)
+    reminders.sipped({"BB"})
+    window.advance(10)
+    assert reminders.pause() == 30
+    assert reminders.addresses() == [] and not reminders.running
+    window.advance(600)
+    assert window.expired == []
+    # A mat connected while paused starts with what the screen showed
+    reminders.start(["AA", "BB", "CC"], 30)
+    assert (reminders.remaining("AA"), reminders.remaining("BB"), reminders.remaining("CC")) == (30, 50, 30)
+
+
+def test_sips_are_ignored_while_paused():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA"], DURATION)
+    reminders.pause()
+    reminders.sipped({"AA"})
+    assert reminders.addresses() == []
+
+
+def test_disconnected_mat_stops_reminding():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA", "BB"], DURATION, preferred="AA")
+    window.advance(10)
+    reminders.sipped({"BB"})
+    reminders.disconnected("AA")
+    assert reminders.addresses() == ["BB"]
+    assert reminders.displayed == "BB"
+    window.advance(DURATION)
+    assert window.expired == ["BB"]
+
+
+def test_last_mat_disconnecting_keeps_the_timer():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA"], DURATION)
+    window.advance(15)
+    reminders.disconnected("AA")
+    assert reminders.addresses() == [None]
+    assert reminders.remaining(None) == 45
+    window.advance(45)
+    assert window.expired == [None]
+    assert not reminders.running
+
+
+def test_reconnected_mat_gets_a_fresh_countdown():
+    window = Window()
+    reminders = window.reminders
+    reminders.start(["AA", "BB"], DURATION)
+    window.advance(10)
+    reminders.disconnected("BB")
+    reminders.connected("BB")
+    assert reminders.remaining("BB") == DURATION
+    assert reminders.remaining("AA") == 50
@@ -0,0 +1,95 @@
+from scheduler import ReminderScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTimer:
+    # Stands in for the single-shot QTimer: remembers when it was armed for
+    def __init__(self, callback):
+        self.callback = callback
+        self.interval = None
+
+    def start(self, ms):
+        self.interval = ms
+
+    def stop(self):
+        self.interval = None
+
+
+def make_scheduler():
+    clock = FakeClock()
+    scheduler = ReminderScheduler(clock, FakeTimer)
+    return scheduler, clock
+
+
+def advance(scheduler, clock, seconds):
+    # Runs the clock forward, firing the timer each time it comes due on the way
+    end = clock.now + seconds
+    while scheduler.timer.interval is not None and clock.now + scheduler.timer.interval / 1000 <= end:
+        clock.now += scheduler.timer.interval / 1000
+        scheduler.fire()
+    clock.now = end
+
+
+def test_timer_is_armed_for_the_earliest_reminder():
+    scheduler, clock = make_scheduler()
+    scheduler.schedule("late", 30, lambda: None)
+    assert scheduler.timer.interval == 30000
+    scheduler.schedule("early", 5, lambda: None)
+    assert scheduler.timer.interval == 5000
+    scheduler.cancel("early")
+    assert scheduler.timer.interval == 30000
+    scheduler.cancel("late")
+    assert scheduler.timer.interval is None
+
+
+def test_reminders_fire_in_deadline_order():
+    scheduler, clock = make_scheduler()
+    fired = []
+    for key, delay in (("b", 20), ("a", 10), ("c", 30)):
+        scheduler.schedule(key, delay, lambda key=key: fired.append((key, clock.now - 1000)))
+    advance(scheduler, clock, 25)
+    assert fired == [("a", 10), ("b", 20)]
+    assert scheduler.is_scheduled("c") and not scheduler.is_scheduled("a")
+    assert scheduler.remaining("c") == 5
+
+
+def test_rescheduling_replaces_the_old_deadline():
+    scheduler, clock = make_scheduler()
+    fired = []
+    scheduler.schedule("sip", 10, lambda: fired.append(clock.now - 1000))
+    advance(scheduler, clock, 8)
+    scheduler.schedule("sip", 10, lambda: fired.append(clock.now - 1000))
+    advance(scheduler, clock, 30)
+    # The stale heap entry at 10 s is skipped
+    assert fired == [18]
+
+
+def test_repeating_reminder_keeps_its_cadence():
+    scheduler, clock = make_scheduler()
+    fired = []
+    scheduler.schedule("tick", 10, lambda: fired.append(clock.now - 1000), repeat=10)
+    advance(scheduler, clock, 35)
+    assert fired == [10, 20, 30]
+    assert scheduler.remaining("tick") == 5
+
+
+def test_countdown_ticks_only_when_its_second_changes():
+    scheduler, clock = make_scheduler()
+    shown = []
+    scheduler.schedule("hydration", 3.5, lambda: None)
+    scheduler.show_countdown("hydration", shown.append)
+    assert shown == [4]
+    advance(scheduler, clock, 2)
+    assert shown == [4, 3, 2]
+    # Hidden, the countdown costs no wake-ups until the reminder itself
+    scheduler.set_display_active(False)
+    assert scheduler.timer.interval == 1500
+    scheduler.set_display_active(True)
+    assert shown[-1] == 2
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import settings_store
+from settings_store import SettingsStore
+
+
+def counting_writes(store):
+    writes = []
+    write = store.write
+
+    def spy(text):
+        writes.append(json.loads(text))
+        write(text)
+
+    store.write = spy
+    return writes
+
+
+def test_burst_of_changes_is_flushed_once(tmp_path):
+    path = str(tmp_path / "data.json")
+
+    async def main():
+        store = SettingsStore(path, flush_delay=0.05)
+        writes = counting_writes(store)
+        for amount in range(100):
+            store.update(current_water_intake=amount, daily_goal=2000)
+            store.update(current_water_intake=amount)  # Unchanged: not a change at all
+        store.pop("missing")
+        await asyncio.sleep(0.2)
+        store.close()
+        return writes
+
+    writes = asyncio.run(main())
+    assert writes == [{"current_water_intake": 99, "daily_goal": 2000}]
+    reloaded = SettingsStore(path)
+    assert reloaded.get("current_water_intake") == 99 and reloaded.get("daily_goal") == 2000
+    reloaded.close()
+
+
+def test_close_writes_what_is_still_pending(tmp_path):
+    path = str(tmp_path / "data.json")
+
+    async def main():
+        store = SettingsStore(path, flush_delay=60)
+        store.update(daily_goal=1500)
+        store.close()
+
+    asyncio.run(main())
+    with open(path) as file:
+        assert json.load(file) == {"daily_goal": 1500}
+
+
+def test_flush_is_synced_and_renamed_into_place(tmp_path, monkeypatch):
+    path = str(tmp_path / "data.json")
+    calls = []
+    fsync, replace = os.fsync, os.replace
+    monkeypatch.setattr(settings_store.os, "fsync", lambda fd: calls.append(("fsync", os.fstat(fd).st_ino)) or fsync(fd))
+    monkeypatch.setattr(settings_store.os, "replace", lambda src, dst: calls.append(("replace", src, dst)) or replace(src, dst))
+    store = SettingsStore(path)
+    store.update(daily_goal=1800)
+    store.close()
+    # The data reaches the disk before the rename, and the rename before anything else
+    # The temp file was renamed, so it now has the settings file's inode
+    assert calls == [
+        ("fsync", os.stat(path).st_ino),
+        ("replace", path + ".tmp", path),
+        ("fsync", os.stat(tmp_path).st_ino),
+    ]
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_failed_flush_keeps_the_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "data.json")
+    store = SettingsStore(path)
+    store.update(daily_goal=1800)
+    store.flush()
+
+    def full_disk(fd):
+        raise OSError(28, "No space left on device")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(settings_store.os, "fsync", full_disk)
+        # Without an event loop the change is flushed straight away
+        with pytest.raises(OSError):
+            store.update(daily_goal=2500)
+    with open(path) as file:
+        assert json.load(file) == {"daily_goal": 1800}
+    # Still pending, so the next flush writes it
+    store.close()
+    with open(path) as file:
+        assert json.load(file) == {"daily_goal": 2500}
@@ -0,0 +1,84 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import simulator
+from sip_detection import (
+    SipDetector, median_stage, ema_stage, stability_stage, DRINK, EMA_ALPHA, MEDIAN_WIDTH, STABLE_SAMPLES,
+    STABLE_TOLERANCE, SAMPLE_RATE,
+)
+
+
+def trace(seed, seconds=300):
+    # Raw grams as the mat sends them, and the amount of each sip taken
+    mat = simulator.SimulatedMat("AA", profile=simulator.MatProfile(rate=0.2, seed=seed))
+    samples = list(itertools.islice(mat.weight_signal(), int(seconds * SAMPLE_RATE)))
+    values = np.array([round(grams) for grams, _ in samples], dtype=np.float64)
+    return values, [sip for _, sip in samples if sip]
+
+
+def run(detector, values, chunk):
+    times = np.arange(values.size) / SAMPLE_RATE
+    events = []
+    for start in range(0, values.size, chunk):
+        events += detector.feed(times[start:start + chunk], values[start:start + chunk])
+    return events
+
+
+def through(stage, values, chunk):
+    # A stage's output for values sent in chunks, joined back together
+    times = np.arange(values.size, dtype=np.float64)
+    outputs = [stage.send((times[start:start + chunk], values[start:start + chunk])) for start in range(0, values.size, chunk)]
+    return [np.concatenate(parts) for parts in zip(*outputs)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_every_simulated_sip_is_found(seed):
+    values, sips = trace(seed)
+    events = run(SipDetector(), values, simulator.SAMPLES_PER_FRAME)
+    drinks = [event.grams for event in events if event.kind == DRINK]
+    assert len(sips) > 10
+    assert len(drinks) == len(sips)
+    # The settled weight is read off a window that may still spread by the tolerance
+    assert np.all(np.abs(np.array(drinks) - np.array(sips)) <= STABLE_TOLERANCE)
+
+
+def test_chunk_size_does_not_change_the_events():
+    values, _ = trace(7, seconds=120)
+    expected = run(SipDetector(), values, simulator.SAMPLES_PER_FRAME)
+    for chunk in (1, 37, 500, values.size):
+        events = run(SipDetector(), values, chunk)
+        assert [(event.time, event.kind) for event in events] == [(event.time, event.kind) for event in expected]
+        assert np.allclose([event.grams for event in events], [event.grams for event in expected])
+
+
+def test_median_stage_is_a_sliding_median():
+    values, _ = trace(1, seconds=30)
+    _, medians = through(median_stage(), values, 13)
+    # The window starts out filled with the first sample
+    padded = np.concatenate([np.full(MEDIAN_WIDTH - 1, values[0]), values])
+    expected = [np.median(padded[index:index + MEDIAN_WIDTH]) for index in range(values.size)]
+    assert np.array_equal(medians, expected)
+
+
+def test_ema_stage_matches_a_reference_loop():
+    values, _ = trace(2, seconds=30)
+    # Chunks longer than one closed-form block and chunks shorter than one
+    for chunk in (5, 200, values.size):
+        _, smoothed = through(ema_stage(), values, chunk)
+        expected, previous = [], values[0]
+        for value in values:
+            previous = EMA_ALPHA * value + (1 - EMA_ALPHA) * previous
+            expected.append(previous)
+        assert np.allclose(smoothed, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_stability_stage_checks_the_spread_of_each_window():
+    values, _ = trace(3, seconds=30)
+    _, _, stable = through(stability_stage(), values, 11)
+    expected = [
+        index >= STABLE_SAMPLES - 1 and np.ptp(values[index - STABLE_SAMPLES + 1:index + 1]) <= STABLE_TOLERANCE
+        for index in range(values.size)
+    ]
+    assert stable.tolist() == expected
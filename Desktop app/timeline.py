@@ -0,0 +1,378 @@
+import time
+from collections import Counter
+import numpy as np
+from PySide6.QtCore import Qt, QPointF, QLineF, QRect
+from PySide6.QtGui import QColor, QPainter, QPen, QPixmap, QPolygonF
+from PySide6.QtWidgets import QWidget
+from analytics import local_hours, DAY_HOURS
+
+DAY = 86400
+MIN_SPAN = 10 * 60  # Narrowest view in seconds
+MAX_SPAN = 400 * DAY
+ZOOM_STEP = 1.25  # Span factor per wheel notch
+STEM_BAND = 0.3  # Share of the plot height used for per-sip stems
+BACKGROUND = QColor("#ffffff")
+GRID = QColor("#e3e3ef")
+TEXT = QColor("#2d2d77")
+RUNNING = QColor("#2d2d77")
+GOAL = QColor("#3bb273")
+REMINDER = QColor("#e05d5d")
+MAT_COLORS = [QColor(color) for color in ("#3a7bd5", "#e0793b", "#9b59b6", "#d4b13a", "#16a5a5")]
+TICK_STEPS = (600, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, DAY, 2 * DAY, 7 * DAY, 14 * DAY, 30 * DAY, 91 * DAY)
+
+
+def local_days(timestamps):
+    return local_hours(timestamps) // DAY_HOURS
+
+
+class TimelineData:
+    # Every sip shown on the chart, sorted by time, with the running total of each
+    # local day derived once per change instead of on every draw. The arrays grow by
+    # doubling like a list; times, amounts, mats, days and running are views of the
+    # filled part. A sip later than the last one only extends the running total;
+    # a backlog sip in the past re-sorts and recomputes from where it lands.
+
+    def __init__(self):
+        self.count = 0
+        self.buffers = {
+            "times": np.empty(256, dtype=np.float64),
+            "amounts": np.empty(256, dtype=np.int64),
+            "mats": np.empty(256, dtype=np.int64),  # Index into addresses
+            "days": np.empty(256, dtype=np.int64),
+            "running": np.empty(256, dtype=np.int64),
+        }
+        self.addresses = []
+        self.update_views()
+
+    def update_views(self):
+        for name, buffer in self.buffers.items():
+            setattr(self, name, buffer[:self.count])
+
+    def mat_index(self, address):
+        address = address or ""
+        if address not in self.addresses:
+            self.addresses.append(address)
+        return self.addresses.index(address)
+
+    def extend(self, events):
+        # events: (ts, address, amount); returns the earliest new timestamp or None
+        events = list(events)
+        if not events:
+            return None
+        times = np.fromiter((event[0] for event in events), dtype=np.float64, count=len(events))
+        new = {
+            "times": times,
+            "amounts": np.fromiter((event[2] for event in events), dtype=np.int64, count=len(events)),
+            "mats": np.fromiter((self.mat_index(event[1]) for event in events), dtype=np.int64, count=len(events)),
+            "days": local_days(times),
+        }
+        earliest = float(times.min())
+        # Everything from here on is new or moved; before it nothing changes
+        first = int(np.searchsorted(self.times, earliest, side="right"))
+        end = self.count + times.size
+        if end > self.buffers["times"].size:
+            size = max(end, self.buffers["times"].size * 2)
+            for name, buffer in self.buffers.items():
+                grown = np.empty(size, dtype=buffer.dtype)
+                grown[:self.count] = buffer[:self.count]
+                self.buffers[name] = grown
+        for name, values in new.items():
+            self.buffers[name][self.count:end] = values
+        self.count = end
+        self.update_views()
+        if first < self.count - times.size or np.any(np.diff(times) < 0):
+            # Backlog sips can land in the past
+            order = np.argsort(self.times[first:], kind="stable")
+            for name in new:
+                tail = getattr(self, name)[first:]
+                tail[:] = tail[order]
+        self.update_running(first)
+        return earliest
+
+    def update_running(self, first=0):
+        # Running totals from index first on, carrying on from the sip before it
+        days, amounts = self.days[first:], self.amounts[first:]
+        if not days.size:
+            return
+        if first:
+            carry_day, carry = self.days[first - 1], self.running[first - 1]
+        else:
+            carry_day, carry = days[0] - 1, 0
+        totals = np.cumsum(amounts)
+        starts = np.flatnonzero(np.diff(days, prepend=carry_day))
+        head = starts[0] if starts.size else days.size
+        running = self.running[first:]
+        running[:head] = totals[:head] + carry
+        before_day = totals[starts] - amounts[starts]
+        lengths = np.diff(np.append(starts, days.size))
+        running[head:] = totals[head:] - np.repeat(before_day, lengths)
+
+    def running_at(self, moments):
+        # Intake so far that local day at each moment
+        index = np.searchsorted(self.times, moments, side="right")
+        previous = np.maximum(index - 1, 0)
+        if not self.times.size:
+            return np.zeros(len(moments), dtype=np.int64)
+        same_day = (index > 0) & (self.days[previous] == local_days(moments))
+        return np.where(same_day, self.running[previous], 0)
+
+
+class IntakeTimeline(QWidget):
+    # Intake over time: a step line of each day's running total, a stem per sip
+    # coloured by mat, the daily goal and reminder markers. Data is drawn into a
+    # cached pixmap one pixel column at a time from per-column aggregates, so the
+    # cost of a redraw follows the widget width, not the number of sips. Panning
+    # scrolls the pixmap and draws only the exposed strip; a new sip redraws from
+    # its column rightwards.
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.data = TimelineData()
+        self.live = []  # Sips added before the history arrives, merged into it
+        self.reminders = []
+        self.goal = 0
+        self.view_end = time.time()
+        self.span = DAY
+        self.following = True  # Keep "now" at the right edge as sips arrive
+        self.y_max = 1
+        self.stem_max = 1
+        self.pixmap = None
+        self.drag_x = None
+        self.setMinimumHeight(160)
+        self.setMouseTracking(False)
+
+    # Data
+
+    def set_events(self, events):
+        # The journal history. Sips that arrived while it was read are kept, unless
+        # they were committed in time to be part of it.
+        events = [tuple(event) for event in events]
+        missing = Counter(tuple(event) for event in self.live or []) - Counter(events)
+        self.live = None
+        self.data = TimelineData()
+        self.data.extend(events + list(missing.elements()))
+        self.invalidate()
+
+    def add_sips(self, events):
+        if self.live is not None:
+            self.live.extend(events)
+        earliest = self.data.extend(events)
+        if earliest is None:
+            return
+        if self.update_scale():
+            self.invalidate()
+            return
+        if self.following and self.data.times[-1] > self.view_end:
+            # Scroll just far enough to bring the newest sip into view
+            self.pan_pixels(-int(np.ceil((self.data.times[-1] - self.view_end) / self.seconds_per_pixel())))
+            self.following = True
+        # The running total changes from the new sip's column to the end of the view
+        self.redraw_columns(max(0, self.column(earliest)), self.width())
+
+    def add_reminder(self, ts):
+        self.reminders.append(ts)
+        self.update()
+
+    def set_goal(self, goal):
+        if goal != self.goal:
+            self.goal = goal
+            self.invalidate()
+
+    # Geometry
+
+    @property
+    def view_start(self):
+        return self.view_end - self.span
+
+    def seconds_per_pixel(self):
+        return self.span / max(1, self.width())
+
+    def column(self, ts):
+        return int((ts - self.view_start) / self.seconds_per_pixel())
+
+    def x_for(self, ts):
+        return (ts - self.view_start) / self.seconds_per_pixel()
+
+    def y_for(self, value):
+        return self.height() - 1 - value / self.y_max * (self.height() - 20)
+
+    def update_scale(self):
+        # Scales cover all the data so panning never changes them
+        y_max = max(self.goal, int(self.data.running.max()) if self.data.running.size else 0) * 1.1 or 1
+        stem_max = max(250, int(self.data.amounts.max()) if self.data.amounts.size else 0)
+        changed = y_max > self.y_max * 1.001 or y_max < self.y_max / 1.5 or stem_max != self.stem_max
+        if changed:
+            self.y_max, self.stem_max = y_max, stem_max
+        return changed
+
+    # View changes
+
+    def show_range(self, span):
+        self.span = min(MAX_SPAN, max(MIN_SPAN, span))
+        self.view_end = time.time()
+        self.following = True
+        self.invalidate()
+
+    def pan_pixels(self, dx):
+        # Positive dx moves the view back in time; whole pixels keep columns aligned
+        if not dx:
+            return
+        self.view_end -= dx * self.seconds_per_pixel()
+        self.following = self.view_end >= time.time()
+        if self.pixmap is None or abs(dx) >= self.width():
+            self.invalidate()
+            return
+        scrolled = QPixmap(self.pixmap.size())
+        scrolled.setDevicePixelRatio(self.pixmap.devicePixelRatio())
+        scrolled.fill(BACKGROUND)
+        painter = QPainter(scrolled)
+        painter.drawPixmap(dx, 0, self.pixmap)
+        painter.end()
+        self.pixmap = scrolled
+        if dx > 0:
+            self.render_columns(0, dx)
+        else:
+            self.render_columns(self.width() + dx, self.width())
+        self.update()
+
+    def zoom(self, factor, anchor_x):
+        anchor = self.view_start + anchor_x * self.seconds_per_pixel()
+        span = min(MAX_SPAN, max(MIN_SPAN, self.span * factor))
+        fraction = anchor_x / max(1, self.width())
+        self.view_end = anchor + span * (1 - fraction)
+        self.span = span
+        self.following = self.view_end >= time.time()
+        self.invalidate()
+
+    def invalidate(self):
+        self.update_scale()
+        self.pixmap = None
+        self.update()
+
+    def redraw_columns(self, first, last):
+        if self.pixmap is None:
+            self.update()
+            return
+        self.render_columns(first, last)
+        self.update(QRect(first, 0, last - first, self.height()))
+
+    # Drawing
+
+    def ensure_pixmap(self):
+        ratio = self.devicePixelRatioF()
+        if self.pixmap is None or self.pixmap.width() != int(self.width() * ratio) or self.pixmap.height() != int(self.height() * ratio):
+            self.pixmap = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+            self.pixmap.setDevicePixelRatio(ratio)
+            self.render_columns(0, self.width())
+        return self.pixmap
+
+    def render_columns(self, first, last):
+        # Draws columns first..last-1 of the data layer into the cached pixmap
+        first, last = max(0, first), min(self.width(), last)
+        if first >= last or self.pixmap is None:
+            return
+        painter = QPainter(self.pixmap)
+        painter.setClipRect(QRect(first, 0, last - first, self.height()))
+        painter.fillRect(QRect(first, 0, last - first, self.height()), BACKGROUND)
+        painter.setRenderHint(QPainter.Antialiasing)
+        self.draw_stems(painter, first, last)
+        self.draw_running(painter, first, last)
+        painter.end()
+
+    def draw_stems(self, painter, first, last):
+        # Max bucketing per pixel column and mat: one line per column however many sips
+        per_pixel = self.seconds_per_pixel()
+        start, end = self.view_start + first * per_pixel, self.view_start + last * per_pixel
+        lo, hi = np.searchsorted(self.data.times, [start, end])
+        if lo >= hi:
+            return
+        columns = ((self.data.times[lo:hi] - self.view_start) / per_pixel).astype(np.int64)
+        amounts = self.data.amounts[lo:hi]
+        mats = self.data.mats[lo:hi]
+        band = (self.height() - 20) * STEM_BAND
+        bottom = self.height() - 1
+        for mat in np.unique(mats):
+            selected = mats == mat
+            mat_columns, mat_amounts = columns[selected], amounts[selected]
+            starts = np.flatnonzero(np.diff(mat_columns, prepend=-1))
+            peaks = np.maximum.reduceat(mat_amounts, starts)
+            xs = mat_columns[starts] + 0.5
+            tops = bottom - peaks / self.stem_max * band
+            painter.setPen(QPen(MAT_COLORS[int(mat) % len(MAT_COLORS)], 1))
+            painter.drawLines([QLineF(x, bottom, x, top) for x, top in zip(xs.tolist(), tops.tolist())])
+
+    def draw_running(self, painter, first, last):
+        # The running total at the right edge of each column, from one column earlier
+        # so the line joins the strip drawn before it
+        per_pixel = self.seconds_per_pixel()
+        now = time.time()
+        columns = np.arange(max(0, first - 1), last)
+        moments = self.view_start + (columns + 1) * per_pixel
+        shown = moments <= now + per_pixel
+        if not shown.any():
+            return
+        columns, moments = columns[shown], np.minimum(moments[shown], now)
+        values = self.data.running_at(moments)
+        ys = self.height() - 1 - values / self.y_max * (self.height() - 20)
+        painter.setPen(QPen(RUNNING, 2))
+        painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip((columns + 1).tolist(), ys.tolist())]))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.ensure_pixmap())
+        self.draw_overlay(painter)
+        painter.end()
+
+    def draw_overlay(self, painter):
+        # Grid, labels, goal and reminders are few and cheap, so they are drawn fresh
+        # over the cached data layer and never need scrolling
+        per_pixel = self.seconds_per_pixel()
+        step = next((step for step in TICK_STEPS if step / per_pixel >= 80), TICK_STEPS[-1])
+        offset = time.localtime(self.view_start).tm_gmtoff
+        tick = (self.view_start + offset) // step * step - offset
+        label_format = "%H:%M" if step < DAY else "%d.%m"
+        painter.setPen(QPen(GRID, 1))
+        font_metrics = painter.fontMetrics()
+        while tick <= self.view_end:
+            x = self.x_for(tick)
+            if x >= 0:
+                painter.setPen(QPen(GRID, 1))
+                painter.drawLine(QLineF(x, 0, x, self.height()))
+                painter.setPen(TEXT)
+                painter.drawText(QPointF(x + 3, font_metrics.ascent() + 2), time.strftime(label_format, time.localtime(tick)))
+            tick += step
+        if self.goal:
+            y = self.y_for(self.goal)
+            painter.setPen(QPen(GOAL, 1, Qt.DashLine))
+            painter.drawLine(QLineF(0, y, self.width(), y))
+        painter.setPen(QPen(REMINDER, 1, Qt.DotLine))
+        for ts in self.reminders:
+            if self.view_start <= ts <= self.view_end:
+                x = self.x_for(ts)
+                painter.drawLine(QLineF(x, 0, x, self.height()))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.pixmap = None
+
+    # Input
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.drag_x = event.position().x()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_x is None:
+            return
+        dx = int(event.position().x() - self.drag_x)
+        if dx:
+            self.drag_x += dx
+            self.pan_pixels(dx)
+
+    def mouseReleaseEvent(self, event):
+        self.drag_x = None
+
+    def wheelEvent(self, event):
+        notches = event.angleDelta().y() / 120
+        if notches:
+            self.zoom(ZOOM_STEP ** -notches, event.position().x())